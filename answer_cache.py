@@ -0,0 +1,194 @@
+# answer_cache.py
+
+"""
+Semantic answer cache in front of Gemini generation.
+
+Answers are keyed by the query embedding: a new question whose cosine distance
+to a cached question is within max_distance gets the stored answer and sources
+without calling the model. Entries expire after a TTL, the least recently used
+entries are evicted past max_entries, and everything is persisted to a small
+SQLite file so the cache survives restarts.
+
+The cache is tied to the collection it was filled from. embed_and_store stamps
+each rebuilt collection with a 'built_at' metadata value; when the stamp passed
+in here differs from the stored one, the cache is cleared. With a
+version_source, the stamp is re-read at most every version_check_s seconds
+on get() and put(), so a rebuild while the app is running clears it too.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# --- Configuration ---
+MAX_DISTANCE = 0.08          # cosine distance within which two questions share an answer
+TTL_SECONDS = 24 * 60 * 60   # answers older than a day are regenerated
+MAX_ENTRIES = 1000
+VERSION_CHECK_S = 5.0        # how often version_source is re-read
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """Thread-safe, SQLite-backed nearest-neighbour cache of generated answers."""
+
+    def __init__(self, path: str, collection_version=None, max_distance: float = MAX_DISTANCE,
+                 ttl_seconds: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES,
+                 version_source=None, version_check_s: float = VERSION_CHECK_S):
+        self.path = path
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, query TEXT, embedding BLOB, answer TEXT, "
+            "sources TEXT, created REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+        # Called with no arguments, returns the collection's current 'built_at'
+        self.version_source = version_source
+        self.version_check_s = version_check_s
+        self._version = str(collection_version)
+        self._version_checked = time.monotonic()
+        stored = self._conn.execute("SELECT value FROM meta WHERE key = 'collection_version'").fetchone()
+        if stored is None or stored[0] != self._version:
+            self.clear(self._version)
+        self._load()
+
+    def _load(self):
+        """Reads all live entries into an in-memory matrix for fast lookups."""
+        self._purge_expired()
+        rows = self._conn.execute("SELECT id, embedding, last_used, created FROM answers").fetchall()
+        self._ids = [row[0] for row in rows]
+        self._last_used = {row[0]: row[2] for row in rows}
+        self._created = {row[0]: row[3] for row in rows}
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = None
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        self._conn.execute("DELETE FROM answers WHERE created < ?", (cutoff,))
+        self._conn.commit()
+
+    def clear(self, collection_version=None):
+        """Drops every cached answer, e.g. after the collection was rebuilt."""
+        with self._lock:
+            self._clear(collection_version)
+
+    def _clear(self, collection_version=None):
+        """clear() for callers that hold the lock."""
+        self._conn.execute("DELETE FROM answers")
+        if collection_version is not None:
+            self._version = str(collection_version)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('collection_version', ?)",
+                (self._version,)
+            )
+        self._conn.commit()
+        self._ids, self._last_used, self._created, self._matrix = [], {}, {}, None
+
+    def _check_version(self):
+        """Clears the cache when version_source reports a new build. Caller holds the lock."""
+        if self.version_source is None or time.monotonic() - self._version_checked < self.version_check_s:
+            return
+        self._version_checked = time.monotonic()
+        try:
+            current = self.version_source()
+        except Exception:
+            # Collection unreadable mid-rebuild; check again next time
+            return
+        if current is not None and str(current) != self._version:
+            self._clear(current)
+
+    def _drop_expired(self):
+        """Removes entries older than the TTL. Caller holds the lock."""
+        cutoff = time.time() - self.ttl_seconds
+        expired = [i for i, entry_id in enumerate(self._ids) if self._created[entry_id] < cutoff]
+        for position in reversed(expired):
+            self._remove(position)
+        if expired:
+            self._conn.commit()
+
+    def get(self, query_embedding):
+        """Returns (answer, sources) for the nearest cached question, or None on a miss."""
+        query = _normalize(query_embedding)
+        with self._lock:
+            self._check_version()
+            # Expired entries go first, so the nearest live one within reach can still hit
+            self._drop_expired()
+            if self._matrix is None:
+                self.misses += 1
+                return None
+
+            distances = 1.0 - self._matrix @ query
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                self.misses += 1
+                return None
+
+            entry_id = self._ids[best]
+            row = self._conn.execute(
+                "SELECT answer, sources FROM answers WHERE id = ?", (entry_id,)
+            ).fetchone()
+            if row is None:
+                # Deleted by another process sharing the file
+                self._remove(best)
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            now = time.time()
+            self._last_used[entry_id] = now
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, entry_id))
+            self._conn.commit()
+            self.hits += 1
+            return row[0], json.loads(row[1])
+
+    def put(self, query_text: str, query_embedding, answer: str, sources):
+        """Stores a freshly generated answer and evicts the least recently used past max_entries."""
+        vector = _normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            cursor = self._conn.execute(
+                "INSERT INTO answers (query, embedding, answer, sources, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (query_text, vector.tobytes(), answer, json.dumps(list(sources)), now, now)
+            )
+            self._ids.append(cursor.lastrowid)
+            self._last_used[cursor.lastrowid] = now
+            self._created[cursor.lastrowid] = now
+            row = vector[np.newaxis, :]
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+
+            while len(self._ids) > self.max_entries:
+                oldest = min(range(len(self._ids)), key=lambda i: self._last_used[self._ids[i]])
+                self._remove(oldest)
+            self._conn.commit()
+
+    def _remove(self, position: int):
+        """Deletes the entry at a matrix row. Caller holds the lock."""
+        entry_id = self._ids.pop(position)
+        self._last_used.pop(entry_id, None)
+        self._created.pop(entry_id, None)
+        self._conn.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+        self._matrix = np.delete(self._matrix, position, axis=0) if self._ids else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._ids), "hits": self.hits, "misses": self.misses}
@@ -1,106 +1,359 @@
+import time
+_SCRIPT_STARTED = time.perf_counter()
+
 import streamlit as st
-import chromadb
-from google import genai
+import importlib
+import itertools
 import os
 
+from answer_cache import SemanticAnswerCache
+from coalescing import SingleFlight, make_key
+from embedding_backends import check_encoder, create_encoder
+from embedding_cache import with_cache
+from context_packer import TOKEN_BUDGET, pack_context
+from generation import USE_FAKE_LLM, GenerationTimer, create_client, stream_generate
+from generation_scheduler import GenerationScheduler, QueueFullError, QueueStatus, is_rate_limit_error
+from hnsw_params import search_ef_warning
+from ivf_pq import IVFPQCollection
+from lexical_index import BM25Index, hybrid_query
+from query_cache import QueryEmbeddingCache
+from reranker import CrossEncoderReranker
+from retrieval_filters import build_where, parse_article_ids
+from tracing import NULL_TRACE, RequestTrace, Tracer
+from vector_engine import BruteForceCollection, stored_built_at
+from warmup import BackgroundWarmup, hnsw_index_files, prefault
+
+# Chroma, the embedding runtime and the Gemini SDK are imported on first use,
+# so this covers only the light modules above
+IMPORTS_S = time.perf_counter() - _SCRIPT_STARTED
+
 # --- 1. Configuration (Synced with rag_system.py & query_db.py) ---
 MODEL_NAME = 'all-MiniLM-L6-v2' 
 # Using absolute paths ensures Streamlit Cloud finds the folder
 ABS_PATH = os.path.dirname(os.path.abspath(__file__))
 CHROMA_PATH = os.path.join(ABS_PATH, 'chroma_db_serene_ease')
+VECTOR_STORE_PATH = os.path.join(ABS_PATH, 'vector_store_serene_ease')
+IVFPQ_PATH = os.path.join(ABS_PATH, 'ivfpq_index_serene_ease')
+LEXICAL_INDEX_PATH = os.path.join(ABS_PATH, 'lexical_index_serene_ease')
+
+# Retrieval backend: "chroma" (HNSW), "numpy" (exact brute force, see vector_engine.py)
+# or "ivfpq" (compressed approximate search for very large corpora, see ivf_pq.py)
+RETRIEVAL_BACKEND = os.getenv("SERENE_EASE_BACKEND", "chroma")
+IVFPQ_NPROBE = 8 # coarse lists scanned per query by the ivfpq backend; higher = better recall, slower
+
+# Hybrid search fuses BM25 with vector results (see lexical_index.py) when the index exists
+USE_HYBRID_SEARCH = True
+
+# Optional cross-encoder reranking (see reranker.py): over-fetch candidates, keep the best 3
+USE_RERANKER = False
+RERANK_CANDIDATES = 12
+RERANK_LATENCY_BUDGET_MS = 250
+
+# Token-budgeted context packing (see context_packer.py) instead of a fixed top-3
+CONTEXT_TOKEN_BUDGET = TOKEN_BUDGET # about three full chunks
+PACK_CANDIDATES = 8
+
+# Source scoping, pushed down into the search as a 'where' clause (see retrieval_filters.py)
+TRUSTED_SOURCES = ['nimh.nih.gov', 'nhs.uk', 'cdc.gov', 'mentalhealth.gov', 'samhsa.gov', 'mayoclinic.org']
+SOURCE_DENYLIST = []
 
 # This must match your backend files exactly
 COLLECTION_NAME = f"mental_health_chunks_{MODEL_NAME.split('-')[0]}"
 N_RESULTS = 2 
+# Query encoder (see embedding_backends.py); must match the model and variant embed_data.py indexed with
+EMBEDDING_BACKEND = 'onnx'
+# Persistent embedding cache shared with embed_data.py (see embedding_cache.py),
+# behind the in-memory query cache
+USE_EMBEDDING_CACHE = True
+EMBEDDING_CACHE_PATH = os.path.join(ABS_PATH, 'embedding_cache')
+HNSW_SEARCH_EF = None # Expected search_ef, checked against the index (see hnsw_params.py); None skips the check
 GEMINI_MODEL = "gemini-2.0-flash" # Use 2.0-flash for stability
 
+# Client-side quota for GEMINI_MODEL (see generation_scheduler.py): requests beyond it
+# wait in a bounded queue instead of failing with 429
+GEMINI_REQUESTS_PER_MINUTE = 15
+GEMINI_TOKENS_PER_MINUTE = 1_000_000
+GENERATION_QUEUE_SIZE = 50
+EXPECTED_ANSWER_TOKENS = 500
+
+# Semantic answer cache (see answer_cache.py)
+ANSWER_CACHE_PATH = os.path.join(ABS_PATH, 'answer_cache.sqlite3')
+ANSWER_CACHE_MAX_DISTANCE = 0.08 # Cosine distance within which a cached answer is reused
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Per-stage latency tracing (see tracing.py): one JSONL record per question and
+# rolling p50/p95 in the sidebar. Off by default; set SERENE_EASE_TRACE=1
+TRACE_ENABLED = os.getenv("SERENE_EASE_TRACE") == "1"
+TRACE_PATH = os.path.join(ABS_PATH, 'traces.jsonl')
+
+# Cold start (see warmup.py): after the page has painted, a background thread
+# imports the Gemini SDK, reads the HNSW files into the page cache and loads the
+# embedding model and index, so the first question does not wait for them
+BACKGROUND_WARMUP = True
+PREFAULT_INDEX = True
+
 # --- 2. Backend Initialization ---
 
+@st.cache_resource
+def get_startup_trace():
+    """Start-up phase timings for this process (imports, first paint, warm-up steps)."""
+    return RequestTrace(kind="startup")
+
 @st.cache_resource
 def get_rag_components():
-    """Initializes ChromaDB and Gemini client with Cloud-safe paths."""
+    """Initializes ChromaDB with Cloud-safe paths."""
     
     # Check for API Key in Streamlit Secrets
     api_key = st.secrets.get("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
-    if not api_key:
+    if not api_key and not USE_FAKE_LLM:
         st.error("Missing GEMINI_API_KEY. Please add it to Secrets.")
-        return None, None
+        return None, None, None
 
     # Sidebar Diagnostics (Helps us verify the push worked)
     st.sidebar.subheader("System Status")
-    if os.path.exists(CHROMA_PATH):
+    # Only the selected backend's files are shipped; the numpy and ivfpq stores need no Chroma directory
+    knowledge_base = {"numpy": VECTOR_STORE_PATH, "ivfpq": IVFPQ_PATH}.get(RETRIEVAL_BACKEND, CHROMA_PATH)
+    if os.path.exists(knowledge_base):
         st.sidebar.success("Knowledge Base Found")
-        st.sidebar.write(f"Files: {os.listdir(CHROMA_PATH)}")
     else:
         st.sidebar.error("Knowledge Base Missing")
-        st.sidebar.info("Run 'git add -f chroma_db_serene_ease/chroma.sqlite3' locally.")
+        st.sidebar.info(f"Run 'git add -f {os.path.basename(knowledge_base)}' locally.")
 
+    startup = get_startup_trace()
     try:
-        # Connect to the existing DB
-        chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
-        
-        # Verify collection exists
-        existing_cols = [c.name for c in chroma_client.list_collections()]
-        if COLLECTION_NAME not in existing_cols:
-            st.sidebar.warning(f"Collection '{COLLECTION_NAME}' not found. Available: {existing_cols}")
-            # Fallback to the first available if possible
-            if existing_cols:
-                target = existing_cols[0]
+        # The query cache must encode with the model the collection was built
+        # with (checked below). The model itself loads on first use (see get_warmup).
+        embedding_function = create_encoder(EMBEDDING_BACKEND, MODEL_NAME)
+        if USE_EMBEDDING_CACHE:
+            embedding_function = with_cache(embedding_function, EMBEDDING_CACHE_PATH)
+
+        with startup.span("open_collection"):
+            if RETRIEVAL_BACKEND == "numpy":
+                collection = BruteForceCollection(VECTOR_STORE_PATH, embedding_function)
+                target = collection.name
+                read_built_at = lambda: stored_built_at(VECTOR_STORE_PATH)
+            elif RETRIEVAL_BACKEND == "ivfpq":
+                collection = IVFPQCollection(IVFPQ_PATH, embedding_function, nprobe=IVFPQ_NPROBE)
+                target = collection.name
+                read_built_at = lambda: stored_built_at(IVFPQ_PATH)
             else:
-                return None, None
-        else:
-            target = COLLECTION_NAME
+                with startup.span("import_chroma"):
+                    import chromadb
 
-        collection = chroma_client.get_collection(name=target)
-        gemini_client = genai.Client(api_key=api_key)
-        
-        st.sidebar.write(f"Active Collection: `{target}`")
-        return collection, gemini_client
+                # Connect to the existing DB
+                chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+
+                try:
+                    target = COLLECTION_NAME
+                    collection = chroma_client.get_collection(name=target, embedding_function=embedding_function)
+                except Exception:
+                    # Only list collections when the configured one is missing
+                    existing_cols = [c.name for c in chroma_client.list_collections()]
+                    st.sidebar.warning(f"Collection '{COLLECTION_NAME}' not found. Available: {existing_cols}")
+                    # Fallback to the first available if possible
+                    if not existing_cols:
+                        return None, None, None
+                    target = existing_cols[0]
+                    collection = chroma_client.get_collection(name=target, embedding_function=embedding_function)
+                if (warning := search_ef_warning(collection, HNSW_SEARCH_EF)):
+                    st.sidebar.warning(warning)
+                read_built_at = lambda: (chroma_client.get_collection(name=target).metadata or {}).get("built_at")
+            check_encoder(collection.metadata, embedding_function)
+
+        # Shared by every Streamlit session through st.cache_resource
+        query_cache = QueryEmbeddingCache(embedding_function)
+
+        # Cleared automatically when embed_and_store rebuilds the collection,
+        # including while the app is running (built_at is re-read every few seconds)
+        answer_cache = SemanticAnswerCache(
+            ANSWER_CACHE_PATH,
+            collection_version=(collection.metadata or {}).get("built_at"),
+            version_source=read_built_at,
+            max_distance=ANSWER_CACHE_MAX_DISTANCE,
+            ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+        )
+
+        st.sidebar.write(f"Active Collection: `{target}` ({RETRIEVAL_BACKEND} backend)")
+        return collection, query_cache, answer_cache
 
     except Exception as e:
         st.sidebar.error(f"Init Error: {e}")
-        return None, None
+        return None, None, None
+
+@st.cache_resource
+def get_gemini_client():
+    """Created on the first question; by then the warm-up has usually imported the SDK."""
+    # SERENE_EASE_FAKE_LLM=1 swaps in an offline streaming stub (see generation.py)
+    api_key = st.secrets.get("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
+    return create_client(api_key)
+
+@st.cache_resource
+def get_warmup(_collection, _query_cache):
+    """
+    Starts the background warm-up once per process. The first embedding call
+    loads the ONNX model and the first query loads the HNSW graph into memory;
+    both happen here instead of inside the user's first question.
+    """
+    def warm_index():
+        # Straight to the encoder, past the disk cache, so the model itself loads
+        encoder = getattr(_query_cache.embedding_function, "encoder", _query_cache.embedding_function)
+        embedding = encoder(["warm up"])[0]
+        _collection.query(query_embeddings=[list(embedding)], n_results=1, include=[])
+
+    steps = []
+    if not USE_FAKE_LLM:
+        steps.append(("import_genai", lambda: importlib.import_module("google.genai")))
+    if PREFAULT_INDEX and RETRIEVAL_BACKEND == "chroma":
+        steps.append(("prefault_index", lambda: prefault(hnsw_index_files(CHROMA_PATH))))
+    steps.append(("warm_index", warm_index))
+    return BackgroundWarmup(get_startup_trace(), steps).start()
+
+@st.cache_resource
+def get_lexical_index():
+    """Loads the BM25 index once per process; None disables hybrid search."""
+    if not USE_HYBRID_SEARCH:
+        return None
+    return BM25Index.load(LEXICAL_INDEX_PATH)
+
+@st.cache_resource
+def get_reranker():
+    """Loads the cross-encoder once per process; None disables reranking."""
+    if not USE_RERANKER:
+        return None
+    reranker = CrossEncoderReranker(latency_budget_ms=RERANK_LATENCY_BUDGET_MS)
+    reranker.warm_up()
+    return reranker
+
+@st.cache_resource
+def get_single_flight():
+    """Coalesces identical in-flight questions across all sessions."""
+    return SingleFlight()
+
+@st.cache_resource
+def get_generation_scheduler():
+    """One RPM/TPM budget and admission queue shared by all sessions."""
+    return GenerationScheduler(GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE, GENERATION_QUEUE_SIZE)
+
+@st.cache_resource
+def get_tracer():
+    """One tracer (and rolling latency window) for all sessions."""
+    return Tracer(TRACE_PATH, enabled=TRACE_ENABLED)
 
 # --- 3. RAG Logic (Synced with rag_system.py) ---
 
-def run_rag_query(user_query, collection, gemini_client):
-    """Performs the full RAG process with error handling for rate limits."""
+def answer_footer(sources) -> str:
+    """Closing block of every answer, fresh or cached: the sources it was grounded in."""
+    footer = "\n\n---\n"
+    if sources:
+        # '[source]: url' is escaped so Markdown does not read it as a link definition
+        lines = [f"- \\{source}" for source in dict.fromkeys(sources)]
+        footer += "**Sources:**\n" + "\n".join(lines) + "\n\n"
+    return footer + "*Grounded in your custom knowledge base.*"
+
+def stream_rag_query(user_query, collection, gemini_client, query_cache=None, answer_cache=None,
+                     lexical_index=None, where=None, reranker=None, timings=None, scheduler=None,
+                     trace=NULL_TRACE):
+    """
+    Performs the full RAG process with error handling for rate limits, yielding
+    the answer as Gemini streams it. Time-to-first-token and total generation
+    time are written into the timings dict when one is passed.
+
+    With a scheduler, QueueStatus objects are yielded before the answer while
+    the request waits for its turn under the Gemini quota. Stage timings go
+    into trace (see tracing.py).
+    """
+    timer = GenerationTimer()
+    trace.annotate(coalesced=False)
     try:
+        n_candidates = max(PACK_CANDIDATES, RERANK_CANDIDATES if reranker is not None else 0)
+
+        # 0. SEMANTIC ANSWER CACHE (answers are cached for the unfiltered corpus only)
+        with trace.span("embed"):
+            query_embedding = query_cache.get(user_query) if query_cache is not None else None
+        use_answer_cache = answer_cache is not None and query_embedding is not None and where is None
+        if use_answer_cache:
+            cached = answer_cache.get(query_embedding)
+            trace.annotate(answer_cache_hit=cached is not None)
+            if cached is not None:
+                answer_text, sources = cached
+                yield answer_text + answer_footer(sources)
+                return
+
         # 1. RETRIEVAL
-        results = collection.query(
-            query_texts=[user_query],
-            n_results=3,
-            include=['documents', 'metadatas']
-        )
-        
+        with trace.span("search"):
+            if lexical_index is not None:
+                results = hybrid_query(collection, lexical_index, user_query, n_candidates, query_embedding, where=where)
+            else:
+                if query_embedding is not None:
+                    query_args = dict(query_embeddings=[query_embedding])
+                else:
+                    query_args = dict(query_texts=[user_query])
+                results = collection.query(
+                    **query_args,
+                    n_results=n_candidates,
+                    include=['documents', 'metadatas'],
+                    where=where
+                )
+        if reranker is not None:
+            # Reorder only; the token budget decides how many chunks are kept
+            with trace.span("rerank"):
+                results = reranker.rerank(user_query, results, n_candidates)
+
+        with trace.span("pack"):
+            packed = pack_context(results, CONTEXT_TOKEN_BUDGET)
+        trace.annotate(chunks=packed['chunks_used'], context_tokens=packed['tokens'])
         context_snippets = []
-        for i in range(len(results['documents'][0])):
-            doc = results['documents'][0][i]
-            source = results['metadatas'][0][i].get('source', 'Unknown')
-            context_snippets.append(f"Source {i+1} ({source}): {doc}")
-            
+        sources = []
+        for i, snippet in enumerate(packed['snippets']):
+            context_snippets.append(f"Source {i+1} ({snippet['source']}): {snippet['text']}")
+            sources.append(f"[{snippet['source']}]: {snippet['url']}")
+
         context_text = "\n\n".join(context_snippets)
-        
-        # 2. GENERATION
+
+        # 2. GENERATION (streamed)
         system_instruction = "You are a mental health assistant. Use ONLY the context provided."
         rag_prompt = f"CONTEXT:\n{context_text}\n\nUSER QUESTION:\n{user_query}"
-        
-        response = gemini_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=rag_prompt,
-            config=dict(system_instruction=system_instruction)
-        )
-        
-        return f"{response.text}\n\n---\n*Grounded in your custom knowledge base.*"
+
+        answer_parts = []
+        estimated_tokens = packed['tokens'] + EXPECTED_ANSWER_TOKENS
+        for piece in stream_generate(gemini_client, GEMINI_MODEL, rag_prompt, system_instruction, timer,
+                                     scheduler, estimated_tokens):
+            if not isinstance(piece, QueueStatus):
+                answer_parts.append(piece)
+            yield piece
+
+        if use_answer_cache:
+            answer_cache.put(user_query, query_embedding, "".join(answer_parts), sources)
+
+        yield answer_footer(sources)
 
     except Exception as e:
-        # Check if the error is a Rate Limit (429)
-        if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-            return ("🌿 **Serene Ease is taking a deep breath.**\n\n"
-                    "We've hit the temporary limit for the free AI service. "
-                    "Please wait about 30-60 seconds and try your question again.")
+        # Rate limits that outlasted the scheduler's retries, or a full queue
+        if isinstance(e, QueueFullError):
+            yield ("🌿 **Serene Ease is very busy right now.**\n\n"
+                   "Too many people are waiting for an answer. "
+                   "Please try your question again in a minute.")
+        elif is_rate_limit_error(e):
+            yield ("🌿 **Serene Ease is taking a deep breath.**\n\n"
+                   "We've hit the temporary limit for the free AI service. "
+                   "Please wait about 30-60 seconds and try your question again.")
         else:
-            return f"❌ **An unexpected error occurred:** {e}"
+            yield f"❌ **An unexpected error occurred:** {e}"
+    finally:
+        if timings is not None:
+            timings.update(timer.as_dict())
+        trace.record("queue", timer.queue_wait)
+        trace.record("ttft", timer.ttft)
+        trace.record("generation", timer.total)
+
+def run_rag_query(user_query, collection, gemini_client, query_cache=None, answer_cache=None,
+                  lexical_index=None, where=None, reranker=None):
+    """Non-streaming variant of stream_rag_query that returns the whole answer."""
+    return "".join(piece for piece in stream_rag_query(
+        user_query, collection, gemini_client, query_cache, answer_cache, lexical_index, where, reranker,
+        scheduler=get_generation_scheduler()
+    ) if not isinstance(piece, QueueStatus))
+
 # --- 4. Streamlit UI ---
 
 def main():
@@ -108,8 +361,7 @@ def main():
     st.title("🌿 Serene Ease: Mental Health AI")
     st.caption("Grounded in verified mental health resources.")
 
-    collection, gemini_client = get_rag_components()
-    
+
     if "messages" not in st.session_state:
         st.session_state.messages = []
 
@@ -117,16 +369,105 @@ def main():
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
 
+    # Everything above renders before the knowledge base is opened
+    startup = get_startup_trace()
+    if "first_paint" not in startup.spans:
+        startup.record("imports", IMPORTS_S)
+        startup.record("first_paint", time.perf_counter() - _SCRIPT_STARTED)
+
+    collection, query_cache, answer_cache = get_rag_components()
+    warmup = get_warmup(collection, query_cache) if collection and BACKGROUND_WARMUP else None
+
+    trusted_only = st.sidebar.checkbox("Trusted sources only", help=", ".join(TRUSTED_SOURCES))
+    article_ids, invalid_ids = parse_article_ids(st.sidebar.text_input(
+        "Article scope", placeholder="e.g. 12, 40", help="Only search these article ids (comma-separated)"
+    ))
+    if invalid_ids:
+        st.sidebar.warning(f"Ignoring article ids that are not numbers: {', '.join(invalid_ids)}")
+    where = build_where(TRUSTED_SOURCES if trusted_only else None, SOURCE_DENYLIST, article_ids)
+
     if collection and (user_input := st.chat_input("How can I help you today?")):
         st.session_state.messages.append({"role": "user", "content": user_input})
         with st.chat_message("user"):
             st.markdown(user_input)
 
         with st.chat_message("assistant"):
+            timings = {}
+            tracer = get_tracer()
+            # Followers of a coalesced flight only render; the leader's stages are in its own trace
+            trace = tracer.start(backend=RETRIEVAL_BACKEND, filtered=where is not None, coalesced=True)
+            # st.cache_resource getters need this session's script-run context, so
+            # resolve them here; the flight's worker thread only sees plain objects
+            gemini_client, lexical_index = get_gemini_client(), get_lexical_index()
+            reranker, scheduler = get_reranker(), get_generation_scheduler()
+            # Identical questions already being answered share that answer's stream
+            stream = get_single_flight().stream(
+                make_key(user_input, where=where, backend=RETRIEVAL_BACKEND),
+                lambda: stream_rag_query(
+                    user_input, collection, gemini_client, query_cache, answer_cache, lexical_index,
+                    where, reranker, timings, scheduler, trace
+                )
+            )
+            # The spinner covers retrieval and the wait for the first token;
+            # while the request is queued behind the Gemini quota, show its place in line
+            queue_notice = st.empty()
             with st.spinner("Searching resources..."):
-                answer = run_rag_query(user_input, collection, gemini_client)
-                st.markdown(answer)
-                st.session_state.messages.append({"role": "assistant", "content": answer})
+                first_piece = next(stream, "")
+                while isinstance(first_piece, QueueStatus):
+                    if first_piece.position > 1 or first_piece.wait_s >= 1:
+                        queue_notice.info(
+                            f"🌿 Lots of people are looking for support right now. "
+                            f"You're number {first_piece.position} in line, about {first_piece.wait_s:.0f}s to go."
+                        )
+                    first_piece = next(stream, "")
+            queue_notice.empty()
+            # Render time excludes waiting on the model for the next piece
+            with trace.span("render"):
+                answer = st.write_stream(trace.untimed("render", itertools.chain([first_piece], stream)))
+            st.session_state.messages.append({"role": "assistant", "content": answer})
+            if timings.get("total_s") is not None:
+                st.caption(f"First token in {timings['ttft_s'] or 0:.2f}s · answered in {timings['total_s']:.2f}s")
+            tracer.finish(trace)
+
+    # Rendered last so the counters include the query that just ran
+    if query_cache is not None:
+        stats = query_cache.stats()
+        st.sidebar.caption(
+            f"Query embedding cache: {stats['hits']} hits / {stats['misses']} misses "
+            f"({stats['entries']} entries, {stats['bytes'] / 1024:.0f} KB)"
+        )
+    if query_cache is not None and USE_EMBEDDING_CACHE:
+        stats = query_cache.embedding_function.cache.stats()
+        st.sidebar.caption(
+            f"Embedding cache (disk): {stats['hits']} hits / {stats['misses']} misses "
+            f"({stats['bytes'] / 2**20:.0f} MB)"
+        )
+    if answer_cache is not None:
+        stats = answer_cache.stats()
+        st.sidebar.caption(
+            f"Answer cache: {stats['hits']} hits / {stats['misses']} misses ({stats['entries']} entries)"
+        )
+    stats = get_single_flight().stats()
+    st.sidebar.caption(f"Coalesced requests: {stats['coalesced']} of {stats['requests']} saved")
+    stats = get_generation_scheduler().stats()
+    st.sidebar.caption(
+        f"Generation queue: {stats['queued']} waiting · {stats['retries']} retries · {stats['rejected']} turned away"
+    )
+    if TRACE_ENABLED:
+        summary = get_tracer().summary()
+        if summary:
+            st.sidebar.subheader("Latency (p50 / p95)")
+            st.sidebar.table([
+                {"stage": stage, "p50 (ms)": round(row['p50'] * 1000), "p95 (ms)": round(row['p95'] * 1000)}
+                for stage, row in summary.items()
+            ])
+    with st.sidebar.expander("Startup timing"):
+        if warmup is not None and not warmup.done.is_set():
+            st.caption("Warming up the embedding model and index…")
+        st.table([{"phase": name, "ms": round(seconds * 1000)} for name, seconds in startup.spans.items()])
+        if warmup is not None:
+            for name, error in warmup.errors.items():
+                st.caption(f"{name} failed: {error}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,83 @@
+# async_rag.py
+
+"""
+Asyncio RAG pipeline for serving many concurrent users from one process.
+
+Chroma and the embedding model are blocking, so retrieval runs in a bounded
+thread pool; generation uses the async Gemini client (client.aio), so waiting
+on the model does not hold a thread. One AsyncRAGPipeline shares the warm
+collection, BM25 index, reranker and client across all in-flight queries and
+returns structured result dicts instead of printing.
+
+    pipeline = AsyncRAGPipeline(rag_system.open_collection(), create_client())
+    results = asyncio.run(pipeline.run_many(questions))
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rag_system
+
+# --- Configuration ---
+RETRIEVAL_WORKERS = 8          # threads for blocking Chroma / embedding calls
+MAX_CONCURRENT_GENERATIONS = 32
+
+
+class AsyncRAGPipeline:
+    """Retrieval in a bounded thread pool, generation on the async Gemini client."""
+
+    def __init__(self, collection, gemini_client, lexical_index=None, reranker=None,
+                 retrieval_workers: int = RETRIEVAL_WORKERS,
+                 max_concurrent_generations: int = MAX_CONCURRENT_GENERATIONS):
+        self.collection = collection
+        self.gemini_client = gemini_client
+        self.lexical_index = lexical_index
+        self.reranker = reranker
+        self._executor = ThreadPoolExecutor(max_workers=retrieval_workers, thread_name_prefix="retrieval")
+        self._generation_slots = asyncio.Semaphore(max_concurrent_generations)
+
+    async def retrieve(self, user_query: str, n_results: int = rag_system.N_RESULTS, where=None) -> dict:
+        """Runs rag_system.retrieve_context on the retrieval thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            lambda: rag_system.retrieve_context(
+                self.collection, user_query, n_results, self.lexical_index, where, self.reranker
+            )
+        )
+
+    async def generate(self, user_query: str, context_text: str) -> str:
+        """Calls the async Gemini client, bounded by the generation semaphore."""
+        async with self._generation_slots:
+            response = await self.gemini_client.aio.models.generate_content(
+                model=rag_system.GEMINI_MODEL,
+                contents=rag_system.build_prompt(user_query, context_text),
+                config=dict(system_instruction=rag_system.SYSTEM_INSTRUCTION)
+            )
+            return response.text
+
+    async def run(self, user_query: str, n_results: int = rag_system.N_RESULTS, where=None) -> dict:
+        """Answers one question. Errors are reported in the result instead of raised."""
+        result = {"query": user_query, "answer": None, "sources": [], "n_chunks": 0, "error": None,
+                  "retrieval_s": None, "generation_s": None, "total_s": None}
+        started = time.perf_counter()
+        try:
+            context = await self.retrieve(user_query, n_results, where)
+            retrieved = time.perf_counter()
+            result.update(sources=context['sources'], n_chunks=context['n_chunks'],
+                          retrieval_s=retrieved - started)
+
+            result["answer"] = await self.generate(user_query, context['context_text'])
+            result["generation_s"] = time.perf_counter() - retrieved
+        except Exception as e:
+            result["error"] = str(e)
+        result["total_s"] = time.perf_counter() - started
+        return result
+
+    async def run_many(self, queries, n_results: int = rag_system.N_RESULTS, where=None) -> list:
+        """Answers all questions concurrently; results keep the input order."""
+        return await asyncio.gather(*(self.run(q, n_results, where) for q in queries))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
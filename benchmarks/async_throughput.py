@@ -0,0 +1,83 @@
+# benchmarks/async_throughput.py
+
+"""
+Throughput of the asyncio RAG pipeline at increasing concurrency.
+
+Retrieval runs against the real collection (SERENE_EASE_BACKEND picks the
+backend); generation uses the offline FakeStreamingClient with a fixed
+latency, so the numbers show how well the pipeline overlaps waiting on the
+model rather than Gemini's own speed.
+
+Run from the project root:
+    python benchmarks/async_throughput.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# Shared modules live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rag_system
+from async_rag import AsyncRAGPipeline
+from generation import FakeStreamingClient
+
+# --- Configuration ---
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16, 32, 64]
+QUERIES_PER_LEVEL = 64
+LLM_LATENCY_S = 0.5 # simulated time to first token; the stub then "types" the answer
+
+QUESTIONS = [
+    "What are practical, daily methods for stress management?",
+    "How can I prevent anxiety in daily life?",
+    "What are the signs of depression?",
+    "How does therapy help with mental health?",
+    "What should I do during a panic attack?",
+    "How can I support a friend with bipolar disorder?",
+    "What helps with trouble sleeping because of stress?",
+    "Where can I find a mental health helpline?",
+]
+
+
+async def run_level(pipeline: AsyncRAGPipeline, concurrency: int) -> dict:
+    """Answers QUERIES_PER_LEVEL questions with at most `concurrency` in flight."""
+    slots = asyncio.Semaphore(concurrency)
+    queries = [QUESTIONS[i % len(QUESTIONS)] for i in range(QUERIES_PER_LEVEL)]
+
+    async def bounded(query):
+        async with slots:
+            return await pipeline.run(query)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded(q) for q in queries))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r["total_s"] for r in results)
+    return {
+        "concurrency": concurrency,
+        "qps": len(results) / elapsed,
+        "p50_s": latencies[len(latencies) // 2],
+        "errors": sum(1 for r in results if r["error"]),
+    }
+
+
+async def main():
+    print(f"Loading collection ({rag_system.RETRIEVAL_BACKEND} backend)...")
+    pipeline = AsyncRAGPipeline(
+        rag_system.open_collection(),
+        FakeStreamingClient(first_token_delay=LLM_LATENCY_S, words_per_second=400),
+        lexical_index=rag_system.open_lexical_index(),
+    )
+    # Warm the embedding model so the first level is not charged for loading it
+    await pipeline.run(QUESTIONS[0])
+
+    print(f"\n{'concurrency':>11} {'QPS':>8} {'p50 (s)':>8} {'errors':>7}")
+    for concurrency in CONCURRENCY_LEVELS:
+        row = await run_level(pipeline, concurrency)
+        print(f"{row['concurrency']:>11} {row['qps']:>8.2f} {row['p50_s']:>8.3f} {row['errors']:>7}")
+    pipeline.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+# benchmarks/burst_load.py
+
+"""
+Burst of concurrent generations against a rate-limited stub, with and without
+the client-side GenerationScheduler.
+
+FakeRateLimitedClient answers calls beyond its quota with 429
+RESOURCE_EXHAUSTED, like Gemini's free tier. Without the scheduler part of the
+burst fails outright; with it, requests queue, are paced under the quota and
+all of them are answered. The quota window is shortened so the run takes
+seconds rather than minutes.
+
+Run from the project root:
+    python benchmarks/burst_load.py
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared modules live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from generation import FakeRateLimitedClient, GenerationTimer, stream_generate
+from generation_scheduler import GenerationScheduler, QueueStatus
+
+# --- Configuration ---
+BURST_SIZE = 24
+QUOTA_REQUESTS = 6     # requests allowed per quota window by the stub
+QUOTA_WINDOW_S = 3.0   # stands in for Gemini's 60 s window
+PROMPT = "CONTEXT:\nBreathing exercises help.\n\nUSER QUESTION:\nHow do I calm down?"
+
+
+def one_request(client, scheduler) -> dict:
+    timer = GenerationTimer()
+    positions = []
+    try:
+        for piece in stream_generate(client, "stub", PROMPT, "Be brief.", timer, scheduler):
+            if isinstance(piece, QueueStatus):
+                positions.append(piece.position)
+        return {"ok": True, "ttft_s": timer.ttft, "max_position": max(positions, default=0)}
+    except Exception:
+        return {"ok": False, "ttft_s": None, "max_position": max(positions, default=0)}
+
+
+def run(use_scheduler: bool) -> dict:
+    client = FakeRateLimitedClient(QUOTA_REQUESTS, QUOTA_WINDOW_S, first_token_delay=0.1, words_per_second=2000)
+    scheduler = None
+    if use_scheduler:
+        # Express the stub's quota per minute and keep retries short for the demo
+        scheduler = GenerationScheduler(
+            requests_per_minute=QUOTA_REQUESTS * 60 / QUOTA_WINDOW_S, max_queue=BURST_SIZE,
+            base_delay_s=0.25, max_delay_s=2.0
+        )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=BURST_SIZE) as pool:
+        results = list(pool.map(lambda _: one_request(client, scheduler), range(BURST_SIZE)))
+    elapsed = time.perf_counter() - start
+
+    ttfts = sorted(r["ttft_s"] for r in results if r["ok"])
+    return {
+        "answered": len(ttfts),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "rejected_429": client.rejected,
+        "p50_ttft_s": ttfts[len(ttfts) // 2] if ttfts else None,
+        "max_queue_position": max(r["max_position"] for r in results),
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    print(f"Burst of {BURST_SIZE} requests, stub quota {QUOTA_REQUESTS} per {QUOTA_WINDOW_S:.0f}s\n")
+    print(f"{'scheduler':>9} {'answered':>8} {'failed':>6} {'429s':>5} {'p50 TTFT':>9} {'max pos':>7} {'elapsed':>8}")
+    for use_scheduler in (False, True):
+        row = run(use_scheduler)
+        p50 = f"{row['p50_ttft_s']:.2f}s" if row['p50_ttft_s'] is not None else "-"
+        print(f"{'on' if use_scheduler else 'off':>9} {row['answered']:>8} {row['failed']:>6} {row['rejected_429']:>5} "
+              f"{p50:>9} {row['max_queue_position']:>7} {row['elapsed_s']:>7.1f}s")
+
+
+if __name__ == "__main__":
+    main()
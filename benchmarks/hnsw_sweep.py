@@ -0,0 +1,207 @@
+# benchmarks/hnsw_sweep.py
+
+"""
+Recall-versus-latency sweep over Chroma's HNSW parameters.
+
+Exact ground truth comes from a brute-force NumPy search over the same
+vectors. For every (construction_ef, M) pair a throwaway collection is built,
+and each search_ef is then measured on it:
+
+    recall@k        share of the exact top k the index returns
+    build_s         time to add all vectors
+    index_mb        size of the collection on disk
+    p50_ms / p99_ms single-query latency
+
+The cheapest setting (lowest p50) that meets --target-recall is reported;
+copy it into hnsw_params.py (or embed_data.py) and rebuild.
+
+Vectors come from the exported brute-force store (embed_data.py writes it) or,
+since the real corpus is small, from a seeded synthetic clustered set.
+
+Run from the project root:
+    python benchmarks/hnsw_sweep.py --synthetic 50000
+    python benchmarks/hnsw_sweep.py --vector-store vector_store_serene_ease --output sweep.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Shared modules live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hnsw_params import hnsw_metadata, set_search_ef
+from vector_engine import EMBEDDINGS_FILE, normalize_rows
+
+# --- Configuration ---
+CONSTRUCTION_EFS = [64, 100, 200]
+MS = [8, 16, 32]
+SEARCH_EFS = [10, 20, 50, 100]
+K = 10
+N_QUERIES = 500
+TARGET_RECALL = 0.95
+ADD_BATCH_SIZE = 5000
+SEED = 13
+SYNTHETIC_DIMENSION = 384
+SYNTHETIC_CLUSTERS = 200
+
+
+def synthetic_vectors(n: int, dimension: int = SYNTHETIC_DIMENSION, seed: int = SEED) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((SYNTHETIC_CLUSTERS, dimension), dtype=np.float32)
+    vectors = centers[rng.integers(0, SYNTHETIC_CLUSTERS, n)]
+    vectors += 0.6 * rng.standard_normal((n, dimension), dtype=np.float32)
+    return normalize_rows(vectors)
+
+
+def make_queries(vectors: np.ndarray, n: int, seed: int = SEED) -> np.ndarray:
+    """Perturbed copies of random corpus vectors, so queries sit near but not on the data."""
+    rng = np.random.default_rng(seed + 1)
+    picks = vectors[rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)]
+    noise = rng.standard_normal(picks.shape, dtype=np.float32) * (0.3 / np.sqrt(vectors.shape[1]))
+    return normalize_rows(picks + noise)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block_rows: int = 65536) -> np.ndarray:
+    """Indices of the k most cosine-similar vectors per query, best first."""
+    k = min(k, len(vectors))
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(vectors), block_rows):
+        scores = queries @ vectors[start:start + block_rows].T
+        best_scores = np.hstack([best_scores, scores])
+        best_ids = np.hstack([best_ids, np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)])
+        keep = np.argpartition(-best_scores, min(k, best_scores.shape[1] - 1), axis=1)[:, :k]
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        best_ids = np.take_along_axis(best_ids, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_ids, order, axis=1)
+
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 2**20
+
+
+def build_collection(path: str, vectors: np.ndarray, construction_ef: int, m: int, search_ef: int):
+    """Creates a fresh collection holding vectors; returns (collection, build seconds)."""
+    import chromadb # here so quantization_report.py can share the vector helpers without Chroma
+
+    client = chromadb.PersistentClient(path=path)
+    collection = client.create_collection(
+        name="hnsw_sweep", metadata=hnsw_metadata(construction_ef=construction_ef, m=m, search_ef=search_ef)
+    )
+    started = time.perf_counter()
+    for start in range(0, len(vectors), ADD_BATCH_SIZE):
+        batch = vectors[start:start + ADD_BATCH_SIZE]
+        collection.add(ids=[str(i) for i in range(start, start + len(batch))], embeddings=batch.tolist())
+    return collection, time.perf_counter() - started
+
+
+def measure(collection, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(int(i) for i in result['ids'][0]) & set(expected.tolist()))
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "recall": hits / truth.size,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def brute_force_latency(vectors: np.ndarray, queries: np.ndarray, k: int) -> float:
+    """p50 of one exact query, for reference."""
+    latencies = []
+    for query in queries[:100]:
+        start = time.perf_counter()
+        exact_top_k(vectors, query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+    return float(np.percentile(np.asarray(latencies) * 1000, 50))
+
+
+def sweep(vectors: np.ndarray, k: int = K, n_queries: int = N_QUERIES, construction_efs=CONSTRUCTION_EFS,
+          ms=MS, search_efs=SEARCH_EFS) -> list:
+    queries = make_queries(vectors, n_queries)
+    truth = exact_top_k(vectors, queries, k)
+    rows = []
+    for construction_ef, m in itertools.product(construction_efs, ms):
+        workdir = tempfile.mkdtemp(prefix="hnsw_sweep_")
+        try:
+            path = os.path.join(workdir, str(search_efs[0]))
+            collection, build_s = build_collection(path, vectors, construction_ef, m, search_efs[0])
+            for search_ef in search_efs:
+                if search_ef != search_efs[0] and not set_search_ef(collection, search_ef):
+                    # This Chroma release fixes search_ef at creation, so rebuild with it
+                    path = os.path.join(workdir, str(search_ef))
+                    collection, build_s = build_collection(path, vectors, construction_ef, m, search_ef)
+                row = {"construction_ef": construction_ef, "M": m, "search_ef": search_ef,
+                       "build_s": build_s, "index_mb": dir_size_mb(path)}
+                row.update(measure(collection, queries, truth, k))
+                rows.append(row)
+                print(f"{construction_ef:>15} {m:>4} {search_ef:>9} {row['recall']:>9.3f} {build_s:>8.1f} "
+                      f"{row['index_mb']:>9.1f} {row['p50_ms']:>7.2f} {row['p99_ms']:>7.2f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+def cheapest(rows: list, target_recall: float):
+    """Fastest setting meeting the recall target; smaller index and build time break ties."""
+    meeting = [r for r in rows if r["recall"] >= target_recall]
+    if not meeting:
+        return None
+    return min(meeting, key=lambda r: (r["p50_ms"], r["index_mb"], r["build_s"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep HNSW parameters for recall@k against brute force.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--vector-store", help="Exported brute-force store to take vectors from")
+    source.add_argument("--synthetic", type=int, default=50_000, help="Number of synthetic vectors (default)")
+    parser.add_argument("-k", type=int, default=K, help="Recall@k")
+    parser.add_argument("--queries", type=int, default=N_QUERIES)
+    parser.add_argument("--target-recall", type=float, default=TARGET_RECALL)
+    parser.add_argument("--output", help="Write all rows and the recommendation as JSON")
+    args = parser.parse_args()
+
+    if args.vector_store:
+        vectors = normalize_rows(np.load(os.path.join(args.vector_store, EMBEDDINGS_FILE)))
+        origin = args.vector_store
+    else:
+        vectors = synthetic_vectors(args.synthetic)
+        origin = f"synthetic:{args.synthetic}"
+    print(f"{len(vectors):,} vectors ({origin}), {args.queries} queries, recall@{args.k}")
+    print(f"Brute-force p50: {brute_force_latency(vectors, make_queries(vectors, args.queries), args.k):.2f} ms\n")
+
+    print(f"{'construction_ef':>15} {'M':>4} {'search_ef':>9} {'recall':>9} {'build s':>8} "
+          f"{'index MB':>9} {'p50 ms':>7} {'p99 ms':>7}")
+    rows = sweep(vectors, args.k, args.queries)
+
+    best = cheapest(rows, args.target_recall)
+    if best is None:
+        print(f"\nNo setting reached recall@{args.k} >= {args.target_recall}; widen the grid.")
+    else:
+        print(f"\nCheapest setting with recall@{args.k} >= {args.target_recall}: construction_ef={best['construction_ef']}, "
+              f"M={best['M']}, search_ef={best['search_ef']} ({best['recall']:.3f} recall, {best['p50_ms']:.2f} ms p50)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"vectors": origin, "count": len(vectors), "k": args.k, "target_recall": args.target_recall,
+                       "rows": rows, "recommended": best}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
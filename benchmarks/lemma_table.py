@@ -0,0 +1,90 @@
+# benchmarks/lemma_table.py
+
+"""
+Cleaning throughput of the word -> lemma table against the per-token path.
+
+per_token_clean is advanced_clean_text as it was before the table: regexes
+compiled on every call and a stop word check plus WordNet lemmatize() per
+token occurrence. The table path is measured twice:
+
+    cold    empty table, so every distinct word is resolved once
+    warm    the table the cold pass built, as on a re-run or in a worker
+            that received the saved table
+
+Outputs are compared so the speedup is not bought with different tokens.
+Articles are repeated --repeat times to approach a large crawl's ratio of
+token occurrences to distinct words.
+
+Run from the project root (needs the NLTK corpora):
+    python benchmarks/lemma_table.py --repeat 50
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+# Shared modules live in the project root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from text_cleaning import LemmaTable, _nltk_resources, advanced_clean_text
+
+# --- Configuration ---
+DEFAULT_INPUT = os.path.join(ROOT, 'data', 'mental_health_articles.jsonl')
+REPEAT = 20
+
+
+def per_token_clean(text):
+    """The previous advanced_clean_text, kept here as the baseline."""
+    if text is None:
+        return ""
+    lemmatizer, stop_words = _nltk_resources()
+    text = str(text).lower()
+    text = re.sub(r'<.*?>', '', text)
+    text = re.sub(r'[^\x00-\x7F]+', ' ', text)
+    words = re.findall(r'\b\w+\b', text)
+    cleaned_words = []
+    for word in words:
+        if word not in stop_words:
+            cleaned_words.append(lemmatizer.lemmatize(word))
+    return " ".join(cleaned_words)
+
+
+def load_bodies(path: str, repeat: int) -> list:
+    with open(path, encoding='utf-8') as f:
+        bodies = [json.loads(line).get('body') or '' for line in f if line.strip()]
+    return bodies * repeat
+
+
+def timed(clean, bodies) -> tuple:
+    started = time.perf_counter()
+    outputs = [clean(body) for body in bodies]
+    return outputs, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the lemma table with per-token lemmatization.")
+    parser.add_argument("--input", default=DEFAULT_INPUT, help="Raw articles JSONL (uses the 'body' field)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Times to repeat the articles")
+    args = parser.parse_args()
+
+    bodies = load_bodies(args.input, args.repeat)
+    _nltk_resources() # load WordNet and the stop words outside the timings
+    n_tokens = sum(len(re.findall(r'\b\w+\b', body.lower())) for body in bodies)
+
+    baseline, baseline_s = timed(per_token_clean, bodies)
+    table = LemmaTable()
+    cold, cold_s = timed(lambda body: advanced_clean_text(body, table), bodies)
+    warm, warm_s = timed(lambda body: advanced_clean_text(body, table), bodies)
+
+    print(f"{len(bodies):,} articles, {n_tokens:,} tokens, {len(table.entries):,} distinct words\n")
+    print(f"{'path':<12} {'seconds':>8} {'tokens/s':>12} {'speedup':>8}")
+    for name, seconds in (("per-token", baseline_s), ("table cold", cold_s), ("table warm", warm_s)):
+        print(f"{name:<12} {seconds:>8.2f} {n_tokens / seconds:>12,.0f} {baseline_s / seconds:>7.1f}x")
+    print(f"\nIdentical output: {baseline == cold == warm}")
+
+
+if __name__ == "__main__":
+    main()
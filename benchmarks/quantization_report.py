@@ -0,0 +1,134 @@
+# benchmarks/quantization_report.py
+
+"""
+Memory saved and recall lost by the compressed vector store modes.
+
+Each mode (float32, float16, int8, with no rescore copy or a float16 or
+float32 one) is written from the same vectors with
+vector_engine.write_vector_store and queried through BruteForceCollection.
+Recall@k is measured against the float32 store's exact results.
+
+    scanned MB   bytes of the matrix (and int8 scales) every query reads
+    rescore MB   bytes of rescore.npy, only read for the shortlist
+    disk MB      everything the store writes, rescore copy and records included
+    disk saved   disk MB relative to the float32 store; negative when it grows
+    recall@k     overlap with the float32 top k
+    p50 ms       single-query latency
+
+A store shipped for SERENE_EASE_BACKEND="numpy" does not need the Chroma
+directory next to it, which holds its own float32 vectors plus the HNSW graph.
+
+Vectors come from the exported store (embed_data.py writes it) or a seeded
+synthetic clustered set, since the real corpus is small.
+
+Run from the project root:
+    python benchmarks/quantization_report.py --synthetic 200000
+    python benchmarks/quantization_report.py --vector-store vector_store_serene_ease --output quantization.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Shared modules live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hnsw_sweep import dir_size_mb, make_queries, synthetic_vectors
+from vector_engine import EMBEDDINGS_FILE, RESCORE_FILE, SCALES_FILE, BruteForceCollection, write_vector_store
+
+# --- Configuration ---
+MODES = [("float32", None), ("float16", None), ("float16", "float32"),
+         ("int8", None), ("int8", "float16"), ("int8", "float32")]
+K = 10
+N_QUERIES = 300
+
+
+def measure(path: str, queries: np.ndarray, k: int):
+    """Returns (ids per query, p50 latency in ms)."""
+    collection = BruteForceCollection(path)
+    collection.query(query_embeddings=queries[:1], n_results=k, include=[]) # page the matrix in
+    ids, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=query[None, :], n_results=k, include=[])
+        latencies.append(time.perf_counter() - start)
+        ids.append(result['ids'][0])
+    return ids, float(np.percentile(np.asarray(latencies) * 1000, 50))
+
+
+def scanned_mb(path: str) -> float:
+    total = os.path.getsize(os.path.join(path, EMBEDDINGS_FILE))
+    if os.path.exists(os.path.join(path, SCALES_FILE)):
+        total += os.path.getsize(os.path.join(path, SCALES_FILE))
+    return total / 2**20
+
+
+def rescore_mb(path: str) -> float:
+    file_path = os.path.join(path, RESCORE_FILE)
+    return os.path.getsize(file_path) / 2**20 if os.path.exists(file_path) else 0.0
+
+
+def report(vectors: np.ndarray, k: int = K, n_queries: int = N_QUERIES) -> list:
+    queries = make_queries(vectors, n_queries)
+    ids = list(range(len(vectors)))
+    workdir = tempfile.mkdtemp(prefix="quantization_")
+    rows, baseline = [], None
+    try:
+        for dtype, rescore in MODES:
+            path = os.path.join(workdir, f"{dtype}_{rescore}")
+            write_vector_store(path, ids, vectors, dtype=dtype, rescore=rescore)
+            found, p50_ms = measure(path, queries, k)
+            if baseline is None:
+                baseline = found # float32 is listed first and is exact
+            recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, baseline)])
+            rows.append({"dtype": dtype, "rescore": rescore, "scanned_mb": scanned_mb(path),
+                         "rescore_mb": rescore_mb(path), "disk_mb": dir_size_mb(path),
+                         "recall": float(recall), "p50_ms": p50_ms})
+            shutil.rmtree(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for row in rows:
+        row["memory_saved"] = 1 - row["scanned_mb"] / rows[0]["scanned_mb"]
+        row["disk_saved"] = 1 - row["disk_mb"] / rows[0]["disk_mb"]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and recall of float16 / int8 vector stores.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--vector-store", help="Exported brute-force store to take vectors from")
+    source.add_argument("--synthetic", type=int, default=200_000, help="Number of synthetic vectors (default)")
+    parser.add_argument("-k", type=int, default=K, help="Recall@k")
+    parser.add_argument("--queries", type=int, default=N_QUERIES)
+    parser.add_argument("--output", help="Write the rows as JSON")
+    args = parser.parse_args()
+
+    if args.vector_store:
+        vectors = BruteForceCollection(args.vector_store).get(include=['embeddings'])['embeddings']
+        origin = args.vector_store
+    else:
+        vectors = synthetic_vectors(args.synthetic)
+        origin = f"synthetic:{args.synthetic}"
+    print(f"{len(vectors):,} vectors ({origin}), {args.queries} queries, recall@{args.k} vs float32\n")
+
+    rows = report(vectors, args.k, args.queries)
+    print(f"{'mode':>24} {'scanned MB':>10} {'saved':>6} {'rescore MB':>10} {'disk MB':>8} {'saved':>6} "
+          f"{'recall':>7} {'p50 ms':>7}")
+    for row in rows:
+        mode = row['dtype'] + (f" +{row['rescore']} rescore" if row['rescore'] else "")
+        print(f"{mode:>24} {row['scanned_mb']:>10.1f} {row['memory_saved']:>6.0%} {row['rescore_mb']:>10.1f} "
+              f"{row['disk_mb']:>8.1f} {row['disk_saved']:>6.0%} {row['recall']:>7.3f} {row['p50_ms']:>7.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"vectors": origin, "count": len(vectors), "k": args.k, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# benchmarks/serving_benchmark.py
+
+"""
+Offline benchmark of the query path on synthetic corpora.
+
+For each corpus size the harness:
+  1. writes a synthetic corpus in the final_chunked_mental_health_data.jsonl
+     schema (seeded, so every run indexes the same text);
+  2. indexes it through data_processing/embed_data.embed_and_store, with a
+     fast deterministic hashed bag-of-words encoder instead of MiniLM so 1M
+     chunks can be built in reasonable time (queries still go through the
+     collection's own encoder, so query latency includes real embedding);
+  3. measures, in a fresh process per backend:
+       - retrieval p50/p99 (rag_system.retrieve_context and the vector-only
+         query_db.search_collection) on a warm collection,
+       - retrieval QPS at several concurrency levels,
+       - query_vector_db and run_rag_query end to end (database opened per
+         call, the CLI's real cost), with the offline fake LLM,
+       - current and peak RSS.
+
+Results are written as JSON so runs can be compared across releases.
+
+Run from the project root:
+    python benchmarks/serving_benchmark.py                      # 1k, 100k and 1M chunks
+    python benchmarks/serving_benchmark.py --sizes 1000 100000 --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Shared modules live in the project root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'data_processing'))
+from embedding_backends import MODEL_NAME
+
+# --- Configuration ---
+CORPUS_SIZES = [1_000, 100_000, 1_000_000]
+BACKENDS = ["chroma", "numpy", "ivfpq"]
+CONCURRENCY_LEVELS = [1, 4, 16]
+LATENCY_QUERIES = 200    # sequential warm queries for p50/p99
+THROUGHPUT_QUERIES = 400 # queries per concurrency level
+END_TO_END_QUERIES = 10  # query_vector_db / run_rag_query calls (each reopens the database)
+WORK_DIR = os.path.join(ROOT, 'benchmarks', 'corpora')
+DEFAULT_OUTPUT = os.path.join(ROOT, 'benchmarks', 'serving_benchmark.json')
+SEED = 13
+DIMENSION = 384 # matches all-MiniLM-L6-v2 so the collection's own encoder can query it
+CHUNK_WORDS = (60, 120)
+LLM_LATENCY_S = 0.0 # fake LLM: no think time and effectively instant "typing", so only our overhead is measured
+LLM_WORDS_PER_SECOND = 1e9
+
+SOURCES = ['nimh.nih.gov', 'nhs.uk', 'cdc.gov', 'mentalhealth.gov', 'samhsa.gov', 'mayoclinic.org',
+           'mentalhealth.org.uk', 'who.int']
+DOMAIN_WORDS = (
+    "anxiety stress depression therapy sleep panic attack support mental health treatment symptom "
+    "counseling medication mood disorder bipolar trauma ptsd mindfulness breathing exercise wellbeing "
+    "helpline crisis suicide prevention child adolescent family friend work school resilience coping "
+    "self care physical activity diet alcohol drug recovery doctor psychiatrist psychologist diagnosis "
+    "worry fear loneliness grief eating obsessive compulsive schizophrenia psychosis relaxation"
+).split()
+QUESTIONS = [
+    "What are practical, daily methods for stress management?",
+    "How can I prevent anxiety in daily life?",
+    "What are the signs of depression?",
+    "How does therapy help with mental health?",
+    "What should I do during a panic attack?",
+    "How can I support a friend with bipolar disorder?",
+    "What helps with trouble sleeping because of stress?",
+    "Where can I find a mental health helpline?",
+]
+
+
+# --- Synthetic corpus ---
+
+def vocabulary(size: int = 20_000) -> list:
+    """Domain words first (most frequent under the Zipf draw), then filler terms."""
+    return DOMAIN_WORDS + [f"term{i}" for i in range(size - len(DOMAIN_WORDS))]
+
+
+def write_corpus(path: str, n_chunks: int, seed: int = SEED):
+    """Writes n_chunks synthetic chunks in the final_chunked_mental_health_data.jsonl schema."""
+    rng = np.random.default_rng(seed)
+    vocab = vocabulary()
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(n_chunks):
+            article_id, chunk_number = divmod(i, 8)
+            source = SOURCES[article_id % len(SOURCES)]
+            n_words = int(rng.integers(*CHUNK_WORDS))
+            word_ids = (rng.zipf(1.3, n_words) - 1) % len(vocab)
+            f.write(json.dumps({
+                "url": f"https://www.{source}/synthetic/{article_id}",
+                "source": source,
+                "title": f"synthetic article {article_id}",
+                "chunk_id": f"{source.split('.')[0]}_{article_id}_{chunk_number}",
+                "chunk_text": " ".join(vocab[w] for w in word_ids),
+                "article_id": article_id,
+            }) + "\n")
+
+
+class HashedBagOfWords:
+    """Deterministic, fast document encoder: sum of seeded random word vectors, normalized."""
+
+    # Claims the query encoder's identity so open_collection accepts the index:
+    # the benchmark times real query embedding, while relevance is not measured
+    model_name = MODEL_NAME
+    variant = 'fp32'
+
+    def __init__(self, dimension: int = DIMENSION):
+        self.dimension = dimension
+        self._word_ids = {}
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+
+    def _vector_id(self, word: str) -> int:
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = self._word_ids[word] = len(self._word_ids)
+            if word_id >= len(self._vectors):
+                self._vectors = np.vstack([self._vectors, np.zeros((max(1024, len(self._vectors)), self.dimension),
+                                                                   dtype=np.float32)])
+            rng = np.random.default_rng(zlib.crc32(word.encode('utf-8')))
+            self._vectors[word_id] = rng.standard_normal(self.dimension, dtype=np.float32)
+        return word_id
+
+    def __call__(self, texts) -> list:
+        word_ids, offsets = [], []
+        for text in texts:
+            offsets.append(len(word_ids))
+            word_ids.extend(self._vector_id(w) for w in (str(text).split() or ["<empty>"]))
+        sums = np.add.reduceat(self._vectors[np.asarray(word_ids)], np.asarray(offsets), axis=0)
+        sums /= np.linalg.norm(sums, axis=1, keepdims=True)
+        return sums.tolist()
+
+
+def corpus_paths(n_chunks: int) -> dict:
+    base = os.path.join(WORK_DIR, f"{n_chunks}")
+    return {
+        "base": base,
+        "chunked_file": os.path.join(base, "chunks.jsonl"),
+        "chroma_path": os.path.join(base, "chroma"),
+        "vector_store_path": os.path.join(base, "vector_store"),
+        "lexical_index_path": os.path.join(base, "lexical_index"),
+        "ivfpq_path": os.path.join(base, "ivfpq"),
+    }
+
+
+def build(n_chunks: int) -> dict:
+    """Writes and indexes one corpus; returns the build timings."""
+    import embed_data
+
+    paths = corpus_paths(n_chunks)
+    os.makedirs(paths["base"], exist_ok=True)
+    started = time.perf_counter()
+    write_corpus(paths["chunked_file"], n_chunks)
+    written = time.perf_counter()
+    embed_data.BUILD_IVFPQ_INDEX = True
+    # Synthetic vectors must not land in the real model's embedding cache
+    embed_data.USE_EMBEDDING_CACHE = False
+    embed_data.embed_and_store(
+        paths["chunked_file"], paths["chroma_path"], paths["vector_store_path"], paths["lexical_index_path"],
+        encoder=HashedBagOfWords(), ivfpq_path=paths["ivfpq_path"]
+    )
+    return {"corpus_s": written - started, "index_s": time.perf_counter() - written,
+            "peak_rss_mb": peak_rss_mb()}
+
+
+# --- Measurements ---
+
+def current_rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+def latency_summary(latencies) -> dict:
+    latencies = np.asarray(latencies) * 1000
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99)),
+            "n": int(len(latencies))}
+
+
+def timed_calls(fn, queries) -> list:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def queries(n: int) -> list:
+    return [QUESTIONS[i % len(QUESTIONS)] for i in range(n)]
+
+
+def measure(n_chunks: int, backend: str) -> dict:
+    """Measures the query path against an already built corpus with one backend."""
+    import generation
+    import query_db
+    import rag_system
+
+    paths = corpus_paths(n_chunks)
+    # Point the CLI modules at the synthetic corpus
+    rag_system.RETRIEVAL_BACKEND = backend
+    rag_system.CHROMA_PATH = query_db.CHROMA_PATH = paths["chroma_path"]
+    rag_system.VECTOR_STORE_PATH = paths["vector_store_path"]
+    rag_system.LEXICAL_INDEX_PATH = paths["lexical_index_path"]
+    rag_system.IVFPQ_PATH = paths["ivfpq_path"]
+    # Repeated benchmark questions would be served from the disk cache; time the encoder instead
+    rag_system.USE_EMBEDDING_CACHE = query_db.USE_EMBEDDING_CACHE = False
+    generation.USE_FAKE_LLM = True
+    generation.FAKE_LLM_FIRST_TOKEN_DELAY = LLM_LATENCY_S
+    generation.FAKE_LLM_WORDS_PER_SECOND = LLM_WORDS_PER_SECOND
+    baseline_rss = current_rss_mb()
+
+    collection = rag_system.open_collection()
+    lexical_index = rag_system.open_lexical_index()
+    retrieve = lambda q: rag_system.retrieve_context(collection, q, lexical_index=lexical_index)
+    retrieve(QUESTIONS[0]) # load the query encoder before timing
+
+    result = {
+        "retrieve_context": latency_summary(timed_calls(retrieve, queries(LATENCY_QUERIES))),
+        "search_collection": latency_summary(timed_calls(
+            lambda q: query_db.search_collection(collection, q), queries(LATENCY_QUERIES))),
+        "throughput": [],
+    }
+    for concurrency in CONCURRENCY_LEVELS:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            start = time.perf_counter()
+            list(pool.map(retrieve, queries(THROUGHPUT_QUERIES)))
+            elapsed = time.perf_counter() - start
+        result["throughput"].append({"concurrency": concurrency, "qps": THROUGHPUT_QUERIES / elapsed})
+    result["warm_rss_mb"] = current_rss_mb()
+    result["index_rss_mb"] = result["warm_rss_mb"] - baseline_rss
+
+    # End to end through the CLI entry points; their printing is discarded
+    with contextlib.redirect_stdout(io.StringIO()):
+        if backend == "chroma":
+            result["query_vector_db"] = latency_summary(
+                timed_calls(query_db.query_vector_db, queries(END_TO_END_QUERIES)))
+        result["run_rag_query"] = latency_summary(timed_calls(rag_system.run_rag_query, queries(END_TO_END_QUERIES)))
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+# --- Driver ---
+
+def run_child(*args) -> dict:
+    """Runs one phase in a fresh interpreter so RSS numbers are not polluted by earlier phases."""
+    out_path = os.path.join(WORK_DIR, f"phase_{os.getpid()}.json")
+    subprocess.run([sys.executable, os.path.abspath(__file__), *args, "--phase-output", out_path],
+                   check=True, stdout=subprocess.DEVNULL)
+    with open(out_path, encoding='utf-8') as f:
+        result = json.load(f)
+    os.remove(out_path)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline serving benchmark on synthetic corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=CORPUS_SIZES, help="Corpus sizes in chunks")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON results file")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild corpora that already exist")
+    # Internal: run a single phase in this process
+    parser.add_argument("--build", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--measure", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--phase-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build is not None or args.measure is not None:
+        result = build(args.build) if args.build is not None else measure(args.measure, args.backend)
+        with open(args.phase_output, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    os.makedirs(WORK_DIR, exist_ok=True)
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {"concurrency_levels": CONCURRENCY_LEVELS, "latency_queries": LATENCY_QUERIES,
+                   "throughput_queries": THROUGHPUT_QUERIES, "end_to_end_queries": END_TO_END_QUERIES,
+                   "llm_latency_s": LLM_LATENCY_S, "seed": SEED},
+        "corpora": [],
+    }
+    for n_chunks in args.sizes:
+        entry = {"chunks": n_chunks, "build": None, "backends": {}}
+        if args.rebuild or not os.path.exists(corpus_paths(n_chunks)["lexical_index_path"]):
+            print(f"Building {n_chunks:,}-chunk corpus...")
+            entry["build"] = run_child("--build", str(n_chunks))
+            print(f"  indexed in {entry['build']['index_s']:.1f}s (peak RSS {entry['build']['peak_rss_mb']:.0f} MB)")
+        for backend in args.backends:
+            print(f"Measuring {n_chunks:,} chunks, {backend} backend...")
+            row = entry["backends"][backend] = run_child("--measure", str(n_chunks), "--backend", backend)
+            qps = ", ".join(f"{t['concurrency']}: {t['qps']:.0f}" for t in row["throughput"])
+            print(f"  retrieve p50 {row['retrieve_context']['p50_ms']:.1f} ms, p99 {row['retrieve_context']['p99_ms']:.1f} ms"
+                  f" | QPS {qps} | RSS {row['warm_rss_mb']:.0f} MB")
+        report["corpora"].append(entry)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
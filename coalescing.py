@@ -0,0 +1,130 @@
+# coalescing.py
+
+"""
+Single-flight coalescing of identical in-flight requests.
+
+When many users submit the same question at once, only the first request
+(the leader) runs retrieval and generation; concurrent identical requests
+attach to the same flight and receive the same result. Requests are keyed on
+the normalized query plus the retrieval parameters, so filtered and
+unfiltered questions never share an answer.
+
+Streaming flights are driven by a background thread that appends pieces to a
+shared buffer; every caller (leader included) reads from that buffer, so a
+caller that disconnects mid-answer cannot stall the others. Safe to share
+across Streamlit script threads.
+"""
+
+import json
+import threading
+from concurrent.futures import Future
+
+from query_cache import normalize_query
+
+
+def make_key(query_text: str, **params) -> str:
+    """Flight key: normalized query plus the parameters that change the answer."""
+    return normalize_query(query_text) + "|" + json.dumps(params, sort_keys=True, default=str)
+
+
+class _StreamFlight:
+    """Buffer of pieces produced by one generator, readable by many consumers."""
+
+    def __init__(self):
+        self.pieces = []
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def produce(self, generator):
+        try:
+            for piece in generator:
+                with self.condition:
+                    self.pieces.append(piece)
+                    self.condition.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def consume(self):
+        position = 0
+        while True:
+            with self.condition:
+                while position >= len(self.pieces) and not self.done:
+                    self.condition.wait()
+                if position < len(self.pieces):
+                    piece = self.pieces[position]
+                    position += 1
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            yield piece
+
+
+class SingleFlight:
+    """Shares one execution among concurrent callers with the same key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self.requests = 0
+        self.executions = 0
+
+    @property
+    def coalesced(self) -> int:
+        """Calls answered by joining another caller's flight."""
+        return self.requests - self.executions
+
+    def run(self, key: str, fn):
+        """Returns fn()'s result, running fn at most once per key at a time."""
+        with self._lock:
+            self.requests += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.executions += 1
+
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+        return future.result()
+
+    def stream(self, key: str, make_generator):
+        """
+        Returns an iterator over the pieces of make_generator(), starting the
+        generator only if no identical stream is already in flight.
+        """
+        with self._lock:
+            self.requests += 1
+            flight = self._streams.get(key)
+            if flight is None:
+                flight = _StreamFlight()
+                self._streams[key] = flight
+                self.executions += 1
+
+                def drive():
+                    try:
+                        flight.produce(make_generator())
+                    finally:
+                        with self._lock:
+                            if self._streams.get(key) is flight:
+                                del self._streams[key]
+
+                threading.Thread(target=drive, name="single-flight", daemon=True).start()
+        return flight.consume()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "executions": self.executions, "coalesced": self.coalesced}
@@ -0,0 +1,197 @@
+# context_packer.py
+
+"""
+Token-budgeted context assembly.
+
+create_chunks() overlaps consecutive chunks by CHUNK_OVERLAP words, so when
+two neighbours from the same article are both retrieved the prompt repeats
+that text. pack_context() takes the ranked candidates and:
+
+1. merges chunks of the same article whose texts overlap (suffix of one ==
+   prefix of the other), keeping the shared span once;
+2. drops chunks whose text is already contained in another candidate;
+3. orders the remaining passages with maximal marginal relevance (MMR), using
+   word-set Jaccard similarity, so near-duplicates from different pages do
+   not crowd out other sources;
+4. greedily packs passages until the token budget is spent. A merged
+   passage too large for the budget left is trimmed to it, starting at its
+   best-ranked chunk, so top-ranked material is shortened rather than dropped
+   and the context is never empty when there are candidates.
+
+Token counts are estimated (about four characters per token), which is close
+enough for budgeting Gemini input without calling the tokenizer.
+"""
+
+# --- Configuration ---
+# A full CHUNK_SIZE (500-word) chunk of cleaned text is about 950 estimated tokens;
+# the default budget matches the three chunks the prompt held before packing
+CHUNK_TOKENS = 950
+TOKEN_BUDGET = 3 * CHUNK_TOKENS
+MIN_TRIMMED_TOKENS = 100  # smaller leftovers of an oversized passage are not worth a snippet
+MMR_LAMBDA = 0.7          # 1.0 = pure relevance, 0.0 = pure diversity
+MAX_OVERLAP_WORDS = 60    # a little above clean_data.CHUNK_OVERLAP (50)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text) + 3) // 4)
+
+
+def _overlap(first: list, second: list, max_words: int) -> int:
+    """Length of the longest suffix of first that is also a prefix of second."""
+    for k in range(min(max_words, len(first), len(second)), 0, -1):
+        if first[-k:] == second[:k]:
+            return k
+    return 0
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _merge_article(passages: list, max_overlap: int) -> list:
+    """Merges overlapping passages of one article until no pair overlaps."""
+    merged = True
+    while merged and len(passages) > 1:
+        merged = False
+        for i in range(len(passages)):
+            for j in range(len(passages)):
+                if i == j:
+                    continue
+                a, b = passages[i], passages[j]
+                k = _overlap(a['words'], b['words'], max_overlap)
+                if k == 0:
+                    continue
+                shift = len(a['words']) - k
+                a['parts'] += [dict(part, start=part['start'] + shift, end=part['end'] + shift)
+                               for part in b['parts']]
+                a['words'] = a['words'] + b['words'][k:]
+                a['chunk_ids'] += b['chunk_ids']
+                a['raw_tokens'] += b['raw_tokens']
+                a['rank'] = min(a['rank'], b['rank'])
+                passages.pop(j)
+                merged = True
+                break
+            if merged:
+                break
+    return passages
+
+
+def _trim(passage: dict, budget: int):
+    """
+    The span of an oversized passage that fits budget: from the start of its
+    best-ranked chunk forwards, then backwards if the passage ends first.
+    Returns (words, parts covered), or None if not even one word fits.
+    """
+    words = passage['words']
+    best = min(passage['parts'], key=lambda part: part['rank'])
+    start = end = best['start']
+    max_chars = budget * 4 # inverse of estimate_tokens
+    chars = -1 # n joined words take sum(len) + n - 1 characters
+    while end < len(words) and chars + 1 + len(words[end]) <= max_chars:
+        chars += 1 + len(words[end])
+        end += 1
+    while start > 0 and chars + 1 + len(words[start - 1]) <= max_chars:
+        chars += 1 + len(words[start - 1])
+        start -= 1
+    if start == end:
+        return None
+    parts = [part for part in passage['parts'] if part['start'] < end and start < part['end']]
+    return words[start:end], parts
+
+
+def pack_context(results, token_budget: int = TOKEN_BUDGET, mmr_lambda: float = MMR_LAMBDA,
+                 max_overlap: int = MAX_OVERLAP_WORDS) -> dict:
+    """
+    Assembles ranked single-query Chroma results (best first) into prompt
+    snippets that fit token_budget. Returns the snippets plus a report of the
+    tokens used and saved.
+    """
+    ids = results['ids'][0]
+    documents = results['documents'][0]
+    metadatas = results['metadatas'][0]
+
+    # 1. Group candidates by article and merge overlapping neighbours
+    articles = {}
+    for rank, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+        metadata = metadata or {}
+        article = metadata.get('article_id', metadata.get('url', chunk_id))
+        articles.setdefault(article, []).append({
+            'words': document.split(),
+            'chunk_ids': [chunk_id],
+            'raw_tokens': estimate_tokens(document),
+            'rank': rank,
+            'metadata': metadata,
+            # Word span, id and rank of each chunk inside the (merged) passage
+            'parts': [{'start': 0, 'end': len(document.split()), 'chunk_id': chunk_id,
+                       'raw_tokens': estimate_tokens(document), 'rank': rank}],
+        })
+    passages = []
+    for group in articles.values():
+        passages.extend(_merge_article(group, max_overlap))
+
+    # 2. Drop passages fully contained in another one
+    for passage in passages:
+        passage['text'] = " ".join(passage['words'])
+        passage['word_set'] = set(passage['words'])
+    unique = []
+    for passage in sorted(passages, key=lambda p: len(p['text']), reverse=True):
+        container = next((kept for kept in unique if passage['text'] in kept['text']), None)
+        if container is None:
+            unique.append(passage)
+            continue
+        # The duplicate's tokens count as saved; its rank can lift the container
+        start = container['text'][:container['text'].index(passage['text'])].count(' ')
+        container['parts'] += [dict(part, start=part['start'] + start, end=part['end'] + start)
+                               for part in passage['parts']]
+        container['chunk_ids'] += passage['chunk_ids']
+        container['raw_tokens'] += passage['raw_tokens']
+        container['rank'] = min(container['rank'], passage['rank'])
+
+    # 3. MMR ordering: relevance from retrieval rank, redundancy from word overlap
+    n_candidates = max(len(ids), 1)
+    remaining = sorted(unique, key=lambda p: p['rank'])
+    ordered = []
+    while remaining:
+        def mmr(p):
+            relevance = 1.0 - p['rank'] / n_candidates
+            redundancy = max((_jaccard(p['word_set'], q['word_set']) for q in ordered), default=0.0)
+            return mmr_lambda * relevance - (1.0 - mmr_lambda) * redundancy
+        best = max(remaining, key=mmr)
+        remaining.remove(best)
+        ordered.append(best)
+
+    # 4. Greedy packing up to the budget
+    snippets = []
+    used_tokens = 0
+    raw_tokens = 0
+    for passage in ordered:
+        left = token_budget - used_tokens
+        text, chunk_ids, passage_raw = passage['text'], passage['chunk_ids'], passage['raw_tokens']
+        if estimate_tokens(text) > left:
+            # Too large whole: keep what fits around its best chunk instead of dropping it
+            trimmed = _trim(passage, left) if left >= MIN_TRIMMED_TOKENS or not snippets else None
+            if trimmed is None:
+                continue
+            words, parts = trimmed
+            text = " ".join(words)
+            chunk_ids = [part['chunk_id'] for part in parts]
+            passage_raw = sum(part['raw_tokens'] for part in parts)
+        used_tokens += estimate_tokens(text)
+        raw_tokens += passage_raw
+        snippets.append({
+            'text': text,
+            'chunk_ids': chunk_ids,
+            'source': passage['metadata'].get('source', 'Unknown'),
+            'url': passage['metadata'].get('url', ''),
+            'title': passage['metadata'].get('title', ''),
+        })
+
+    return {
+        'snippets': snippets,
+        'tokens': used_tokens,
+        'saved_tokens': raw_tokens - used_tokens,
+        'candidates': len(ids),
+        'chunks_used': sum(len(s['chunk_ids']) for s in snippets),
+    }
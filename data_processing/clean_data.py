@@ -1,185 +1,303 @@
 import pandas as pd
-import re
+import hashlib
+import json
+import multiprocessing
 import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Shared with the query path so lexical search sees the same tokens
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from text_cleaning import LEMMA_TABLE_PATH, LemmaTable, advanced_clean_text, get_lemma_table, set_lemma_table
 
 # --- Configuration ---
 
-file_path = "data/mental_health_articles.jsonl" 
-
-# 1. Load the data from the JSON Lines file
-try:
-    df = pd.read_json(file_path, lines=True)
-    print(f"✓ Loaded {len(df)} records from {file_path}.")
-except FileNotFoundError:
-    print(f"ERROR: File not found at {file_path}. Please check your project structure and file path.")
-    # Create an empty DataFrame to prevent immediate crash
-    df = pd.DataFrame(columns=['url', 'source', 'title', 'body'])
-
-# 2. Check for missing essential fields and remove those records
-initial_count = len(df)
-df.dropna(subset=['url', 'title', 'body'], inplace=True)
-df = df[df['body'].str.len() > 100] 
-print(f"✓ Removed {initial_count - len(df)} records with missing or insufficient content.")
-
-# 3. Deduplicate based on URL (Primary key)
-url_duplicates = df.duplicated(subset=['url'], keep='first').sum()
-df.drop_duplicates(subset=['url'], keep='first', inplace=True)
-
-# 4. Deduplicate based on Body Content (catching different URLs for same content)
-body_duplicates = df.duplicated(subset=['body'], keep='first').sum()
-df.drop_duplicates(subset=['body'], keep='first', inplace=True)
-
-print(f"✓ Removed {url_duplicates} URL duplicates.")
-print(f"✓ Removed {body_duplicates} Content duplicates.")
-print(f"Final record count after Phase 1: {len(df)}")
-
-# 5. Standardize the 'source' domain name
-df['source'] = df['source'].str.lower()
-df['source'] = df['source'].str.replace('www.', '', regex=False)
-df['source'] = df['source'].str.replace('http://', '', regex=False)
-df['source'] = df['source'].str.replace('https://', '', regex=False)
-df['source'] = df['source'].str.strip()
-
-print("\nSample of cleaned sources:")
-print(df['source'].value_counts().head())
-
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-
-# --- NLTK data is confirmed to be downloaded. Proceeding directly. ---
-
-# Initialize Lemmatizer and Stop Words list
-lemmatizer = WordNetLemmatizer()
-STOP_WORDS = set(stopwords.words('english'))
-
-def advanced_clean_text(text):
-    if pd.isna(text):
-        return ""
-    text = str(text).lower()
-    
-    # 1. Remove HTML tags, Unicode characters, and any other artifacts
-    text = re.sub(r'<.*?>', '', text) 
-    text = re.sub(r'[^\x00-\x7F]+', ' ', text) 
-    
-    # 2. Tokenization: Split text into words
-    words = re.findall(r'\b\w+\b', text)
-    
-    # 3. Lemmatization and Stop Word Removal
-    cleaned_words = []
-    for word in words:
-        if word not in STOP_WORDS:
-            cleaned_words.append(lemmatizer.lemmatize(word))
-            
-    # Rejoin cleaned words into a single string
-    return " ".join(cleaned_words)
-
-print("\nStarting Phase 2: Text Preprocessing...")
-
-# Create new columns for the cleaned text
-df['clean_title'] = df['title'].apply(advanced_clean_text)
-df['clean_body'] = df['body'].apply(advanced_clean_text)
-
-# Final check: Remove any records that became empty after stop word/artifact removal
-final_count_before = len(df)
-df = df[df['clean_body'].str.len() > 10] 
-print(f"✓ Removed {final_count_before - len(df)} records that were reduced to empty text.")
-
-print(f"Final Cleaned DataFrame size: {len(df)}")
-print("\n--- Sample of Cleaned Data ---")
-print(f"Original Title: {df['title'].iloc[0]}")
-print(f"Clean Title:    {df['clean_title'].iloc[0]}")
-print(f"Original Body (Start): {df['body'].iloc[0][:150]}...")
-print(f"Clean Body (Start):    {df['clean_body'].iloc[0][:150]}...")
-
-# 6. Save the final clean dataset for chunking
-df[['url', 'source', 'clean_title', 'clean_body']].to_json('clean_mental_health_articles.jsonl', orient='records', lines=True)
-print("\n✓ Cleaned data saved to 'clean_mental_health_articles.jsonl'")
+file_path = "data/mental_health_articles.jsonl"
+cleaned_file_path = "clean_mental_health_articles.jsonl"
+chunked_output_path = 'final_chunked_mental_health_data.jsonl'
 
-# --- PHASE 3: CHUNKING (Preparing for Embedding/RAG) ---
+# Phases 1-2 stream the raw file: articles are filtered and deduplicated here,
+# cleaned in CLEAN_BATCH_SIZE batches across CLEAN_WORKERS processes, and
+# written out in input order as each batch comes back
+CLEAN_WORKERS = os.cpu_count() or 1 # 1 cleans in this process
+CLEAN_BATCH_SIZE = 256
+BATCHES_PER_WORKER = 2 # batches queued ahead per worker
+PROGRESS_EVERY_S = 5.0
+
+
+def iter_raw_articles(path):
+    """Yields the article records of a JSON Lines file one at a time."""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def filter_articles(articles, counts: Counter):
+    """
+    Phase 1 on a stream: drops records with missing or insufficient content,
+    then URL duplicates and content duplicates (first one wins), tallying
+    what was removed into counts.
+    """
+    seen_urls, seen_bodies = set(), set()
+    for article in articles:
+        counts['read'] += 1
+        # 2. Check for missing essential fields and remove those records
+        if not all(isinstance(article.get(key), str) for key in ('url', 'title', 'body')) \
+                or len(article['body']) <= 100:
+            counts['insufficient'] += 1
+            continue
+        # 3. Deduplicate based on URL (Primary key)
+        if article['url'] in seen_urls:
+            counts['url_duplicates'] += 1
+            continue
+        seen_urls.add(article['url'])
+        # 4. Deduplicate based on Body Content (catching different URLs for same content)
+        body_key = hashlib.blake2b(article['body'].encode('utf-8'), digest_size=16).digest()
+        if body_key in seen_bodies:
+            counts['body_duplicates'] += 1
+            continue
+        seen_bodies.add(body_key)
+        yield article
+
+
+def normalize_source(source) -> str:
+    """5. Standardize the 'source' domain name."""
+    source = str(source or '').lower()
+    for prefix in ('www.', 'http://', 'https://'):
+        source = source.replace(prefix, '')
+    return source.strip()
+
+
+def clean_article(article):
+    """Phase 2 for one article: the output record, or None if it was reduced to empty text."""
+    clean_body = advanced_clean_text(article['body'])
+    # Final check: Remove any records that became empty after stop word/artifact removal
+    if len(clean_body) <= 10:
+        return None
+    return {
+        'url': article['url'],
+        'source': normalize_source(article.get('source')),
+        'clean_title': advanced_clean_text(article['title']),
+        'clean_body': clean_body,
+    }
+
+
+def _init_worker(lemma_entries: dict):
+    # Each worker starts from the same snapshot of the lemma table and records the words it adds
+    set_lemma_table(LemmaTable(lemma_entries))
+
+
+def _clean_batch(articles):
+    """Cleaned records plus the words this process added to its lemma table meanwhile."""
+    records = [clean_article(article) for article in articles]
+    return records, get_lemma_table().drain_added()
+
+
+def _batches(items, batch_size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def clean_batches(batches, workers: int = CLEAN_WORKERS, lemma_table: LemmaTable = None):
+    """
+    Yields (batch, cleaned records) in input order, cleaning up to
+    BATCHES_PER_WORKER batches per worker process at a time. Words the
+    workers lemmatize are merged back into lemma_table.
+    """
+    lemma_table = lemma_table or LemmaTable.load()
+    if workers <= 1:
+        set_lemma_table(lemma_table)
+        for batch in batches:
+            yield batch, [clean_article(article) for article in batch]
+        return
+
+    # spawn, not fork: the workers load their own NLTK resources
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(lemma_table.entries,)) as pool:
+        in_flight = deque()
+
+        def finish():
+            done, future = in_flight.popleft()
+            records, added = future.result()
+            lemma_table.merge(added)
+            return done, records
+
+        for batch in batches:
+            in_flight.append((batch, pool.submit(_clean_batch, batch)))
+            if len(in_flight) >= workers * BATCHES_PER_WORKER:
+                yield finish()
+        while in_flight:
+            yield finish()
+
+
+def clean_articles(input_path=file_path, output_path=cleaned_file_path, workers=CLEAN_WORKERS,
+                   lemma_table_path=LEMMA_TABLE_PATH):
+    """
+    Phases 1-2: streams the raw crawl through filtering, deduplication and
+    text cleaning into output_path (url, source, clean_title, clean_body).
+    The word -> lemma table at lemma_table_path is reused and extended.
+    Returns the number of records written.
+    """
+    counts = Counter()
+    sources = Counter()
+    written = 0
+    sample = None
+    started = last_report = time.perf_counter()
 
-from nltk.tokenize import sent_tokenize
+    # 1. Load the data from the JSON Lines file, one record at a time
+    try:
+        articles = filter_articles(iter_raw_articles(input_path), counts)
+        batches = _batches(articles, CLEAN_BATCH_SIZE)
+        lemma_table = LemmaTable.load(lemma_table_path)
+        known_words = len(lemma_table.entries)
+        print(f"Cleaning {input_path} with {workers} worker(s), {known_words} words in the lemma table...")
+        with open(output_path, 'w', encoding='utf-8') as out:
+            for batch, cleaned in clean_batches(batches, workers, lemma_table):
+                for article, record in zip(batch, cleaned):
+                    if record is None:
+                        counts['empty'] += 1
+                        continue
+                    out.write(json.dumps(record) + "\n")
+                    sources[record['source']] += 1
+                    written += 1
+                    if sample is None:
+                        sample = (article, record)
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_EVERY_S:
+                    print(f"  {counts['read']:,} articles read, {written:,} written "
+                          f"({counts['read'] / (now - started):,.0f} articles/s)")
+                    last_report = now
+    except FileNotFoundError:
+        print(f"ERROR: File not found at {input_path}. Please check your project structure and file path.")
+        return 0
+    elapsed = time.perf_counter() - started
+    if lemma_table.added:
+        lemma_table.save(lemma_table_path)
+    print(f"✓ Lemma table: {len(lemma_table.entries) - known_words} new words, "
+          f"{len(lemma_table.entries)} saved to '{lemma_table_path}'.")
+
+    print(f"✓ Loaded {counts['read']} records from {input_path}.")
+    print(f"✓ Removed {counts['insufficient']} records with missing or insufficient content.")
+    print(f"✓ Removed {counts['url_duplicates']} URL duplicates.")
+    print(f"✓ Removed {counts['body_duplicates']} Content duplicates.")
+    print(f"✓ Removed {counts['empty']} records that were reduced to empty text.")
+    print(f"Final cleaned record count: {written} in {elapsed:.1f}s "
+          f"({counts['read'] / max(elapsed, 1e-9):,.0f} articles/s)")
+
+    print("\nSample of cleaned sources:")
+    for source, count in sources.most_common(5):
+        print(f"{source:<30} {count}")
+
+    if sample is not None:
+        article, record = sample
+        print("\n--- Sample of Cleaned Data ---")
+        print(f"Original Title: {article['title']}")
+        print(f"Clean Title:    {record['clean_title']}")
+        print(f"Original Body (Start): {article['body'][:150]}...")
+        print(f"Clean Body (Start):    {record['clean_body'][:150]}...")
+
+    print(f"\n✓ Cleaned data saved to '{output_path}'")
+    return written
+
+
+# --- PHASE 3: CHUNKING (Preparing for Embedding/RAG) ---
 
 # Configuration for chunking
-CHUNK_SIZE = 500  
-CHUNK_OVERLAP = 50 
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
 
 def create_chunks(row):
     """Splits the clean_body text into overlapping chunks based on sentence boundaries."""
-    
+    from nltk.tokenize import sent_tokenize
+
     text = row['clean_body']
     sentences = sent_tokenize(text)
-    
+
     chunks = []
     current_chunk = []
     current_chunk_length = 0
-    
+
     for sentence in sentences:
         sentence_words = sentence.split()
         sentence_length = len(sentence_words)
-        
+
         if current_chunk_length + sentence_length > CHUNK_SIZE and current_chunk:
             chunks.append(" ".join(current_chunk))
-            
+
             # Overlap logic
             overlap_words = current_chunk[-CHUNK_OVERLAP:]
             current_chunk = overlap_words + sentence_words
             current_chunk_length = len(current_chunk)
-            
+
         else:
             current_chunk.extend(sentence_words)
             current_chunk_length += sentence_length
 
     if current_chunk:
         chunks.append(" ".join(current_chunk))
-        
+
     chunk_data = []
     for i, chunk in enumerate(chunks):
         chunk_data.append({
             'url': row['url'],
             'source': row['source'],
             'title': row['clean_title'],
-            'chunk_id': f"{row['source']}_{row['url'].split('/')[-1]}_{i}", 
+            'chunk_id': f"{row['source']}_{row['url'].split('/')[-1]}_{i}",
             'chunk_text': chunk
         })
     return chunk_data
 
-# 1. Load the CLEANED data from the new output file
-cleaned_file_path = "clean_mental_health_articles.jsonl"
-try:
-    # Load the file that was just saved in Phase 2
-    df_clean = pd.read_json(cleaned_file_path, lines=True)
-    print(f"\n✓ Loaded {len(df_clean)} cleaned records for chunking.")
-except FileNotFoundError:
-    print(f"\nERROR: Cleaned file not found at {cleaned_file_path}. Please check file path.")
-    exit()
-
-# 2. Apply the chunking function to every row
-print("Applying chunking...")
-chunked_list_of_lists = df_clean.apply(create_chunks, axis=1).tolist()
-
-# Flatten the list of lists into a single list of chunk dictionaries
-final_chunked_data = [item for sublist in chunked_list_of_lists for item in sublist]
-
-# 3. Create the final DataFrame
-df_chunks = pd.DataFrame(final_chunked_data)
-
-# Create a unique article_id and use it to guarantee unique chunk_ids and assign a unique number to each original URL before chunking
-df_chunks['article_id'] = df_chunks['url'].astype('category').cat.codes
-
-# re-generate the chunk_id using the guaranteed unique article_id
-df_chunks['chunk_id'] = df_chunks.apply(
-    lambda row: f"{row['source'].split('.')[0]}_{row['article_id']}_{row.name}",
-    axis=1
-)
-
-# Save the chunked data
-chunked_output_path = 'final_chunked_mental_health_data.jsonl'
-df_chunks.to_json(chunked_output_path, orient='records', lines=True)
-
-print(f"\n--- Chunking Results ---")
-print(f"Total initial articles: {len(df_clean)}")
-print(f"Total chunks created: {len(df_chunks)}")
-print(f"✓ Final chunked dataset saved to '{chunked_output_path}'")
-print("\nSample Chunk Data:")
-print(df_chunks[['chunk_id', 'source', 'chunk_text']].iloc[0])
\ No newline at end of file
+def chunk_articles(cleaned_file_path=cleaned_file_path, chunked_output_path=chunked_output_path):
+    # 1. Load the CLEANED data from the new output file
+    try:
+        # Load the file that was just saved in Phase 2
+        df_clean = pd.read_json(cleaned_file_path, lines=True)
+        print(f"\n✓ Loaded {len(df_clean)} cleaned records for chunking.")
+    except FileNotFoundError:
+        print(f"\nERROR: Cleaned file not found at {cleaned_file_path}. Please check file path.")
+        exit()
+
+    # 2. Apply the chunking function to every row
+    print("Applying chunking...")
+    chunked_list_of_lists = df_clean.apply(create_chunks, axis=1).tolist()
+
+    # Flatten the list of lists into a single list of chunk dictionaries
+    final_chunked_data = [item for sublist in chunked_list_of_lists for item in sublist]
+
+    # 3. Create the final DataFrame
+    df_chunks = pd.DataFrame(final_chunked_data)
+
+    # Create a unique article_id and use it to guarantee unique chunk_ids and assign a unique number to each original URL before chunking
+    df_chunks['article_id'] = df_chunks['url'].astype('category').cat.codes
+
+    # re-generate the chunk_id using the guaranteed unique article_id
+    df_chunks['chunk_id'] = df_chunks.apply(
+        lambda row: f"{row['source'].split('.')[0]}_{row['article_id']}_{row.name}",
+        axis=1
+    )
+
+    # Save the chunked data
+    df_chunks.to_json(chunked_output_path, orient='records', lines=True)
+
+    print(f"\n--- Chunking Results ---")
+    print(f"Total initial articles: {len(df_clean)}")
+    print(f"Total chunks created: {len(df_chunks)}")
+    print(f"✓ Final chunked dataset saved to '{chunked_output_path}'")
+    print("\nSample Chunk Data:")
+    print(df_chunks[['chunk_id', 'source', 'chunk_text']].iloc[0])
+
+if __name__ == "__main__":
+    # --- NLTK data is confirmed to be downloaded. Proceeding directly. ---
+    print("Starting Phases 1-2: Filtering and Text Preprocessing...")
+    clean_articles()
+    chunk_articles()
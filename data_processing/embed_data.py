@@ -1,71 +1,390 @@
 # data_processing/embed_data.py
 
-import pandas as pd
-from sentence_transformers import SentenceTransformer
-import chromadb
+import hashlib
+import json
+import multiprocessing
 import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Shared retrieval modules live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_backends import EncoderMismatchError, check_encoder, create_encoder, encoder_metadata
+from embedding_cache import EmbeddingCache
+from hnsw_params import HNSW_CONSTRUCTION_EF, HNSW_M, HNSW_SEARCH_EF, hnsw_metadata, set_search_ef
+from ivf_pq import export_ivfpq_index, update_ivfpq_index
+from lexical_index import build_inverted_index
+from vector_engine import export_vector_store, store_is_current, stored_built_at
 
 # --- Configuration ---
 CHUNKED_FILE = 'final_chunked_mental_health_data.jsonl'
 MODEL_NAME = 'all-MiniLM-L6-v2' 
+# Document encoder (see embedding_backends.py): 'sentence-transformers', 'onnx' or 'onnx-int8'.
+# The query side must use the same model and variant; the collection metadata records both.
+EMBEDDING_BACKEND = 'onnx'
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_THREADS = os.cpu_count() or 1
+# Persistent embedding cache (see embedding_cache.py), shared with the query side:
+# texts encoded by an earlier run or another collection are not encoded again
+USE_EMBEDDING_CACHE = True
+EMBEDDING_CACHE_PATH = 'embedding_cache'
+EMBEDDING_CACHE_MAX_BYTES = 2 * 1024**3
 CHROMA_PATH = 'chroma_db_serene_ease'
+VECTOR_STORE_PATH = 'vector_store_serene_ease' # Brute-force backend (vector_engine.py)
+# 'float32' is exact, 'float16' halves the matrix, 'int8' quarters it (see vector_engine.py)
+VECTOR_STORE_DTYPE = 'int8'
+# Copy used to rescore the shortlist of a compressed store: 'float16' keeps an
+# int8 store at 3/4 of the float32 size on disk, 'float32' (or True) makes it
+# larger than float32, False scans the int8 rows alone (compare them with
+# benchmarks/quantization_report.py)
+VECTOR_STORE_RESCORE = 'float16'
+LEXICAL_INDEX_PATH = 'lexical_index_serene_ease' # BM25 postings for hybrid search
+BUILD_IVFPQ_INDEX = False # IVF-PQ index for million-chunk corpora (ivf_pq.py, SERENE_EASE_BACKEND=ivfpq)
+IVFPQ_PATH = 'ivfpq_index_serene_ease'
+# Re-runs add and tombstone rows in the existing IVF-PQ index; it is retrained
+# from scratch once more than this share of its rows are tombstoned
+IVFPQ_MAX_DELETED_FRACTION = 0.2
+# HNSW build parameters; defaults live in hnsw_params.py, pick values with benchmarks/hnsw_sweep.py
+CONSTRUCTION_EF = HNSW_CONSTRUCTION_EF
+M = HNSW_M
+SEARCH_EF = HNSW_SEARCH_EF
+# Streaming ingestion: chunks are read lazily, encoded in INGEST_BATCH_SIZE batches
+# across INGEST_WORKERS processes and upserted batch by batch, so memory stays
+# bounded by the batches in flight rather than the corpus size
+INGEST_BATCH_SIZE = 1024 # must stay under Chroma's max batch size
+INGEST_WORKERS = os.cpu_count() or 1 # 1 encodes in this process
+BATCHES_PER_WORKER = 2 # batches queued ahead per worker
+PROGRESS_EVERY_S = 5.0
+METADATA_KEYS = ['url', 'source', 'title', 'article_id']
+# Re-runs only embed chunks that are new or changed, refresh the metadata of
+# the others when it changed, and delete the ones that disappeared (see chunk_id); set to True to drop the collection and start over
+REBUILD = False
+DELETE_BATCH_SIZE = 5000
+
+# Encoder of this worker process, set by _init_worker
+_worker_encoder = None
+
+
+def iter_chunks(chunked_file):
+    """Yields the chunk records of a JSONL file one at a time."""
+    with open(chunked_file, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def chunk_id(record) -> str:
+    """
+    Content-addressed id: a hash of the page url and the chunk text, so a chunk
+    keeps its id however the file is ordered and gets a new one when it changes.
+    Its metadata is not part of the id; diff_chunks catches metadata changes.
+    """
+    key = f"{record.get('url') or ''}\0{record['chunk_text']}".encode('utf-8')
+    return hashlib.blake2b(key, digest_size=16).hexdigest()
+
+
+def iter_unique_chunks(chunked_file):
+    """Yields (chunk_id, record) pairs, skipping repeats of a chunk already seen on the same page."""
+    seen = set()
+    for record in iter_chunks(chunked_file):
+        record_id = chunk_id(record)
+        if record_id not in seen:
+            seen.add(record_id)
+            yield record_id, record
+
+
+def chunk_metadata(record) -> dict:
+    """
+    The metadata stored with a chunk: the original source information, and
+    'article_id' so queries can be scoped to articles (see retrieval_filters.py).
+    """
+    return {key: record[key] for key in METADATA_KEYS if record.get(key) is not None}
+
+
+def metadata_digest(metadata: dict) -> bytes:
+    return hashlib.blake2b(json.dumps(metadata or {}, sort_keys=True).encode('utf-8'), digest_size=8).digest()
+
+
+def stored_chunks(collection, page_size: int = DELETE_BATCH_SIZE) -> dict:
+    """id -> metadata_digest of every chunk in the collection, read page by page."""
+    stored = {}
+    for offset in range(0, collection.count(), page_size):
+        page = collection.get(include=['metadatas'], limit=page_size, offset=offset)
+        stored.update(zip(page['ids'], map(metadata_digest, page['metadatas'])))
+    return stored
+
+
+def diff_chunks(chunks, stored: dict) -> tuple:
+    """
+    Compares (chunk_id, record) pairs with a collection's stored_chunks().
+    Returns (ids to embed, ids whose stored metadata is out of date, ids to delete).
+    """
+    new_ids, changed_ids, seen = set(), set(), set()
+    for record_id, record in chunks:
+        seen.add(record_id)
+        digest = stored.get(record_id)
+        if digest is None:
+            new_ids.add(record_id)
+        elif digest != metadata_digest(chunk_metadata(record)):
+            changed_ids.add(record_id)
+    return new_ids, changed_ids, set(stored) - seen
+
+
+def iter_batches(chunks, batch_size: int):
+    """Groups (chunk_id, record) pairs into lists of (id, document, metadata) of at most batch_size."""
+    batch = []
+    for record_id, record in chunks:
+        batch.append((record_id, record['chunk_text'], chunk_metadata(record)))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _init_worker(encoder, threads: int):
+    global _worker_encoder
+    encoder.threads = threads
+    _worker_encoder = encoder
+
+
+def _encode_in_worker(documents) -> np.ndarray:
+    return np.asarray(_worker_encoder(documents), dtype=np.float32)
+
+
+def encode_batches(batches, encoder, workers: int = INGEST_WORKERS, cache=None):
+    """
+    Yields (batch, embeddings) in input order. With more than one worker the
+    batches are encoded in a process pool, each process loading its own copy
+    of the model with an equal share of the threads; at most
+    BATCHES_PER_WORKER batches per worker are in flight at once.
+
+    With a cache (see embedding_cache.py) only the texts it misses are
+    encoded, and their vectors are added to it here in the parent process.
+    """
+    def lookup(batch):
+        documents = [document for _, document, _ in batch]
+        vectors = cache.get_many(documents) if cache is not None else [None] * len(documents)
+        return documents, vectors, [i for i, vector in enumerate(vectors) if vector is None]
+
+    def merge(documents, vectors, missing, encoded):
+        if missing:
+            encoded = np.asarray(encoded, dtype=np.float32)
+            if cache is not None:
+                cache.put_many([documents[i] for i in missing], encoded)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+        return vectors
+
+    if workers <= 1:
+        for batch in batches:
+            documents, vectors, missing = lookup(batch)
+            encoded = encoder([documents[i] for i in missing]) if missing else None
+            yield batch, merge(documents, vectors, missing, encoded)
+        return
+
+    threads = max(1, (getattr(encoder, 'threads', None) or os.cpu_count() or 1) // workers)
+    # spawn, not fork: a model already loaded here (and its thread pool) must not be inherited
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(encoder, threads)) as pool:
+        in_flight = deque()
+        for batch in batches:
+            documents, vectors, missing = lookup(batch)
+            future = pool.submit(_encode_in_worker, [documents[i] for i in missing]) if missing else None
+            in_flight.append((batch, documents, vectors, missing, future))
+            if len(in_flight) >= workers * BATCHES_PER_WORKER:
+                done, documents, vectors, missing, future = in_flight.popleft()
+                yield done, merge(documents, vectors, missing, future.result() if future else None)
+        while in_flight:
+            done, documents, vectors, missing, future = in_flight.popleft()
+            yield done, merge(documents, vectors, missing, future.result() if future else None)
+
+
+def embed_and_store(chunked_file=CHUNKED_FILE, chroma_path=CHROMA_PATH, vector_store_path=VECTOR_STORE_PATH,
+                    lexical_index_path=LEXICAL_INDEX_PATH, encoder=None, ivfpq_path=IVFPQ_PATH, rebuild=REBUILD):
+    """
+    Embeds the chunked corpus into Chroma and builds the brute-force and BM25
+    indexes next to it. The paths default to the configuration above; the
+    benchmarks point them at synthetic corpora. encoder maps a list of texts
+    to vectors and carries model_name / variant / dimension (see
+    embedding_backends.py); by default one is created from EMBEDDING_BACKEND.
 
-def embed_and_store():
-    # 1. Load the cleaned and chunked data
+    The chunk file is streamed, never loaded whole (see INGEST_BATCH_SIZE).
+    An existing collection is updated in place: only chunks whose id (see
+    chunk_id) it does not hold yet are embedded, chunks whose metadata changed
+    get it updated without re-embedding, and ids no longer in the file are
+    deleted. rebuild=True starts from an empty collection instead. Derived
+    indexes already built from the collection's current 'built_at' are left
+    as they are.
+    """
+    # 1. Hash the cleaned and chunked data (the texts are read lazily below)
     try:
-        df = pd.read_json(CHUNKED_FILE, lines=True)
-        print(f"✓ Loaded {len(df)} chunks for embedding.")
+        ids = [record_id for record_id, _ in iter_unique_chunks(chunked_file)]
+        print(f"✓ Found {len(ids)} unique chunks.")
     except FileNotFoundError:
-        print(f"ERROR: Chunked file not found at {CHUNKED_FILE}. Please run clean_data.py first.")
+        print(f"ERROR: Chunked file not found at {chunked_file}. Please run clean_data.py first.")
         return
 
-    # 2. Initialize the Embedding Model
-    print(f"Loading Sentence Transformer model: {MODEL_NAME}...")
-    model = SentenceTransformer(MODEL_NAME) 
+    # 2. Initialize the Embedding Model (loaded on its first batch)
+    if encoder is None:
+        print(f"Using the {EMBEDDING_BACKEND} encoder for {MODEL_NAME} "
+              f"(batch size {EMBEDDING_BATCH_SIZE}, {EMBEDDING_THREADS} threads)...")
+        encoder = create_encoder(EMBEDDING_BACKEND, MODEL_NAME, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS)
 
-    # 3. Prepare data for ChromaDB
-    
-    # Generate guaranteed unique IDs using the DataFrame index
-    df['unique_chunk_id'] = df.index.astype(str)
-    
-    ids = df['unique_chunk_id'].tolist()
-    
-    # The 'documents' is the text that will be converted to vectors
-    documents = df['chunk_text'].tolist()
-    
-    # Re-add the metadatas definition
-    # The 'metadatas' stores the original source information
-    metadatas = df[['url', 'source', 'title']].to_dict('records') 
-    
-    # 4. Initialize ChromaDB Client and Collection
-    print(f"Initializing ChromaDB at: {CHROMA_PATH}")
-    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    # 3. Initialize ChromaDB Client and Collection
+    import chromadb # here so the chunk helpers above can be used without Chroma
+
+    print(f"Initializing ChromaDB at: {chroma_path}")
+    client = chromadb.PersistentClient(path=chroma_path)
     
     # Create or get a collection. 
     collection_name = f"mental_health_chunks_{MODEL_NAME.split('-')[0]}"
-    
-    # clear the collection if it already exists to ensure a fresh start
-    try:
-        client.delete_collection(name=collection_name)
-    except:
-        pass 
-    collection = client.create_collection(
-        name=collection_name, 
-        metadata={"hnsw:space": "cosine"}
-    )
-
-    # 5. Generate embeddings and add to the database
-    print(f"Generating embeddings and adding {len(documents)} documents...")
-    
-    collection.add(
-        ids=ids,
-        documents=documents,
-        metadatas=metadatas
-    )
+
+    collection = None
+    if not rebuild:
+        try:
+            collection = client.get_collection(name=collection_name, embedding_function=encoder)
+            check_encoder(collection.metadata, encoder)
+        except EncoderMismatchError as e:
+            print(f"{e} Rebuilding from scratch.")
+            collection = None
+        except Exception:
+            collection = None # no collection yet
+
+    # 'built_at' identifies this build; caches keyed on the old collection
+    # (e.g. the app's semantic answer cache) are invalidated when it changes.
+    # The encoder identity lets the query side refuse a mismatched model.
+    built_at = datetime.now(timezone.utc).isoformat()
+    if collection is None:
+        try:
+            client.delete_collection(name=collection_name)
+        except Exception:
+            pass
+        collection = client.create_collection(
+            name=collection_name, 
+            embedding_function=encoder,
+            metadata={**hnsw_metadata(construction_ef=CONSTRUCTION_EF, m=M, search_ef=SEARCH_EF),
+                      **encoder_metadata(encoder),
+                      "built_at": built_at}
+        )
+        previous_built_at = None
+        stored = {}
+    else:
+        previous_built_at = (collection.metadata or {}).get("built_at")
+        stored = stored_chunks(collection)
+        # construction_ef and M need a rebuild; search_ef can follow SEARCH_EF in place
+        set_search_ef(collection, SEARCH_EF)
+
+    cache = None
+    if USE_EMBEDDING_CACHE:
+        cache = EmbeddingCache(EMBEDDING_CACHE_PATH, encoder.model_name, encoder.variant,
+                               max_bytes=EMBEDDING_CACHE_MAX_BYTES)
+
+    # 4. Diff the file against the collection by content id
+    new_ids, changed_ids, stale_ids = diff_chunks(iter_unique_chunks(chunked_file), stored)
+    print(f"{len(new_ids)} new or changed chunks, {len(stale_ids)} removed, "
+          f"{len(changed_ids)} with new metadata, {len(ids) - len(new_ids) - len(changed_ids)} unchanged.")
+
+    # 5. Generate embeddings for the new chunks and upsert them batch by batch
+    workers = min(INGEST_WORKERS, max(1, -(-len(new_ids) // INGEST_BATCH_SIZE)))
+    print(f"Generating embeddings for {len(new_ids)} documents with {workers} worker(s)...")
+
+    done = 0
+    started = last_report = time.perf_counter()
+    chunks = ((record_id, record) for record_id, record in iter_unique_chunks(chunked_file) if record_id in new_ids)
+    for batch, embeddings in encode_batches(iter_batches(chunks, INGEST_BATCH_SIZE), encoder, workers, cache):
+        collection.upsert(ids=[record_id for record_id, _, _ in batch],
+                          documents=[document for _, document, _ in batch],
+                          metadatas=[metadata for _, _, metadata in batch], embeddings=embeddings)
+        done += len(batch)
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_EVERY_S:
+            print(f"  {done:,}/{len(new_ids):,} chunks ({done / (now - started):,.0f} chunks/s)")
+            last_report = now
+    elapsed = time.perf_counter() - started
+
+    # 6. Refresh the metadata (source, article_id, ...) of chunks whose text is unchanged
+    changed = ((record_id, record) for record_id, record in iter_unique_chunks(chunked_file)
+               if record_id in changed_ids)
+    for batch in iter_batches(changed, INGEST_BATCH_SIZE):
+        collection.update(ids=[record_id for record_id, _, _ in batch],
+                          metadatas=[metadata for _, _, metadata in batch])
+
+    # 7. Delete the chunks that are no longer in the file
+    stale_ids = sorted(stale_ids)
+    for start in range(0, len(stale_ids), DELETE_BATCH_SIZE):
+        collection.delete(ids=stale_ids[start:start + DELETE_BATCH_SIZE])
+
+    if stored and (new_ids or changed_ids or stale_ids):
+        # hnsw:* settings are fixed at creation and Chroma refuses them in modify()
+        collection.modify(metadata={**{k: v for k, v in (collection.metadata or {}).items()
+                                       if not k.startswith("hnsw:")},
+                                    "built_at": built_at})
 
     print(f"\n--- Embedding and Storage Complete ---")
-    print(f"Total chunks embedded: {collection.count()}")
-    print(f"The vector database is stored in the '{CHROMA_PATH}' folder.")
+    print(f"Embedded {done} chunks in {elapsed:.1f}s ({done / max(elapsed, 1e-9):,.0f} chunks/s); "
+          f"deleted {len(stale_ids)}. The collection holds {collection.count()} chunks.")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Embedding cache: {stats['hit_rate']:.0%} hit rate ({stats['hits']} hits, {stats['misses']} encoded), "
+              f"{stats['bytes'] / 2**20:.0f} MB, {stats['evicted']} evicted.")
+    print(f"The vector database is stored in the '{chroma_path}' folder.")
+
+    # The derived indexes below record the 'built_at' they were built from.
+    # One that matches the collection is skipped, so a run that changed
+    # nothing costs the diff above and no more.
+    current_built_at = (collection.metadata or {}).get("built_at")
+
+    # 8. Export the same normalized vectors for the NumPy brute-force backend
+    # (re-exported whole when the collection changed, see vector_engine.py)
+    if store_is_current(vector_store_path, current_built_at, VECTOR_STORE_DTYPE, VECTOR_STORE_RESCORE):
+        print(f"✓ Vector store in the '{vector_store_path}' folder is up to date.")
+    else:
+        exported = export_vector_store(collection, vector_store_path, dtype=VECTOR_STORE_DTYPE,
+                                       rescore=VECTOR_STORE_RESCORE)
+        print(f"✓ Exported {exported} vectors ({VECTOR_STORE_DTYPE}) to the '{vector_store_path}' folder.")
+
+    # 9. Build the BM25 inverted index over the same ids (chunk texts are already cleaned tokens)
+    # from one more lazy pass over the chunk file (rebuilt whole, see lexical_index.py)
+    if current_built_at is not None and stored_built_at(lexical_index_path) == current_built_at:
+        print(f"✓ Lexical index in the '{lexical_index_path}' folder is up to date.")
+    else:
+        metadatas = [] # filled as the texts are read; build_inverted_index reads it afterwards
+
+        def documents():
+            for _, record in iter_unique_chunks(chunked_file):
+                metadatas.append({key: record.get(key) for key in METADATA_KEYS})
+                yield record['chunk_text']
+
+        n_terms = build_inverted_index(ids, documents(), lexical_index_path, metadatas, collection.metadata)
+        print(f"✓ Built lexical index with {n_terms} terms in the '{lexical_index_path}' folder.")
+
+    # 10. Optionally fill the IVF-PQ index from the same embeddings: an index
+    # exported from the collection as it was before this run only needs the
+    # changes, anything else is retrained from a random sample
+    if BUILD_IVFPQ_INDEX:
+        index_built_at = stored_built_at(ivfpq_path)
+        if index_built_at is not None and index_built_at == current_built_at:
+            print(f"✓ IVF-PQ index in the '{ivfpq_path}' folder is up to date.")
+        else:
+            index = None
+            if index_built_at is not None and index_built_at == previous_built_at:
+                index = update_ivfpq_index(collection, ivfpq_path, new_ids | changed_ids, stale_ids)
+                if index.deleted_fraction() > IVFPQ_MAX_DELETED_FRACTION:
+                    print(f"{index.deleted_fraction():.0%} of the IVF-PQ rows are deleted; retraining.")
+                    index = None
+                else:
+                    print(f"✓ Added {len(new_ids) + len(changed_ids)} and deleted {len(stale_ids)} vectors "
+                          f"in the IVF-PQ index in the '{ivfpq_path}' folder.")
+            if index is None:
+                encoded = export_ivfpq_index(collection, ivfpq_path)
+                print(f"✓ Encoded {encoded} vectors into the IVF-PQ index in the '{ivfpq_path}' folder.")
 
 if __name__ == "__main__":
     embed_and_store()
\ No newline at end of file
@@ -0,0 +1,228 @@
+# embedding_backends.py
+
+"""
+Pluggable document/query encoders for indexing and querying.
+
+    sentence-transformers   the PyTorch model from the Hugging Face hub
+    onnx                    the same MiniLM export Chroma's default embedding
+                            function runs, on ONNX Runtime with our own batch
+                            size and thread count
+    onnx-int8               that export with dynamically quantized int8
+                            weights (smaller and faster on CPU, vectors drift
+                            slightly from fp32)
+
+Every encoder is a callable taking a list of texts and returning one
+normalized float32 vector per text, so it can be passed to Chroma as an
+embedding function, to vector_engine / ivf_pq collections and to
+QueryEmbeddingCache. Models load on first use.
+
+The encoder's identity (model name and weight variant) is written into the
+collection metadata by embed_data.py; check_encoder() refuses to query a
+collection with an encoder that would place queries in a different vector
+space. Collections built before this metadata existed were built with
+Chroma's default function, i.e. the fp32 'onnx' encoder, and are accepted.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+# --- Configuration ---
+MODEL_NAME = 'all-MiniLM-L6-v2'
+BACKENDS = ('sentence-transformers', 'onnx', 'onnx-int8')
+DEFAULT_BACKEND = 'onnx'
+BATCH_SIZE = 64
+THREADS = os.cpu_count() or 1
+MAX_TOKENS = 256 # MiniLM was trained on 256-token inputs; Chroma truncates the same way
+# Where Chroma's default embedding function keeps its ONNX export (<model>/onnx/model.onnx)
+ONNX_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'chroma', 'onnx_models')
+QUANTIZED_MODEL_FILE = 'model_int8.onnx'
+
+
+class EncoderMismatchError(ValueError):
+    """The query encoder does not match the model a collection was built with."""
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class _Encoder:
+    """Shared batching, lazy loading and identity; subclasses implement _load and _encode_batch."""
+
+    variant = 'fp32'
+
+    def __init__(self, model_name: str = MODEL_NAME, batch_size: int = BATCH_SIZE, threads: int = THREADS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.threads = threads
+        self._dimension = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Ingestion workers receive the configuration and load their own model
+        state = {key: value for key, value in self.__dict__.items() if not key.startswith('_')}
+        state['_dimension'] = self._dimension
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __call__(self, input):
+        # Chroma checks that embedding functions name their argument 'input'
+        return list(self.encode(input))
+
+    def encode(self, texts) -> np.ndarray:
+        """(len(texts), dimension) float32 array of unit vectors."""
+        self._ensure_loaded()
+        texts = [str(t) for t in texts]
+        batches = [self._encode_batch(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        if not batches:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        vectors = _normalize(np.vstack(batches).astype(np.float32, copy=False))
+        self._dimension = vectors.shape[1]
+        return vectors
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self.encode(["dimension probe"])
+        return self._dimension
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+                    self._loaded = True
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _encode_batch(self, texts) -> np.ndarray:
+        raise NotImplementedError
+
+
+class SentenceTransformerEncoder(_Encoder):
+    name = 'sentence-transformers'
+
+    def _load(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(self.threads)
+        self._model = SentenceTransformer(self.model_name, device='cpu')
+
+    def _encode_batch(self, texts) -> np.ndarray:
+        return self._model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+
+
+class ONNXEncoder(_Encoder):
+    """
+    Runs the MiniLM ONNX export with mean pooling, as Chroma's default
+    function does, but pads each batch only to its longest text instead of
+    to MAX_TOKENS and lets us set the batch size and intra-op threads.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model_name: str = MODEL_NAME, batch_size: int = BATCH_SIZE, threads: int = THREADS,
+                 model_dir: str = None):
+        super().__init__(model_name, batch_size, threads)
+        self.model_dir = model_dir or os.path.join(ONNX_CACHE_DIR, model_name, 'onnx')
+
+    def _model_file(self) -> str:
+        return os.path.join(self.model_dir, 'model.onnx')
+
+    def _load(self):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if not os.path.exists(self._model_file()):
+            # Let Chroma download and unpack the export into its cache once
+            from chromadb.utils import embedding_functions
+            embedding_functions.DefaultEmbeddingFunction()(["download"])
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, 'tokenizer.json'))
+        self._tokenizer.enable_truncation(max_length=MAX_TOKENS)
+        self._tokenizer.enable_padding(pad_id=0, pad_token='[PAD]')
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(self._model_file(), options, providers=['CPUExecutionProvider'])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def _encode_batch(self, texts) -> np.ndarray:
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask,
+                 'token_type_ids': np.zeros_like(input_ids)}
+        hidden = self._session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+class QuantizedONNXEncoder(ONNXEncoder):
+    """ONNXEncoder on int8 weights, quantized once next to the fp32 export."""
+
+    name = 'onnx-int8'
+    variant = 'int8'
+
+    def _model_file(self) -> str:
+        return os.path.join(self.model_dir, QUANTIZED_MODEL_FILE)
+
+    def _load(self):
+        quantized = self._model_file()
+        if not os.path.exists(quantized):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            fp32 = os.path.join(self.model_dir, 'model.onnx')
+            if not os.path.exists(fp32):
+                from chromadb.utils import embedding_functions
+                embedding_functions.DefaultEmbeddingFunction()(["download"])
+            # Written under a temporary name so a concurrent reader never sees a partial file
+            partial = quantized + '.partial'
+            quantize_dynamic(fp32, partial, weight_type=QuantType.QInt8)
+            os.replace(partial, quantized)
+        super()._load()
+
+
+_ENCODERS = {cls.name: cls for cls in (SentenceTransformerEncoder, ONNXEncoder, QuantizedONNXEncoder)}
+
+
+def create_encoder(backend: str = DEFAULT_BACKEND, model_name: str = MODEL_NAME, batch_size: int = BATCH_SIZE,
+                   threads: int = THREADS):
+    """Returns an encoder for one of BACKENDS; the model loads on the first call."""
+    if backend not in _ENCODERS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+    return _ENCODERS[backend](model_name, batch_size=batch_size, threads=threads)
+
+
+def encoder_metadata(encoder) -> dict:
+    """Collection metadata identifying the vector space encoder produces."""
+    return {
+        'embedding_model': encoder.model_name,
+        'embedding_variant': encoder.variant,
+        'embedding_dim': encoder.dimension,
+    }
+
+
+def check_encoder(metadata: dict, encoder):
+    """Raises EncoderMismatchError when encoder cannot query a collection built as metadata records."""
+    metadata = metadata or {}
+    for key, expected in (('embedding_model', encoder.model_name), ('embedding_variant', encoder.variant)):
+        built = metadata.get(key)
+        if built is not None and built != expected:
+            raise EncoderMismatchError(
+                f"Collection was built with {metadata.get('embedding_model')} "
+                f"({metadata.get('embedding_variant')}) but the query encoder is "
+                f"{encoder.model_name} ({encoder.variant}); rebuild the collection or change the encoder."
+            )
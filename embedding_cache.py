@@ -0,0 +1,290 @@
+# embedding_cache.py
+
+"""
+Persistent embedding cache shared by indexing and queries.
+
+Vectors are keyed by (model, normalized text): each model identity gets its
+own directory, and within it a text's key is the blake2b digest of the text
+after normalize_query (lowercase, collapsed whitespace, which MiniLM's uncased
+tokenizer ignores anyway). Re-chunking or rebuilding a collection then only
+encodes texts it has never seen, and boilerplate chunks repeated across
+pages are encoded once.
+
+Layout of <path>/<model>-<variant>/:
+
+    manifest.json       vector dimension
+    shard_00000.bin     float32 rows, append-only, memory-mapped for reads
+    keys.bin            (16-byte key, uint32 shard, uint32 row) per entry, append-only
+    lock                held while appending or evicting, so processes can share a cache
+
+When the shards outgrow max_bytes the oldest shards are deleted whole and
+keys.bin is compacted. CachedEncoder wraps an embedding_backends encoder
+with the cache and keeps its identity, so it can stand in for it anywhere.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from query_cache import normalize_query
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process locking, one writer at a time
+    fcntl = None
+
+# --- Configuration ---
+SHARD_ROWS = 65536
+MAX_BYTES = 2 * 1024**3 # 2 GB of vectors, roughly 1.3M MiniLM embeddings
+KEY_DTYPE = np.dtype([('key', 'V16'), ('shard', '<u4'), ('row', '<u4')])
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(normalize_query(text).encode('utf-8'), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """Disk-backed map from normalized text to its embedding under one model."""
+
+    def __init__(self, path: str, model_name: str, variant: str = 'fp32', max_bytes: int = MAX_BYTES,
+                 shard_rows: int = SHARD_ROWS):
+        self.path = os.path.join(path, f"{model_name}-{variant}")
+        self.max_bytes = max_bytes
+        self.shard_rows = shard_rows
+        os.makedirs(self.path, exist_ok=True)
+        self.dimension = self._read_dimension()
+        self._index = None # loaded on first use
+        self._keys_read = (None, 0) # (inode, bytes) of keys.bin reflected in _index
+        self._shards = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _shard_file(self, shard: int) -> str:
+        return self._file(f"shard_{shard:05d}.bin")
+
+    def _read_dimension(self):
+        try:
+            with open(self._file('manifest.json'), encoding='utf-8') as f:
+                return json.load(f)['dimension']
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._file('lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _read_keys(self, offset: int = 0):
+        """Complete key records of keys.bin from byte offset on, plus the file's (inode, size read)."""
+        keys_file = self._file('keys.bin')
+        try:
+            stat = os.stat(keys_file)
+        except FileNotFoundError:
+            return np.zeros(0, KEY_DTYPE), (None, 0)
+        count = (stat.st_size - offset) // KEY_DTYPE.itemsize
+        records = np.fromfile(keys_file, dtype=KEY_DTYPE, count=count, offset=offset)
+        return records, (stat.st_ino, offset + count * KEY_DTYPE.itemsize)
+
+    def _load_index(self):
+        """Reads keys.bin; later entries for a key win, entries in deleted shards are dropped."""
+        records, self._keys_read = self._read_keys()
+        live = {shard for shard in np.unique(records['shard']).tolist() if os.path.exists(self._shard_file(shard))}
+        records = records[np.isin(records['shard'], list(live))]
+        self._index = dict(zip(records['key'].tolist(), zip(records['shard'].tolist(), records['row'].tolist())))
+
+    def _refresh_index(self):
+        """
+        Brings the index up to date with keys.bin, which other processes may
+        have appended to or compacted since it was read. Called under the file lock.
+        """
+        inode, read = self._keys_read
+        try:
+            stat = os.stat(self._file('keys.bin'))
+        except FileNotFoundError:
+            stat = None
+        if self._index is None or stat is None or stat.st_ino != inode or stat.st_size < read:
+            self._load_index()
+            return
+        records, self._keys_read = self._read_keys(read)
+        self._index.update(zip(records['key'].tolist(), zip(records['shard'].tolist(), records['row'].tolist())))
+
+    def _ensure_index(self):
+        if self._index is None:
+            self._load_index()
+
+    def _row(self, shard: int, row: int) -> np.ndarray:
+        matrix = self._shards.get(shard)
+        if matrix is None or row >= len(matrix):
+            # Opened (or reopened after the shard grew) on demand
+            matrix = np.memmap(self._shard_file(shard), dtype=np.float32, mode='r').reshape(-1, self.dimension)
+            self._shards[shard] = matrix
+        return np.array(matrix[row])
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_index()
+            return len(self._index)
+
+    def get_many(self, texts) -> list:
+        """Cached vector per text, or None where it is not cached."""
+        keys = [text_key(text) for text in texts]
+        vectors = []
+        with self._lock:
+            self._ensure_index()
+            for key in keys:
+                location = self._index.get(key)
+                vector = None
+                if location is not None:
+                    try:
+                        vector = self._row(*location)
+                    except (OSError, ValueError):
+                        # Evicted by another process since the index was read
+                        del self._index[key]
+                        self._shards.pop(location[0], None)
+                vectors.append(vector)
+            found = sum(vector is not None for vector in vectors)
+            self.hits += found
+            self.misses += len(vectors) - found
+        return vectors
+
+    def put_many(self, texts, vectors):
+        """Appends the vectors of texts not cached yet, then evicts down to max_bytes."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        with self._lock, self._file_lock():
+            self._refresh_index()
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+                with open(self._file('manifest.json'), 'w', encoding='utf-8') as f:
+                    json.dump({'dimension': self.dimension}, f)
+
+            rows, keys = [], {}
+            for key, vector in zip((text_key(text) for text in texts), vectors):
+                if key not in self._index and key not in keys:
+                    keys[key] = len(rows)
+                    rows.append(vector)
+            keys = list(keys)
+            if not keys:
+                return
+
+            row_bytes = self.dimension * 4
+            shard = max((int(name[6:11]) for name in os.listdir(self.path) if name.startswith('shard_')), default=0)
+            written = 0
+            records = np.zeros(len(keys), dtype=KEY_DTYPE)
+            while written < len(keys):
+                shard_file = self._shard_file(shard)
+                size = os.path.getsize(shard_file) if os.path.exists(shard_file) else 0
+                used = size // row_bytes
+                take = min(self.shard_rows - used, len(keys) - written)
+                if take <= 0:
+                    shard += 1
+                    continue
+                if size != used * row_bytes:
+                    # Drop a row left half-written by a crashed append so new rows land where their keys say
+                    os.truncate(shard_file, used * row_bytes)
+                    self._shards.pop(shard, None)
+                with open(shard_file, 'ab') as f:
+                    f.write(np.ascontiguousarray(rows[written:written + take], dtype=np.float32).tobytes())
+                for i in range(take):
+                    records[written + i] = (keys[written + i], shard, used + i)
+                    self._index[keys[written + i]] = (shard, used + i)
+                written += take
+            keys_file = self._file('keys.bin')
+            inode, read = self._keys_read
+            if os.path.exists(keys_file) and os.path.getsize(keys_file) != read:
+                # Same for a half-written key record
+                os.truncate(keys_file, read)
+            with open(keys_file, 'ab') as f:
+                f.write(records.tobytes())
+            self._keys_read = (os.stat(keys_file).st_ino, read + records.nbytes)
+            self._evict()
+
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(self._file(name)) for name in os.listdir(self.path) if name.startswith('shard_'))
+
+    def _evict(self):
+        """
+        Deletes the oldest shards until the cache fits max_bytes (the newest
+        shard is kept). Called under the file lock with the index refreshed,
+        so the compacted keys.bin keeps every other process's entries.
+        """
+        shards = sorted(int(name[6:11]) for name in os.listdir(self.path) if name.startswith('shard_'))
+        size = self.size_bytes()
+        dropped = set()
+        while size > self.max_bytes and len(shards) > 1:
+            shard = shards.pop(0)
+            size -= os.path.getsize(self._shard_file(shard))
+            os.remove(self._shard_file(shard))
+            self._shards.pop(shard, None)
+            dropped.add(shard)
+        if not dropped:
+            return
+        before = len(self._index)
+        self._index = {key: location for key, location in self._index.items() if location[0] not in dropped}
+        self.evicted += before - len(self._index)
+        records = np.zeros(len(self._index), dtype=KEY_DTYPE)
+        for i, (key, (shard, row)) in enumerate(self._index.items()):
+            records[i] = (key, shard, row)
+        partial = self._file('keys.bin.partial')
+        records.tofile(partial)
+        os.replace(partial, self._file('keys.bin'))
+        self._keys_read = (os.stat(self._file('keys.bin')).st_ino, records.nbytes)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index) if self._index is not None else None,
+                "bytes": self.size_bytes(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evicted": self.evicted,
+            }
+
+
+class CachedEncoder:
+    """An encoder (see embedding_backends.py) that serves cached vectors and encodes only the misses."""
+
+    def __init__(self, encoder, cache: EmbeddingCache):
+        self.encoder = encoder
+        self.cache = cache
+
+    def __getattr__(self, name):
+        # model_name, variant, dimension, batch_size, threads come from the wrapped encoder
+        if name in ('encoder', 'cache'):
+            raise AttributeError(name)
+        return getattr(self.encoder, name)
+
+    def __call__(self, input):
+        return list(self.encode(input))
+
+    def encode(self, texts) -> np.ndarray:
+        texts = [str(text) for text in texts]
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = np.asarray(self.encoder([texts[i] for i in missing]), dtype=np.float32)
+            self.cache.put_many([texts[i] for i in missing], encoded)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+        if not vectors:
+            return np.zeros((0, self.encoder.dimension), dtype=np.float32)
+        return np.vstack(vectors).astype(np.float32, copy=False)
+
+
+def with_cache(encoder, path: str, max_bytes: int = MAX_BYTES) -> CachedEncoder:
+    """Wraps encoder with the cache directory for its model under path."""
+    return CachedEncoder(encoder, EmbeddingCache(path, encoder.model_name, encoder.variant, max_bytes=max_bytes))
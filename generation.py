@@ -0,0 +1,225 @@
+# generation.py
+
+"""
+Streaming generation helpers.
+
+stream_generate() wraps Gemini's generate_content_stream so callers can show
+text as it arrives (st.write_stream in the app, stdout in the CLI) while a
+GenerationTimer records time-to-first-token and total generation time.
+
+FakeStreamingClient mimics the parts of genai.Client used here and streams a
+canned answer with configurable latency, so the streaming path can be run and
+tested offline. Set SERENE_EASE_FAKE_LLM=1 to use it in app.py / rag_system.py.
+FakeRateLimitedClient additionally enforces a requests-per-minute quota and
+answers excess calls with 429 RESOURCE_EXHAUSTED, like the free tier does.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+from generation_scheduler import GenerationScheduler, is_rate_limit_error
+
+# --- Configuration ---
+USE_FAKE_LLM = os.getenv("SERENE_EASE_FAKE_LLM") == "1"
+FAKE_LLM_FIRST_TOKEN_DELAY = 0.3 # seconds before the stub's first piece
+FAKE_LLM_WORDS_PER_SECOND = 60.0
+
+
+class GenerationTimer:
+    """Records when a generation started, produced its first text and finished."""
+
+    def __init__(self):
+        self.started = None
+        self.dispatched = None
+        self.first_token = None
+        self.finished = None
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def mark_dispatch(self):
+        """The request left the scheduler's queue and was sent to the model."""
+        self.dispatched = time.perf_counter()
+
+    def mark_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def ttft(self):
+        """Seconds from the request to the first streamed text, or None."""
+        if self.started is None or self.first_token is None:
+            return None
+        return self.first_token - self.started
+
+    @property
+    def queue_wait(self):
+        """Seconds spent waiting for quota before the (last) call was sent, or None."""
+        if self.started is None or self.dispatched is None:
+            return None
+        return self.dispatched - self.started
+
+    @property
+    def total(self):
+        """Seconds from the request to the end of the stream, or None."""
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def as_dict(self) -> dict:
+        return {"ttft_s": self.ttft, "total_s": self.total, "queue_s": self.queue_wait}
+
+
+def stream_generate(gemini_client, model: str, contents: str, system_instruction: str, timer: GenerationTimer = None,
+                    scheduler: GenerationScheduler = None, estimated_tokens: int = None):
+    """
+    Yields answer text pieces as the model streams them.
+
+    With a scheduler, the call waits its turn under the RPM/TPM quota and
+    QueueStatus objects are yielded (before any text) while it waits; a rate
+    limit hit before the first piece is retried with backoff.
+    """
+    timer = timer or GenerationTimer()
+    timer.start()
+    try:
+        attempts = scheduler.max_retries + 1 if scheduler is not None else 1
+        for attempt in range(attempts):
+            if scheduler is not None:
+                yield from scheduler.wait_turn(estimated_tokens or len(contents) // 4, attempt)
+                timer.mark_dispatch()
+            try:
+                stream = gemini_client.models.generate_content_stream(
+                    model=model,
+                    contents=contents,
+                    config=dict(system_instruction=system_instruction)
+                )
+                for chunk in stream:
+                    text = chunk.text
+                    if text:
+                        timer.mark_token()
+                        yield text
+                return
+            except Exception as e:
+                # Once text has been shown the answer cannot be restarted cleanly
+                retryable = timer.first_token is None and is_rate_limit_error(e)
+                if not retryable or attempt == attempts - 1:
+                    raise
+                scheduler.record_retry()
+                time.sleep(scheduler.backoff_delay(attempt))
+    finally:
+        timer.finish()
+
+
+def create_client(api_key: str = None):
+    """Returns a Gemini client, or the offline fake when SERENE_EASE_FAKE_LLM=1."""
+    if USE_FAKE_LLM:
+        return FakeStreamingClient(first_token_delay=FAKE_LLM_FIRST_TOKEN_DELAY,
+                                   words_per_second=FAKE_LLM_WORDS_PER_SECOND)
+    from google import genai
+    return genai.Client(api_key=api_key) if api_key else genai.Client()
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content_stream(self, model: str, contents: str, config=None):
+        client = self._client
+        client.calls += 1
+        words = client.answer_for(contents).split(" ")
+        time.sleep(client.first_token_delay)
+        for i in range(0, len(words), client.words_per_chunk):
+            piece = " ".join(words[i:i + client.words_per_chunk])
+            if i + client.words_per_chunk < len(words):
+                piece += " "
+            yield SimpleNamespace(text=piece)
+            time.sleep(client.words_per_chunk / client.words_per_second)
+
+    def generate_content(self, model: str, contents: str, config=None):
+        return SimpleNamespace(text="".join(c.text for c in self.generate_content_stream(model, contents, config)))
+
+
+class _FakeAsyncModels:
+    """Async counterpart of _FakeModels, exposed as client.aio.models like genai.Client."""
+
+    def __init__(self, client):
+        self._client = client
+
+    async def generate_content(self, model: str, contents: str, config=None):
+        client = self._client
+        client.calls += 1
+        answer = client.answer_for(contents)
+        await asyncio.sleep(client.first_token_delay + len(answer.split(" ")) / client.words_per_second)
+        return SimpleNamespace(text=answer)
+
+
+class FakeStreamingClient:
+    """Offline stand-in for genai.Client with deterministic, streamed output."""
+
+    def __init__(self, answer: str = None, first_token_delay: float = 0.3,
+                 words_per_second: float = 60.0, words_per_chunk: int = 4):
+        self.answer = answer
+        self.first_token_delay = first_token_delay
+        self.words_per_second = words_per_second
+        self.words_per_chunk = words_per_chunk
+        self.calls = 0
+        self.models = _FakeModels(self)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(self))
+
+    def answer_for(self, contents: str) -> str:
+        if self.answer is not None:
+            return self.answer
+        return (
+            "This is an offline test answer. It was generated without calling Gemini, "
+            f"from a prompt of {len(contents)} characters, so streaming, timing and caching "
+            "can be checked locally."
+        )
+
+
+class RateLimitError(Exception):
+    """What FakeRateLimitedClient raises; the message matches Gemini's quota errors."""
+
+
+class FakeRateLimitedClient(FakeStreamingClient):
+    """FakeStreamingClient that rejects calls beyond requests_per_minute with a 429."""
+
+    def __init__(self, requests_per_minute: int = 15, window_s: float = 60.0, **kwargs):
+        super().__init__(**kwargs)
+        self.requests_per_minute = requests_per_minute
+        self.window_s = window_s
+        self.rejected = 0
+        self._accepted = deque()
+        self._lock = threading.Lock()
+        self.models = _RateLimitedModels(self, self.models)
+
+    def admit(self):
+        """Counts one call against the sliding window, raising a 429 when over quota."""
+        with self._lock:
+            now = time.monotonic()
+            while self._accepted and now - self._accepted[0] >= self.window_s:
+                self._accepted.popleft()
+            if len(self._accepted) >= self.requests_per_minute:
+                self.rejected += 1
+                raise RateLimitError("429 RESOURCE_EXHAUSTED: quota exceeded for requests per minute")
+            self._accepted.append(now)
+
+
+class _RateLimitedModels:
+    def __init__(self, client, models):
+        self._client = client
+        self._models = models
+
+    def generate_content_stream(self, model: str, contents: str, config=None):
+        self._client.admit()
+        return self._models.generate_content_stream(model, contents, config)
+
+    def generate_content(self, model: str, contents: str, config=None):
+        self._client.admit()
+        return self._models.generate_content(model, contents, config)
@@ -0,0 +1,179 @@
+# generation_scheduler.py
+
+"""
+Client-side scheduling for Gemini calls.
+
+Instead of failing on 429 / RESOURCE_EXHAUSTED and asking users to come back
+later, every generation goes through a GenerationScheduler:
+
+* token buckets sized to the model's requests-per-minute and tokens-per-minute
+  quotas pace how fast calls are dispatched;
+* a bounded FIFO admission queue holds waiting requests (and rejects new ones
+  when it is full), reporting each waiter's position as QueueStatus updates;
+* calls that still hit a rate limit are retried with exponential backoff and
+  full jitter, re-entering the queue so retries respect the quota too.
+
+wait_turn() is a generator so streaming callers can pass the QueueStatus
+updates through to the UI while they wait.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+
+# --- Configuration (free tier of gemini-2.0-flash) ---
+REQUESTS_PER_MINUTE = 15
+TOKENS_PER_MINUTE = 1_000_000
+BURST_REQUESTS = 3 # requests dispatched back to back before pacing kicks in
+MAX_QUEUE = 50
+MAX_RETRIES = 4
+BASE_DELAY_S = 1.0
+MAX_DELAY_S = 30.0
+POLL_S = 0.5 # how often waiters re-check the queue and report their position
+
+
+class QueueFullError(Exception):
+    """Raised when the admission queue is full."""
+
+
+class QueueStatus:
+    """Progress update yielded while a request waits for its turn."""
+
+    def __init__(self, position: int, wait_s: float, retry: int = 0):
+        self.position = position   # 1 = next to be dispatched
+        self.wait_s = wait_s       # estimated seconds until this request is dispatched
+        self.retry = retry         # retry attempt that is waiting (0 = first try)
+
+    def __repr__(self):
+        return f"QueueStatus(position={self.position}, wait_s={self.wait_s:.2f}, retry={self.retry})"
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 units per second up to capacity. Not thread-safe."""
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until amount units are available (0 when they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class GenerationScheduler:
+    """Paces, queues and retries generation calls against RPM/TPM quotas."""
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = TOKENS_PER_MINUTE, max_queue: int = MAX_QUEUE,
+                 max_retries: int = MAX_RETRIES, base_delay_s: float = BASE_DELAY_S,
+                 max_delay_s: float = MAX_DELAY_S, burst_requests: int = BURST_REQUESTS):
+        if requests_per_minute < 1:
+            raise ValueError(f"requests_per_minute must be at least 1, got {requests_per_minute}")
+        if tokens_per_minute <= 0:
+            raise ValueError(f"tokens_per_minute must be positive, got {tokens_per_minute}")
+        # Up to burst_requests calls go back to back from a full bucket; after
+        # that they are spaced 60 / rpm seconds apart
+        burst_requests = max(1, min(burst_requests, requests_per_minute))
+        self._requests = TokenBucket(requests_per_minute, capacity=burst_requests)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self.dispatched = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def queue_length(self) -> int:
+        with self._condition:
+            return len(self._queue)
+
+    def record_retry(self):
+        """Counts one rate-limited call that is about to be retried."""
+        with self._condition:
+            self.retries += 1
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+        return random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** attempt))
+
+    def wait_turn(self, estimated_tokens: int, retry: int = 0):
+        """
+        Generator that waits in the admission queue until the quota allows one
+        more call, yielding QueueStatus updates meanwhile. Raises QueueFullError
+        when the queue is already full.
+        """
+        ticket = object()
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"Generation queue is full ({self.max_queue} waiting)")
+            self._queue.append(ticket)
+
+        try:
+            while True:
+                with self._condition:
+                    position = self._queue.index(ticket)
+                    wait = max(self._requests.time_until(1), self._tokens.time_until(estimated_tokens))
+                    if position == 0 and wait <= 0:
+                        self._requests.take(1)
+                        self._tokens.take(estimated_tokens)
+                        self._queue.popleft()
+                        self.dispatched += 1
+                        self._condition.notify_all()
+                        return
+                # Everyone ahead needs a request slot of their own
+                yield QueueStatus(position + 1, wait + position / self._requests.rate, retry)
+                with self._condition:
+                    self._condition.wait(timeout=min(max(wait, 0.01), POLL_S))
+        finally:
+            with self._condition:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._condition.notify_all()
+
+    def call(self, fn, estimated_tokens: int, on_status=None):
+        """Runs fn() when the quota allows, retrying rate-limit errors with backoff."""
+        for attempt in range(self.max_retries + 1):
+            for status in self.wait_turn(estimated_tokens, attempt):
+                if on_status is not None:
+                    on_status(status)
+            try:
+                return fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self.record_retry()
+                time.sleep(self.backoff_delay(attempt))
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "queued": len(self._queue),
+                "dispatched": self.dispatched,
+                "retries": self.retries,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,79 @@
+# hnsw_params.py
+
+"""
+HNSW index parameters for the Chroma collection.
+
+construction_ef and M are fixed when embed_data.py creates the collection.
+search_ef can be changed on an existing collection (chromadb >= 1.0), but
+Chroma has no per-query ef: set_search_ef() rewrites the stored collection
+configuration, so only the process that owns the index calls it
+(embed_data.py, and hnsw_sweep.py on its scratch collections). The query
+side (app.py, rag_system.py, query_db.py) only compares its HNSW_SEARCH_EF
+with the stored value and warns when they differ. Use
+benchmarks/hnsw_sweep.py to pick the cheapest combination that meets the
+recall target.
+
+Chroma's own defaults are construction_ef=100, M=16, search_ef=10.
+"""
+
+# --- Configuration ---
+HNSW_SPACE = "cosine"
+HNSW_CONSTRUCTION_EF = 100
+HNSW_M = 16
+HNSW_SEARCH_EF = 10
+
+
+def hnsw_metadata(space: str = HNSW_SPACE, construction_ef: int = HNSW_CONSTRUCTION_EF, m: int = HNSW_M,
+                  search_ef: int = HNSW_SEARCH_EF) -> dict:
+    """Collection metadata that configures the HNSW index at creation time."""
+    return {
+        "hnsw:space": space,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:M": m,
+        "hnsw:search_ef": search_ef,
+    }
+
+
+def stored_search_ef(collection):
+    """The search_ef a Chroma collection is configured with, or None when it cannot be read."""
+    try:
+        hnsw = (getattr(collection, "configuration", None) or {}).get("hnsw") or {}
+    except AttributeError: # chromadb < 1.0 has no configuration dict
+        hnsw = {}
+    search_ef = hnsw.get("ef_search") if isinstance(hnsw, dict) else None
+    if search_ef is None:
+        search_ef = (getattr(collection, "metadata", None) or {}).get("hnsw:search_ef")
+    return search_ef
+
+
+def set_search_ef(collection, search_ef: int) -> bool:
+    """
+    Persistently sets search_ef on an existing collection; None keeps the
+    value it was built with, and a collection already at search_ef is left
+    untouched. This writes the stored collection configuration, so every
+    later reader sees it: call it only where the index is built or owned.
+    Returns False when the collection cannot change it in place (the NumPy
+    backend, which is exact, or chromadb < 1.0, where the index has to be
+    rebuilt with the new search_ef).
+    """
+    if search_ef is None or not hasattr(collection, "modify"):
+        return False
+    if stored_search_ef(collection) == search_ef:
+        return True
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+    except TypeError:
+        return False
+    return True
+
+
+def search_ef_warning(collection, search_ef: int):
+    """
+    Read-only check for the query side: a message when the collection's
+    search_ef differs from the requested one, else None.
+    """
+    stored = stored_search_ef(collection)
+    if search_ef is None or stored is None or stored == search_ef:
+        return None
+    return (f"The collection searches with search_ef={stored}, not HNSW_SEARCH_EF={search_ef}. "
+            f"Set SEARCH_EF in embed_data.py and re-run it to change the index.")
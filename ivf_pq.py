@@ -0,0 +1,497 @@
+# ivf_pq.py
+
+"""
+IVF-PQ approximate vector search for corpora too large to keep in RAM.
+
+Vectors are assigned to one of n_lists coarse k-means clusters (the inverted
+file) and the residual to their centroid is product-quantized: split into m
+sub-vectors, each replaced by the index of its nearest of 256 sub-centroids.
+A 384-dim float32 vector (1536 bytes) becomes m bytes of codes, which are
+kept on disk and memory-mapped. A query scores only the nprobe clusters whose
+centroids are closest, using one lookup table of query / sub-centroid dot
+products (asymmetric distance computation):
+
+    score(x) ~= q . centroid(x) + sum_j LUT[j, code_j(x)]
+
+PQ alone ranks near neighbours coarsely, so by default a float16 copy of
+each vector is also appended to disk (never scanned, only memory-mapped):
+the best REFINE_FACTOR * k candidates by PQ score are re-ranked with it.
+
+New chunks are encoded with the trained centroids and codebooks and appended
+to the code files, so adding them needs no retraining; embed_and_store
+updates an existing index this way (update_ivfpq_index). Deleted rows are
+tombstoned rather than rewritten, and adding an id that is already stored
+tombstones its old row, so the index behaves like an upserting collection.
+Retrain (rebuild) when the corpus has drifted far from the training sample
+or too many rows are tombstoned. Training uses a uniform random sample of the
+collection, not its first rows, so the centroids do not favour whatever was
+indexed first.
+
+Chunk text and metadata are not held in memory: the collection keeps each
+record's byte offset in records.jsonl and an id -> row dict, and reads
+documents only for the rows a query or get() returns.
+
+IVFPQCollection exposes the same subset of the Chroma Collection API as
+vector_engine.BruteForceCollection (query, get, count, name, metadata), plus
+add(), delete() and modify().
+
+On-disk layout (written by export_ivfpq_index / IVFPQCollection.add):
+    <path>/manifest.json    name, collection metadata and the trained sizes
+    <path>/centroids.npy    (n_lists, dimension) float32 coarse centroids
+    <path>/codebooks.npy    (m, ksub, dimension / m) float32 PQ sub-centroids
+    <path>/codes.bin        uint8, m codes per vector, append-only
+    <path>/lists.bin        int32 coarse list of each vector, append-only
+    <path>/refine.bin       optional float16 vectors for re-ranking, append-only
+    <path>/records.jsonl    id, document and metadata of each vector, append-only
+    <path>/deleted.bin      int64 row numbers of deleted vectors, append-only
+"""
+
+import json
+import math
+import os
+import threading
+from array import array
+
+import numpy as np
+
+from retrieval_filters import MetadataBitmaps
+from vector_engine import normalize_rows
+
+# --- Configuration ---
+NPROBE = 8              # coarse lists scanned per query
+PQ_SUBVECTORS = 48      # m; 384 / 48 = 8 dims per code byte
+PQ_CENTROIDS = 256      # ksub; codes fit one byte
+REFINE_FACTOR = 10      # PQ shortlist size, as a multiple of n_results, re-ranked in float16
+TRAIN_SIZE = 100_000    # vectors sampled to train centroids and codebooks
+KMEANS_ITERATIONS = 20
+SEED = 13
+
+MANIFEST_FILE = 'manifest.json'
+CENTROIDS_FILE = 'centroids.npy'
+CODEBOOKS_FILE = 'codebooks.npy'
+CODES_FILE = 'codes.bin'
+LISTS_FILE = 'lists.bin'
+REFINE_FILE = 'refine.bin'
+RECORDS_FILE = 'records.jsonl'
+DELETED_FILE = 'deleted.bin'
+
+
+def default_n_lists(n_vectors: int) -> int:
+    """About 4 * sqrt(N) lists, keeping at least ~39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39 or 1))
+
+
+def _subvector_count(dimension: int, m: int) -> int:
+    """Largest m' <= m that divides the dimension."""
+    return max(d for d in range(1, min(m, dimension) + 1) if dimension % d == 0)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 16384) -> np.ndarray:
+    """Index of the nearest centroid (L2) for each vector."""
+    half_norms = 0.5 * (centroids ** 2).sum(axis=1)
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_rows):
+        block = vectors[start:start + block_rows]
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return assignment
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = SEED) -> np.ndarray:
+    """Lloyd's k-means from k random points; empty clusters are reseeded from random points."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        # Sum each cluster's members with one sort + reduceat instead of a scatter-add
+        order = np.argsort(assignment, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.add.reduceat(vectors[order], starts[~empty], axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+    return centroids.astype(np.float32)
+
+
+def train_ivfpq(vectors: np.ndarray, n_lists: int = None, m: int = PQ_SUBVECTORS, ksub: int = PQ_CENTROIDS,
+                iterations: int = KMEANS_ITERATIONS, seed: int = SEED):
+    """Trains coarse centroids and residual PQ codebooks on (a sample of) normalized vectors."""
+    vectors = normalize_rows(vectors)
+    n_lists = n_lists or default_n_lists(len(vectors))
+    centroids = kmeans(vectors, n_lists, iterations, seed)
+    residuals = vectors - centroids[_nearest(vectors, centroids)]
+
+    m = _subvector_count(vectors.shape[1], m)
+    dsub = vectors.shape[1] // m
+    ksub = min(ksub, len(vectors))
+    codebooks = np.stack([
+        kmeans(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]), ksub, iterations, seed + j)
+        for j in range(m)
+    ])
+    return centroids, codebooks
+
+
+def encode(vectors: np.ndarray, centroids: np.ndarray, codebooks: np.ndarray):
+    """Returns (coarse list, PQ codes) of normalized vectors."""
+    lists = _nearest(vectors, centroids)
+    residuals = vectors - centroids[lists]
+    m, _ksub, dsub = codebooks.shape
+    codes = np.empty((len(vectors), m), dtype=np.uint8)
+    for j in range(m):
+        codes[:, j] = _nearest(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]), codebooks[j])
+    return lists, codes
+
+
+def create_ivfpq_index(path: str, centroids: np.ndarray, codebooks: np.ndarray, name: str = 'vectors',
+                       metadata: dict = None, refine: bool = True):
+    """Writes an empty, trained index; fill it with IVFPQCollection(path).add(...)."""
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, CENTROIDS_FILE), centroids.astype(np.float32))
+    np.save(os.path.join(path, CODEBOOKS_FILE), codebooks.astype(np.float32))
+    for file_name in (CODES_FILE, LISTS_FILE, REFINE_FILE, RECORDS_FILE, DELETED_FILE):
+        open(os.path.join(path, file_name), 'wb').close()
+    _write_manifest(path, {
+        'name': name,
+        'metadata': dict(metadata or {}),
+        'dimension': int(centroids.shape[1]),
+        'n_lists': int(centroids.shape[0]),
+        'm': int(codebooks.shape[0]),
+        'ksub': int(codebooks.shape[1]),
+        'refine': refine,
+    })
+
+
+def _write_manifest(path: str, manifest: dict):
+    partial = os.path.join(path, MANIFEST_FILE + '.tmp')
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(partial, os.path.join(path, MANIFEST_FILE))
+
+
+def sample_embeddings(collection, size: int, batch_size: int = 5000, seed: int = SEED) -> np.ndarray:
+    """
+    A uniform random sample of size embeddings from a Chroma collection (all
+    of them when it holds fewer), read page by page; pages with no sampled
+    row are not read.
+    """
+    total = collection.count()
+    positions = np.sort(np.random.default_rng(seed).choice(total, size=min(size, total), replace=False))
+    sample = []
+    for offset in range(0, total, batch_size):
+        picked = positions[np.searchsorted(positions, offset):np.searchsorted(positions, offset + batch_size)]
+        if len(picked):
+            batch = collection.get(include=['embeddings'], limit=batch_size, offset=offset)
+            sample.append(np.asarray(batch['embeddings'], dtype=np.float32)[picked - offset])
+    return np.concatenate(sample) if sample else np.zeros((0, 0), dtype=np.float32)
+
+
+def export_ivfpq_index(collection, path: str, n_lists: int = None, train_size: int = TRAIN_SIZE,
+                       batch_size: int = 5000, refine: bool = True):
+    """
+    Trains an IVF-PQ index on a random sample of train_size embeddings of a
+    Chroma collection and encodes the whole collection into it, batch by batch.
+    """
+    total = collection.count()
+    centroids, codebooks = train_ivfpq(sample_embeddings(collection, train_size, batch_size),
+                                       n_lists or default_n_lists(total))
+    create_ivfpq_index(path, centroids, codebooks, collection.name, collection.metadata, refine)
+
+    index = IVFPQCollection(path)
+    for offset in range(0, total, batch_size):
+        batch = collection.get(include=['embeddings', 'documents', 'metadatas'], limit=batch_size, offset=offset)
+        index.add(batch['ids'], batch['embeddings'], batch['documents'], batch['metadatas'])
+    return index.count()
+
+
+def update_ivfpq_index(collection, path: str, ids, deleted_ids, batch_size: int = 5000):
+    """
+    Brings an index exported from collection up to date without retraining:
+    deleted_ids are tombstoned and the rows of ids (new or changed chunks) are
+    read back from the collection and added, replacing any older copy. The
+    manifest then takes the collection's current metadata. Returns the index.
+    """
+    index = IVFPQCollection(path)
+    index.delete(deleted_ids)
+    ids = sorted(ids)
+    for start in range(0, len(ids), batch_size):
+        batch = collection.get(ids=ids[start:start + batch_size], include=['embeddings', 'documents', 'metadatas'])
+        index.add(batch['ids'], batch['embeddings'], batch['documents'], batch['metadatas'])
+    index.modify(metadata=collection.metadata)
+    return index
+
+
+class _MetadataColumn:
+    """The metadata of the first count records, streamed from records.jsonl for MetadataBitmaps."""
+
+    def __init__(self, path: str, count: int):
+        self._path = path
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        with open(self._path, 'rb') as f:
+            for _, line in zip(range(self._count), f):
+                yield json.loads(line)['metadata']
+
+
+class IVFPQCollection:
+    """
+    Memory-mapped IVF-PQ collection with approximate cosine top-k search.
+    Only the byte offset of each record, an id -> row dict and one deleted
+    flag per row stay in RAM; documents and metadata are read from
+    records.jsonl for the rows returned.
+    """
+
+    def __init__(self, path: str, embedding_function=None, nprobe: int = NPROBE):
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        self.path = path
+        self._manifest = manifest
+        self.name = manifest['name']
+        self.metadata = manifest.get('metadata', {})
+        self.nprobe = nprobe
+        self._m = manifest['m']
+        self._dimension = manifest['dimension']
+        self._refine_enabled = manifest.get('refine', False)
+        self._centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+        self._codebooks = np.load(os.path.join(path, CODEBOOKS_FILE))
+        self._embedding_function = embedding_function
+        self._lock = threading.Lock()
+        self._records_file = os.path.join(path, RECORDS_FILE)
+
+        # Start offset of each record plus the end of the last one; a trailing
+        # line without a newline is an interrupted add and is ignored. A row is
+        # dead when it was deleted or its id was added again later.
+        deleted = set(self._read_deleted())
+        dead = []
+        self._offsets = array('Q', [0])
+        self._rows = {}
+        with open(self._records_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                row = len(self._offsets) - 1
+                self._offsets.append(self._offsets[-1] + len(line))
+                if row in deleted:
+                    dead.append(row)
+                    continue
+                chunk_id = json.loads(line)['id']
+                if chunk_id in self._rows:
+                    dead.append(self._rows[chunk_id])
+                self._rows[chunk_id] = row
+        self._deleted = np.zeros(self._total(), dtype=bool)
+        self._deleted[dead] = True
+        self._map_codes()
+
+        # Rows grouped by coarse list: list c holds _order[_bounds[c]:_bounds[c + 1]]
+        self._order = np.argsort(self._lists, kind='stable').astype(np.int64)
+        self._bounds = np.searchsorted(self._lists[self._order], np.arange(len(self._centroids) + 1))
+
+    def _read_deleted(self) -> np.ndarray:
+        """Row numbers in deleted.bin, ignoring a half-written last entry."""
+        deleted_file = os.path.join(self.path, DELETED_FILE)
+        if not os.path.exists(deleted_file):
+            return np.zeros(0, dtype=np.int64)
+        count = os.path.getsize(deleted_file) // 8
+        return np.fromfile(deleted_file, dtype='<i8', count=count)
+
+    def _map_codes(self):
+        """Maps the code files for the current row count and resets the metadata bitmaps."""
+        count = self._total()
+        self._codes = self._map(CODES_FILE, np.uint8, (count, self._m))
+        self._lists = self._map(LISTS_FILE, np.int32, (count,))
+        self._refine = self._map(REFINE_FILE, np.float16, (count, self._dimension)) if self._refine_enabled else None
+        self._bitmaps = MetadataBitmaps(_MetadataColumn(self._records_file, count))
+
+    def _map(self, name: str, dtype, shape):
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode='r', shape=shape)
+
+    def _read_records(self, rows) -> list:
+        """The stored {'id', 'document', 'metadata'} of each row, read by byte offset."""
+        records = []
+        with open(self._records_file, 'rb') as f:
+            for row in rows:
+                f.seek(self._offsets[row])
+                records.append(json.loads(f.read(self._offsets[row + 1] - self._offsets[row])))
+        return records
+
+    @property
+    def embedding_function(self):
+        if self._embedding_function is None:
+            # Same default encoder embed_and_store indexes with (see embedding_backends.py)
+            from embedding_backends import create_encoder
+            self._embedding_function = create_encoder()
+        return self._embedding_function
+
+    def _total(self) -> int:
+        """Rows stored, deleted ones included."""
+        return len(self._offsets) - 1
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def deleted_fraction(self) -> float:
+        """Share of stored rows that are tombstoned; rebuild when it grows large."""
+        return 1.0 - self.count() / self._total() if self._total() else 0.0
+
+    def modify(self, metadata: dict):
+        """Replaces the collection metadata kept in the manifest."""
+        with self._lock:
+            self.metadata = dict(metadata or {})
+            self._manifest = {**self._manifest, 'metadata': self.metadata}
+            _write_manifest(self.path, self._manifest)
+
+    def delete(self, ids):
+        """Tombstones the rows of the given ids; unknown ids are ignored."""
+        with self._lock:
+            rows = [self._rows.pop(str(chunk_id)) for chunk_id in ids if str(chunk_id) in self._rows]
+            if not rows:
+                return
+            deleted_file = os.path.join(self.path, DELETED_FILE)
+            if os.path.exists(deleted_file):
+                os.truncate(deleted_file, os.path.getsize(deleted_file) // 8 * 8)
+            with open(deleted_file, 'ab') as f:
+                f.write(np.asarray(rows, dtype='<i8').tobytes())
+            self._deleted[rows] = True
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        """
+        Encodes new vectors with the trained centroids and codebooks and
+        appends them. An id that is already stored replaces its old row.
+        """
+        vectors = normalize_rows(embeddings)
+        lists, codes = encode(vectors, self._centroids, self._codebooks)
+        documents = documents if documents is not None else [""] * len(ids)
+        metadatas = metadatas if metadatas is not None else [{} for _ in ids]
+        lines = [
+            (json.dumps({'id': str(chunk_id), 'document': document, 'metadata': metadata}) + "\n").encode('utf-8')
+            for chunk_id, document, metadata in zip(ids, documents, metadatas)
+        ]
+        with self._lock:
+            # Records last: on load, rows are counted from records.jsonl, and
+            # codes of an add that never reached it are cut off here
+            count = self._total()
+            os.truncate(os.path.join(self.path, CODES_FILE), count * self._m)
+            os.truncate(os.path.join(self.path, LISTS_FILE), count * np.dtype(np.int32).itemsize)
+            if self._refine_enabled:
+                os.truncate(os.path.join(self.path, REFINE_FILE), count * self._dimension * 2)
+                with open(os.path.join(self.path, REFINE_FILE), 'ab') as f:
+                    f.write(vectors.astype(np.float16).tobytes())
+            with open(os.path.join(self.path, CODES_FILE), 'ab') as f:
+                f.write(codes.tobytes())
+            with open(os.path.join(self.path, LISTS_FILE), 'ab') as f:
+                f.write(lists.astype(np.int32).tobytes())
+            os.truncate(self._records_file, self._offsets[-1])
+            with open(self._records_file, 'ab') as f:
+                f.writelines(lines)
+
+            # Replaced rows need no tombstone on disk: on load, a later row with the same id wins
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(lines), dtype=bool)])
+            for row, (chunk_id, line) in enumerate(zip(ids, lines), start=count):
+                replaced = self._rows.get(str(chunk_id))
+                if replaced is not None:
+                    self._deleted[replaced] = True
+                self._rows[str(chunk_id)] = row
+                self._offsets.append(self._offsets[-1] + len(line))
+            # Merge the batch into the inverted lists: each new row goes to the end of its list
+            batch_order = np.argsort(lists, kind='stable')
+            self._order = np.insert(self._order, self._bounds[lists[batch_order] + 1],
+                                    count + batch_order.astype(np.int64))
+            per_list = np.bincount(lists, minlength=len(self._centroids))
+            self._bounds = self._bounds + np.concatenate([[0], np.cumsum(per_list)])
+            self._map_codes()
+
+    def _decode(self, positions) -> np.ndarray:
+        """Approximate float32 vectors of the given rows."""
+        if self._refine is not None:
+            return np.asarray(self._refine[positions], dtype=np.float32)
+        codes = np.asarray(self._codes[positions])
+        m, _ksub, dsub = self._codebooks.shape
+        residuals = np.concatenate([self._codebooks[j][codes[:, j]] for j in range(m)], axis=1) if len(codes) \
+            else np.zeros((0, m * dsub), dtype=np.float32)
+        return self._centroids[np.asarray(self._lists[positions])] + residuals
+
+    def _search(self, query: np.ndarray, k: int, nprobe: int, mask):
+        """Top-k (row numbers, approximate scores) for one normalized query."""
+        coarse = self._centroids @ query
+        nprobe = min(nprobe, len(coarse))
+        probed = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+        rows = np.concatenate([self._order[self._bounds[c]:self._bounds[c + 1]] for c in probed])
+        if mask is not None:
+            rows = rows[mask[rows]]
+        if self.count() < self._total():
+            rows = rows[~self._deleted[rows]]
+        if len(rows) == 0:
+            return rows, np.zeros(0, dtype=np.float32)
+
+        m, _ksub, dsub = self._codebooks.shape
+        lut = np.einsum('jkd,jd->jk', self._codebooks, query.reshape(m, dsub))
+        rows.sort() # ascending reads from the memory map
+        codes = np.asarray(self._codes[rows])
+        scores = coarse[np.asarray(self._lists[rows])] + lut[np.arange(m), codes].sum(axis=1)
+
+        shortlist = min(k * REFINE_FACTOR if self._refine is not None else k, len(rows))
+        top = np.argpartition(-scores, shortlist - 1)[:shortlist]
+        rows, scores = rows[top], scores[top]
+        if self._refine is not None:
+            order = np.argsort(rows)
+            rows = rows[order]
+            scores = np.asarray(self._refine[rows], dtype=np.float32) @ query
+        top = np.argsort(-scores, kind='stable')[:k]
+        return rows[top], scores[top]
+
+    def query(self, query_texts=None, query_embeddings=None, n_results: int = 10,
+              include=('metadatas', 'documents', 'distances'), where=None, nprobe: int = None):
+        """
+        Approximate top-k search over the nprobe closest lists, returning
+        results in Chroma's query() format. A 'where' clause restricts the
+        candidates to the rows selected by the metadata bitmaps.
+        """
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts))
+        queries = normalize_rows(query_embeddings)
+        mask = self._bitmaps.mask(where) if where else None
+
+        results = {'ids': [], 'documents': None, 'metadatas': None, 'distances': None,
+                   'embeddings': None, 'included': list(include)}
+        for key in ('documents', 'metadatas', 'distances'):
+            if key in include:
+                results[key] = []
+        for query in queries:
+            rows, scores = self._search(query, n_results, nprobe or self.nprobe, mask)
+            records = self._read_records(rows)
+            results['ids'].append([record['id'] for record in records])
+            if 'documents' in include:
+                results['documents'].append([record['document'] for record in records])
+            if 'metadatas' in include:
+                results['metadatas'].append([record['metadata'] for record in records])
+            if 'distances' in include:
+                results['distances'].append((1.0 - scores).tolist())
+        return results
+
+    def get(self, ids=None, include=('metadatas', 'documents'), limit=None, offset=0, where=None):
+        """Fetches stored records by id or by position, in Chroma's get() format."""
+        if ids is not None:
+            positions = sorted({self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows})
+        else:
+            end = None if limit is None else offset + limit
+            positions = np.flatnonzero(~self._deleted)[offset:end].tolist()
+        if where:
+            mask = self._bitmaps.mask(where)
+            positions = [i for i in positions if mask[i]]
+
+        records = self._read_records(positions)
+        return {
+            'ids': [record['id'] for record in records],
+            'documents': [record['document'] for record in records] if 'documents' in include else None,
+            'metadatas': [record['metadata'] for record in records] if 'metadatas' in include else None,
+            'embeddings': self._decode(positions) if 'embeddings' in include else None,
+            'included': list(include),
+        }
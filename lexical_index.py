@@ -0,0 +1,184 @@
+# lexical_index.py
+
+"""
+BM25 inverted index and hybrid (lexical + vector) retrieval.
+
+Chunk texts produced by clean_data.py are already lowercase, stop-word free
+and lemmatized, so they are indexed by splitting on whitespace. The index is a
+compact set of NumPy arrays written next to the Chroma collection:
+
+    <path>/term_offsets.npy   postings of term t are [term_offsets[t], term_offsets[t + 1])
+    <path>/postings_docs.npy  int32 document numbers, grouped by term
+    <path>/postings_tf.npy    int32 term frequencies, parallel to postings_docs
+    <path>/doc_lengths.npy    int32 token count of each document
+    <path>/vocab.json         sorted term list, chunk ids and filterable metadata of the documents
+    <path>/manifest.json      document and term counts and the 'built_at' of the source collection
+
+IDF and the average document length are corpus-wide and the postings are
+packed term by term, so adding or removing one chunk moves most offsets; the
+index is rebuilt whole, and embed_and_store only does so when the collection
+changed.
+
+hybrid_query fuses the BM25 ranking with the vector ranking using reciprocal
+rank fusion, which needs no score calibration between the two.
+"""
+
+import json
+import math
+import os
+from collections import Counter
+
+import numpy as np
+
+from retrieval_filters import INDEXED_KEYS, MetadataBitmaps
+from text_cleaning import tokenize_query
+
+# --- Configuration ---
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60          # rank constant from the original reciprocal rank fusion paper
+CANDIDATES = 20     # results taken from each ranker before fusion
+
+
+def build_inverted_index(ids, documents, path: str, metadatas=None, collection_metadata=None):
+    """
+    Builds the BM25 postings for (id, cleaned text) pairs and writes them to
+    path, keeping the filterable metadata keys so searches can be pre-filtered.
+    metadatas is read after documents has been consumed. The 'built_at' of
+    collection_metadata is recorded in the manifest.
+    """
+    postings = {}
+    doc_lengths = []
+    for doc_number, text in enumerate(documents):
+        tokens = str(text).split()
+        doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term, []).append((doc_number, tf))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for t, term in enumerate(terms):
+        offsets[t + 1] = offsets[t] + len(postings[term])
+
+    docs = np.empty(offsets[-1], dtype=np.int32)
+    tfs = np.empty(offsets[-1], dtype=np.int32)
+    for t, term in enumerate(terms):
+        entries = np.asarray(postings[term], dtype=np.int32)
+        docs[offsets[t]:offsets[t + 1]] = entries[:, 0]
+        tfs[offsets[t]:offsets[t + 1]] = entries[:, 1]
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'term_offsets.npy'), offsets)
+    np.save(os.path.join(path, 'postings_docs.npy'), docs)
+    np.save(os.path.join(path, 'postings_tf.npy'), tfs)
+    np.save(os.path.join(path, 'doc_lengths.npy'), np.asarray(doc_lengths, dtype=np.int32))
+    with open(os.path.join(path, 'vocab.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'terms': terms,
+            'ids': [str(i) for i in ids],
+            'metadatas': [
+                {key: metadata.get(key) for key in INDEXED_KEYS if metadata.get(key) is not None}
+                for metadata in (metadatas or [{} for _ in ids])
+            ],
+        }, f)
+    with open(os.path.join(path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        built_at = (collection_metadata or {}).get('built_at')
+        json.dump({
+            'count': len(doc_lengths),
+            'terms': len(terms),
+            'metadata': {'built_at': built_at} if built_at is not None else {},
+        }, f, indent=2)
+    return len(terms)
+
+
+class BM25Index:
+    """Memory-mapped BM25 index over the cleaned chunk texts."""
+
+    def __init__(self, path: str, k1: float = BM25_K1, b: float = BM25_B):
+        with open(os.path.join(path, 'vocab.json'), encoding='utf-8') as f:
+            vocab = json.load(f)
+        self.ids = vocab['ids']
+        self.bitmaps = MetadataBitmaps(vocab.get('metadatas') or [{} for _ in self.ids])
+        self.term_numbers = {term: t for t, term in enumerate(vocab['terms'])}
+        self.offsets = np.load(os.path.join(path, 'term_offsets.npy'), mmap_mode='r')
+        self.docs = np.load(os.path.join(path, 'postings_docs.npy'), mmap_mode='r')
+        self.tfs = np.load(os.path.join(path, 'postings_tf.npy'), mmap_mode='r')
+        self.doc_lengths = np.load(os.path.join(path, 'doc_lengths.npy'))
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+
+    @classmethod
+    def load(cls, path: str):
+        """Returns the index at path, or None when it has not been built."""
+        if not os.path.exists(os.path.join(path, 'vocab.json')):
+            return None
+        return cls(path)
+
+    def search(self, query_text: str, k: int = CANDIDATES, where=None):
+        """
+        Returns up to k (chunk_id, bm25_score) pairs, best first. Postings of
+        documents excluded by the 'where' clause are skipped.
+        """
+        n_docs = len(self.ids)
+        allowed = self.bitmaps.mask(where) if where else None
+        scores = {}
+        for term in set(tokenize_query(query_text)):
+            t = self.term_numbers.get(term)
+            if t is None:
+                continue
+            start, end = int(self.offsets[t]), int(self.offsets[t + 1])
+            docs = np.asarray(self.docs[start:end])
+            tfs = np.asarray(self.tfs[start:end], dtype=np.float32)
+            idf = math.log(1.0 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            if allowed is not None:
+                keep = allowed[docs]
+                docs, tfs = docs[keep], tfs[keep]
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[docs] / self.avg_length)
+            term_scores = idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+            for doc, score in zip(docs.tolist(), term_scores.tolist()):
+                scores[doc] = scores.get(doc, 0.0) + score
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[doc], score) for doc, score in best]
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """Fuses several ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+def hybrid_query(collection, index, query_text: str, n_results: int, query_embedding=None,
+                 candidates: int = CANDIDATES, include=('documents', 'metadatas'), where=None):
+    """
+    Runs vector and BM25 retrieval, fuses them with RRF and returns the top
+    n_results in Chroma's query() format (single query, without distances).
+    """
+    if query_embedding is not None:
+        query_args = dict(query_embeddings=[query_embedding])
+    else:
+        query_args = dict(query_texts=[query_text])
+    vector = collection.query(**query_args, n_results=candidates, include=list(include), where=where)
+    lexical = index.search(query_text, candidates, where=where)
+
+    fused = reciprocal_rank_fusion([vector['ids'][0], [chunk_id for chunk_id, _ in lexical]])[:n_results]
+
+    # Documents found only by BM25 still need their text and metadata
+    records = {}
+    for position, chunk_id in enumerate(vector['ids'][0]):
+        records[chunk_id] = {key: vector[key][0][position] for key in include}
+    missing = [chunk_id for chunk_id in fused if chunk_id not in records]
+    if missing:
+        extra = collection.get(ids=missing, include=list(include))
+        for position, chunk_id in enumerate(extra['ids']):
+            records[chunk_id] = {key: extra[key][position] for key in include}
+
+    fused = [chunk_id for chunk_id in fused if chunk_id in records]
+    results = {'ids': [fused], 'distances': None, 'embeddings': None, 'included': list(include)}
+    for key in ('documents', 'metadatas'):
+        results[key] = [[records[chunk_id][key] for chunk_id in fused]] if key in include else None
+    return results
@@ -0,0 +1,100 @@
+# query_cache.py
+
+"""
+Bounded LRU cache of query embeddings.
+
+Repeated questions (or ones that differ only by case and whitespace) are
+encoded once and then served from memory, so collection.query can be called
+with query_embeddings instead of re-running the embedding model.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# --- Configuration ---
+MAX_ENTRIES = 2048
+MAX_BYTES = 16 * 1024 * 1024  # 16 MB of float32 vectors
+
+
+def normalize_query(text: str) -> str:
+    """Cache key: lowercase with all runs of whitespace collapsed."""
+    return " ".join(str(text).lower().split())
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of query vectors, bounded by entry count and total bytes."""
+
+    def __init__(self, embedding_function, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.embedding_function = embedding_function
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query_text: str) -> np.ndarray:
+        """Returns the float32 embedding for query_text, encoding it on a miss."""
+        key = normalize_query(query_text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            self.misses += 1
+
+        # Encode outside the lock so other sessions are not blocked on the model
+        vector = np.asarray(self.embedding_function([key])[0], dtype=np.float32)
+        self.put(key, vector)
+        return vector
+
+    def get_many(self, query_texts) -> list:
+        """Returns embeddings for several queries, encoding all misses in one call."""
+        keys = [normalize_query(text) for text in query_texts]
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    vectors[key] = vector
+                else:
+                    self.misses += 1
+
+        missing = list(dict.fromkeys(key for key in keys if key not in vectors))
+        if missing:
+            for key, vector in zip(missing, self.embedding_function(missing)):
+                vectors[key] = np.asarray(vector, dtype=np.float32)
+                self.put(key, vectors[key])
+        return [vectors[key] for key in keys]
+
+    def put(self, key: str, vector: np.ndarray):
+        """Stores a vector under an already-normalized key and evicts down to the limits."""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = vector
+            self._bytes += vector.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
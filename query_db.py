@@ -1,55 +1,234 @@
 # query_db.py
 
-import chromadb
+import argparse
+import json
+import time
+
+import os
+
+from embedding_backends import EncoderMismatchError, check_encoder, create_encoder
+from embedding_cache import with_cache
+from hnsw_params import search_ef_warning
+from retrieval_filters import build_where
 
 # --- Configuration ---
-MODEL_NAME = 'all-MiniLM-L6-v2' 
+MODEL_NAME = 'all-MiniLM-L6-v2'
 CHROMA_PATH = 'chroma_db_serene_ease'
 COLLECTION_NAME = f"mental_health_chunks_{MODEL_NAME.split('-')[0]}"
+HNSW_SEARCH_EF = None # Expected search_ef, checked against the index (see hnsw_params.py); None skips the check
+# Query encoder (see embedding_backends.py); must match the model and variant embed_data.py indexed with
+EMBEDDING_BACKEND = 'onnx'
+# Persistent embedding cache shared with embed_data.py (see embedding_cache.py)
+USE_EMBEDDING_CACHE = True
+EMBEDDING_CACHE_PATH = 'embedding_cache'
+
+# Resident retrieval service (see retrieval_service.py). When set, queries are
+# sent to the warm daemon instead of reopening the database in this process.
+SERVICE_ADDRESS = os.getenv("SERENE_EASE_SERVICE")
+
+# Batch mode
+BATCH_SIZE = 64 # Questions sent to collection.query per call
+
+def open_encoder():
+    """The configured query encoder, behind the persistent cache when enabled."""
+    encoder = create_encoder(EMBEDDING_BACKEND, MODEL_NAME)
+    return with_cache(encoder, EMBEDDING_CACHE_PATH) if USE_EMBEDDING_CACHE else encoder
+
+def open_collection(encoder):
+    """Opens the Chroma collection with encoder, refusing one built with a different model."""
+    # Imported here so thin clients of the retrieval service never load Chroma
+    import chromadb
+
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    collection = client.get_collection(name=COLLECTION_NAME, embedding_function=encoder)
+    if (warning := search_ef_warning(collection, HNSW_SEARCH_EF)):
+        print(f"WARNING: {warning}")
+    check_encoder(collection.metadata, encoder)
+    return collection
+
+def search_collection(collection, query_text: str, n_results: int = 3, where=None):
+    """Runs a single similarity search and returns the raw Chroma results."""
+    # Chroma automatically uses the embedding model defined during the 'add' process
+    return collection.query(
+        query_texts=[query_text],
+        n_results=n_results,
+        include=['documents', 'metadatas', 'distances'],
+        where=where
+    )
+
+def print_results(results, n_results: int):
+    """Formats and displays the top retrieved contexts."""
+    print("\n--- Top Retrieved Contexts ---")
+
+    # Process the results dictionary (the collection may hold fewer than n_results chunks)
+    for i in range(min(n_results, len(results['documents'][0]))):
+        source = results['metadatas'][0][i]['source']
+        url = results['metadatas'][0][i]['url']
+        document = results['documents'][0][i]
+        distance = results['distances'][0][i]
 
-def query_vector_db(query_text: str, n_results: int = 3):
+        print(f"\n#️⃣ Result {i+1} (Similarity Distance: {distance:.4f})")
+        print(f"Source: **{source}**")
+        print(f"URL: {url}")
+        print(f"Snippet: *{document[:200]}...*") # Print the first 200 characters
+
+def query_vector_db(query_text: str, n_results: int = 3, sources_allow=None, sources_deny=None,
+                    article_ids=None):
     """
     Connects to the ChromaDB, queries the collection with the provided text,
     and returns the top N most relevant chunks.
+
+    sources_allow / sources_deny (domains such as 'nhs.uk') and article_ids
+    are pushed down to the search as a 'where' clause.
     """
+    where = build_where(sources_allow, sources_deny, article_ids)
+    if SERVICE_ADDRESS:
+        return query_vector_db_remote(query_text, n_results, where)
+
     try:
         # 1. Initialize ChromaDB Client
-        client = chromadb.PersistentClient(path=CHROMA_PATH)
-        collection = client.get_collection(name=COLLECTION_NAME)
-        
+        collection = open_collection(open_encoder())
+
         print(f"Searching database for: **'{query_text}'**")
-        
+
         # 2. Perform the Query
-        # Chroma automatically uses the embedding model defined during the 'add' process
-        results = collection.query(
-            query_texts=[query_text],
-            n_results=n_results,
-            include=['documents', 'metadatas', 'distances']
-        )
-        
+        results = search_collection(collection, query_text, n_results, where)
+
         # 3. Format and Display Results
-        print("\n--- Top Retrieved Contexts ---")
-        
-        # Process the results dictionary
-        for i in range(n_results):
-            source = results['metadatas'][0][i]['source']
-            url = results['metadatas'][0][i]['url']
-            document = results['documents'][0][i]
-            distance = results['distances'][0][i]
-            
-            print(f"\n#️⃣ Result {i+1} (Similarity Distance: {distance:.4f})")
-            print(f"Source: **{source}**")
-            print(f"URL: {url}")
-            print(f"Snippet: *{document[:200]}...*") # Print the first 200 characters
+        print_results(results, n_results)
 
+    except EncoderMismatchError as e:
+        print(f"\nERROR: {e}")
     except ValueError as e:
         print(f"\nERROR: Could not find collection '{COLLECTION_NAME}' or database at '{CHROMA_PATH}'.")
         print("Please ensure embed_data.py ran successfully.")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
+def query_vector_db_remote(query_text: str, n_results: int = 3, where=None):
+    """Same as query_vector_db, but delegates to the resident retrieval service."""
+    from retrieval_service import ServiceClient
+
+    try:
+        print(f"Searching database for: **'{query_text}'** (via {SERVICE_ADDRESS})")
+        results = ServiceClient(SERVICE_ADDRESS).query(query_text, n_results=n_results, where=where)
+        if results.get('error'):
+            print(f"\nERROR from retrieval service: {results['error']}")
+            return
+        print_results(results, n_results)
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+
+def read_questions(questions_file: str):
+    """
+    Lazily yields questions from a file. Plain text files hold one question per
+    line; .jsonl query logs hold one object per line with a 'query' field.
+    """
+    is_jsonl = questions_file.endswith('.jsonl')
+    with open(questions_file, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            yield json.loads(line)['query'] if is_jsonl else line
+
+def iter_batches(items, batch_size: int):
+    """Groups an iterable into lists of at most batch_size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def query_vector_db_batch(questions_file: str, output_file: str, n_results: int = 3,
+                          batch_size: int = BATCH_SIZE, embed_locally: bool = False, where=None):
+    """
+    Replays a file of questions against the collection in batches and streams
+    one JSONL record per question (with distances) to output_file.
+
+    With embed_locally, each batch is encoded once here and sent as
+    query_embeddings; otherwise Chroma encodes the batch of query_texts itself.
+    """
+    encoder = open_encoder()
+    try:
+        collection = open_collection(encoder)
+    except EncoderMismatchError as e:
+        print(f"\nERROR: {e}")
+        return
+    except ValueError:
+        print(f"\nERROR: Could not find collection '{COLLECTION_NAME}' or database at '{CHROMA_PATH}'.")
+        print("Please ensure embed_data.py ran successfully.")
+        return
+
+    # The same encoder the collection checked against; None lets Chroma call it itself
+    embedding_function = encoder if embed_locally else None
+
+    print(f"Replaying questions from {questions_file} in batches of {batch_size}...")
+    total = 0
+    start = time.perf_counter()
+
+    with open(output_file, 'w', encoding='utf-8') as out:
+        for batch in iter_batches(read_questions(questions_file), batch_size):
+            if embedding_function is not None:
+                query_args = dict(query_embeddings=embedding_function(batch))
+            else:
+                query_args = dict(query_texts=batch)
+
+            results = collection.query(
+                **query_args,
+                n_results=n_results,
+                include=['documents', 'metadatas', 'distances'],
+                where=where
+            )
+
+            for q, query_text in enumerate(batch):
+                hits = [
+                    {
+                        'id': chunk_id,
+                        'source': metadata.get('source'),
+                        'url': metadata.get('url'),
+                        'title': metadata.get('title'),
+                        'distance': distance,
+                        'document': document,
+                    }
+                    for chunk_id, metadata, distance, document in zip(
+                        results['ids'][q], results['metadatas'][q],
+                        results['distances'][q], results['documents'][q]
+                    )
+                ]
+                out.write(json.dumps({'query': query_text, 'results': hits}) + "\n")
+
+            total += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f"  {total} questions ({total / elapsed:.1f} q/s)")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n--- Batch Complete ---")
+    print(f"Questions answered: {total}")
+    print(f"Total time: {elapsed:.2f}s")
+    print(f"Throughput: {total / elapsed if elapsed else 0.0:.1f} questions/sec")
+    print(f"✓ Results saved to '{output_file}'")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the Serene Ease vector database")
     # Example query: Ask a mental health question that should retrieve relevant documents
-    user_query = "what are the most important ways to prevent anxiety in daily life"
-    query_vector_db(user_query, n_results=3)
\ No newline at end of file
+    parser.add_argument("query", nargs="?", default="what are the most important ways to prevent anxiety in daily life")
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--batch", metavar="QUESTIONS_FILE", help="Replay a file of questions (.txt or .jsonl query log)")
+    parser.add_argument("--output", default="query_results.jsonl", help="JSONL output for --batch")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--embed-locally", action="store_true", help="Send query_embeddings instead of query_texts")
+    parser.add_argument("--source", action="append", help="Only search this source domain (repeatable)")
+    parser.add_argument("--exclude-source", action="append", help="Never return this source domain (repeatable)")
+    parser.add_argument("--article", type=int, action="append", help="Only search this article_id (repeatable)")
+    args = parser.parse_args()
+
+    if args.batch:
+        query_vector_db_batch(args.batch, args.output, args.n_results, args.batch_size, args.embed_locally,
+                              build_where(args.source, args.exclude_source, args.article))
+    else:
+        query_vector_db(args.query, args.n_results, args.source, args.exclude_source, args.article)
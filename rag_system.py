@@ -1,112 +1,342 @@
 # rag_system.py
 
-import chromadb
-from google import genai
 import os
 
+from context_packer import TOKEN_BUDGET
+from retrieval_filters import build_where
+from tracing import NULL_TRACE, Tracer
+
 # --- Configuration ---
 # Retrieval Settings
-MODEL_NAME = 'all-MiniLM-L6-v2' 
+MODEL_NAME = 'all-MiniLM-L6-v2'
 CHROMA_PATH = 'chroma_db_serene_ease'
+VECTOR_STORE_PATH = 'vector_store_serene_ease'
+IVFPQ_PATH = 'ivfpq_index_serene_ease'
+LEXICAL_INDEX_PATH = 'lexical_index_serene_ease'
 COLLECTION_NAME = f"mental_health_chunks_{MODEL_NAME.split('-')[0]}"
 N_RESULTS = 3 # Number of relevant chunks to retrieve
+HNSW_SEARCH_EF = None # Expected search_ef, checked against the index (see hnsw_params.py); None skips the check
+# Query encoder (see embedding_backends.py); must match the model and variant embed_data.py indexed with
+EMBEDDING_BACKEND = 'onnx'
+# Persistent embedding cache shared with embed_data.py (see embedding_cache.py)
+USE_EMBEDDING_CACHE = True
+EMBEDDING_CACHE_PATH = 'embedding_cache'
+
+# Retrieval backend: "chroma" (HNSW), "numpy" (exact brute force, see vector_engine.py)
+# or "ivfpq" (compressed approximate search for very large corpora, see ivf_pq.py)
+RETRIEVAL_BACKEND = os.getenv("SERENE_EASE_BACKEND", "chroma")
+IVFPQ_NPROBE = 8 # coarse lists scanned per query by the ivfpq backend; higher = better recall, slower
+
+# Hybrid search fuses BM25 with vector results (see lexical_index.py) when the index exists
+USE_HYBRID_SEARCH = True
+
+# Optional cross-encoder reranking (see reranker.py): over-fetch candidates, keep the best N_RESULTS
+USE_RERANKER = False
+RERANK_CANDIDATES = 12
+
+# Token-budgeted context packing (see context_packer.py). With a budget set,
+# PACK_CANDIDATES chunks are retrieved and packed instead of a fixed N_RESULTS;
+# set CONTEXT_TOKEN_BUDGET = None to send the top N_RESULTS chunks as-is.
+CONTEXT_TOKEN_BUDGET = TOKEN_BUDGET # about three full chunks, the size of the old top-3
+PACK_CANDIDATES = 8
 
 # Generation Settings
-GEMINI_MODEL = "gemini-2.5-flash" 
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# Client-side quota for GEMINI_MODEL (see generation_scheduler.py), used by the
+# retrieval service where many requests share one key
+GEMINI_REQUESTS_PER_MINUTE = 10
+GEMINI_TOKENS_PER_MINUTE = 250_000
+EXPECTED_ANSWER_TOKENS = 500
 
-def run_rag_query(user_query: str):
+# Resident retrieval service (see retrieval_service.py). When set, queries are
+# sent to the warm daemon instead of reopening the database in this process.
+SERVICE_ADDRESS = os.getenv("SERENE_EASE_SERVICE")
+
+# Per-stage latency tracing (see tracing.py): SERENE_EASE_TRACE=1 appends one
+# JSONL record per question to TRACE_PATH and prints the stage breakdown
+TRACE_ENABLED = os.getenv("SERENE_EASE_TRACE") == "1"
+TRACE_PATH = 'traces.jsonl'
+
+# Define a clear system instruction to guide the LLM's behavior
+SYSTEM_INSTRUCTION = (
+    "You are an expert mental health summarization assistant. "
+    "Your task is to synthesize a coherent and specific answer to the user's question "
+    "based **ONLY** on the context provided in the snippets. "
+    "If the snippets do not contain the information, state that clearly."
+)
+
+
+def open_collection():
     """
-    Performs the full RAG process: Retrieves context from the vector DB,
-    then uses Gemini to generate a final answer based on that context.
+    Opens the collection with the configured retrieval backend and query
+    encoder; raises EncoderMismatchError if the collection was built with a
+    different model.
     """
-    # 1. RETRIEVAL (R)
-    print("--- 1. RETRIEVAL (Searching Vector DB) ---")
-    
-    try:
+    from embedding_backends import check_encoder, create_encoder
+    encoder = create_encoder(EMBEDDING_BACKEND, MODEL_NAME)
+    if USE_EMBEDDING_CACHE:
+        from embedding_cache import with_cache
+        encoder = with_cache(encoder, EMBEDDING_CACHE_PATH)
+    if RETRIEVAL_BACKEND == "numpy":
+        from vector_engine import BruteForceCollection
+        collection = BruteForceCollection(VECTOR_STORE_PATH, encoder)
+    elif RETRIEVAL_BACKEND == "ivfpq":
+        from ivf_pq import IVFPQCollection
+        collection = IVFPQCollection(IVFPQ_PATH, encoder, nprobe=IVFPQ_NPROBE)
+    else:
+        import chromadb
+        from hnsw_params import search_ef_warning
         client = chromadb.PersistentClient(path=CHROMA_PATH)
-        collection = client.get_collection(name=COLLECTION_NAME)
-        
-        # Query the database
-        results = collection.query(
-            query_texts=[user_query],
-            n_results=N_RESULTS,
-            include=['documents', 'metadatas']
-        )
-        
-        # Compile retrieved snippets and their sources
-        context_snippets = []
-        sources = set()
-
-        for i in range(N_RESULTS):
-            document = results['documents'][0][i]
-            source = results['metadatas'][0][i]['source']
-            url = results['metadatas'][0][i]['url']
-            
-            # Format snippet for the prompt
-            context_snippets.append(f"Source {i+1} ({source}): {document}")
-            sources.add(f"[{source}]: {url}")
-            
-        context_text = "\n\n".join(context_snippets)
-        print(f"✓ Retrieved {len(context_snippets)} relevant chunks.")
+        collection = client.get_collection(name=COLLECTION_NAME, embedding_function=encoder)
+        if (warning := search_ef_warning(collection, HNSW_SEARCH_EF)):
+            print(f"WARNING: {warning}")
+    check_encoder(collection.metadata, encoder)
+    return collection
 
-    except Exception as e:
-        print(f"\nERROR during Retrieval: {e}")
-        return
 
-    # 2. PROMPT CONSTRUCTION
-    
-    # Define a clear system instruction to guide the LLM's behavior
-    system_instruction = (
-        "You are an expert mental health summarization assistant. "
-        "Your task is to synthesize a coherent and specific answer to the user's question "
-        "based **ONLY** on the context provided in the snippets. "
-        "If the snippets do not contain the information, state that clearly."
-    )
-    
-    # Construct the final prompt containing the instructions, context, and query
-    rag_prompt = f"""
+def open_lexical_index():
+    """Loads the BM25 index for hybrid search, or None when disabled or not built."""
+    if not USE_HYBRID_SEARCH:
+        return None
+    from lexical_index import BM25Index
+    return BM25Index.load(LEXICAL_INDEX_PATH)
+
+
+def open_reranker():
+    """Creates the cross-encoder reranker, or None when reranking is disabled."""
+    if not USE_RERANKER:
+        return None
+    from reranker import CrossEncoderReranker
+    return CrossEncoderReranker()
+
+
+def _query_encoder(collection):
+    """The collection's own embedding function (private on Chroma collections), or None."""
+    return getattr(collection, "embedding_function", None) or getattr(collection, "_embedding_function", None)
+
+
+def retrieve_context(collection, user_query: str, n_results: int = N_RESULTS, lexical_index=None,
+                     where=None, reranker=None, token_budget=CONTEXT_TOKEN_BUDGET, trace=NULL_TRACE):
+    """
+    Queries the collection and compiles the retrieved snippets for the prompt.
+    Returns a dict with the context text, the sorted list of sources used, the
+    number of chunks and the (estimated) prompt tokens used and saved.
+    A 'where' clause (see retrieval_filters.build_where) restricts the search.
+    Stage timings go into trace (see tracing.py).
+    """
+    n_candidates = n_results
+    if token_budget is not None:
+        n_candidates = max(n_candidates, PACK_CANDIDATES)
+    if reranker is not None:
+        n_candidates = max(n_candidates, RERANK_CANDIDATES)
+
+    # When tracing, encode the query up front so embedding and search are timed apart
+    query_embedding = None
+    encoder = _query_encoder(collection) if trace.enabled else None
+    if encoder is not None:
+        with trace.span("embed"):
+            query_embedding = [float(x) for x in encoder([user_query])[0]]
+
+    with trace.span("search"):
+        if lexical_index is not None:
+            from lexical_index import hybrid_query
+            results = hybrid_query(collection, lexical_index, user_query, n_candidates, query_embedding, where=where)
+        else:
+            if query_embedding is not None:
+                query_args = dict(query_embeddings=[query_embedding])
+            else:
+                query_args = dict(query_texts=[user_query])
+            results = collection.query(
+                **query_args,
+                n_results=n_candidates,
+                include=['documents', 'metadatas'],
+                where=where
+            )
+
+    if reranker is not None:
+        # When packing, the reranker only reorders; the budget decides how many are kept
+        keep = n_candidates if token_budget is not None else n_results
+        with trace.span("rerank"):
+            results = reranker.rerank(user_query, results, keep)
+
+    if token_budget is not None:
+        from context_packer import pack_context
+        with trace.span("pack"):
+            packed = pack_context(results, token_budget)
+        snippets = [(s['text'], s['source'], s['url']) for s in packed['snippets']]
+        n_chunks, tokens, saved_tokens = packed['chunks_used'], packed['tokens'], packed['saved_tokens']
+    else:
+        from context_packer import estimate_tokens
+        snippets = [
+            (document, metadata['source'], metadata['url'])
+            for document, metadata in zip(results['documents'][0], results['metadatas'][0])
+        ]
+        n_chunks, tokens, saved_tokens = len(snippets), sum(estimate_tokens(s[0]) for s in snippets), 0
+
+    # Compile retrieved snippets and their sources
+    context_snippets = []
+    sources = set()
+
+    for i, (document, source, url) in enumerate(snippets):
+        # Format snippet for the prompt
+        context_snippets.append(f"Source {i+1} ({source}): {document}")
+        sources.add(f"[{source}]: {url}")
+
+    return {
+        'context_text': "\n\n".join(context_snippets),
+        'sources': sorted(sources),
+        'n_chunks': n_chunks,
+        'tokens': tokens,
+        'saved_tokens': saved_tokens,
+    }
+
+
+def build_prompt(user_query: str, context_text: str) -> str:
+    """Constructs the final prompt containing the context and the query."""
+    return f"""
     CONTEXT SNIPPETS:
     ---
     {context_text}
     ---
-    
+
     USER QUESTION:
     {user_query}
-    
+
     Synthesize an answer using only the provided CONTEXT SNIPPETS.
     """
-    
-    # 3. GENERATION (G)
-    print("\n--- 2. GENERATION (Calling Gemini) ---")
-    
-    try:
-        # Initialize the Gemini client
-        gemini_client = genai.Client()
 
-        # Call the Gemini API
-        response = gemini_client.models.generate_content(
+
+def generate_answer(gemini_client, user_query: str, context_text: str, scheduler=None) -> str:
+    """
+    Calls Gemini with the RAG prompt and returns the answer text. With a
+    GenerationScheduler the call waits for quota and rate limits are retried.
+    """
+    contents = build_prompt(user_query, context_text)
+
+    def call():
+        return gemini_client.models.generate_content(
             model=GEMINI_MODEL,
-            contents=rag_prompt,
+            contents=contents,
             config=dict(
-                system_instruction=system_instruction
+                system_instruction=SYSTEM_INSTRUCTION
             )
         )
-        
-        # 4. Output Final Answer
-        print("\n=======================================================")
-        print(f" GENERATED ANSWER ({GEMINI_MODEL})")
-        print("=======================================================")
-        print(response.text)
-        
-        print("\n--- SOURCES USED ---")
-        for source in sorted(list(sources)):
-            print(source)
+
+    if scheduler is None:
+        return call().text
+    from context_packer import estimate_tokens
+    return scheduler.call(call, estimate_tokens(contents) + EXPECTED_ANSWER_TOKENS).text
+
+
+def stream_answer(gemini_client, user_query: str, context_text: str, timer=None):
+    """Yields the answer text as Gemini streams it; timer records TTFT and total time."""
+    from generation import stream_generate
+    return stream_generate(
+        gemini_client, GEMINI_MODEL, build_prompt(user_query, context_text), SYSTEM_INSTRUCTION, timer
+    )
+
+
+def print_answer_header():
+    print("\n=======================================================")
+    print(f" GENERATED ANSWER ({GEMINI_MODEL})")
+    print("=======================================================")
+
+
+def print_sources(sources):
+    print("\n--- SOURCES USED ---")
+    for source in sources:
+        print(source)
+
+
+def print_answer(answer: str, sources):
+    """Prints the final answer and the sources it was grounded in."""
+    print_answer_header()
+    print(answer)
+    print_sources(sources)
+
+
+def run_rag_query(user_query: str, sources_allow=None, sources_deny=None, article_ids=None):
+    """
+    Performs the full RAG process: Retrieves context from the vector DB,
+    then uses Gemini to generate a final answer based on that context.
+    Retrieval can be restricted to source domains and article ids.
+    """
+    where = build_where(sources_allow, sources_deny, article_ids)
+    if SERVICE_ADDRESS:
+        return run_rag_query_remote(user_query, where)
+
+    tracer = Tracer(TRACE_PATH, enabled=TRACE_ENABLED)
+    trace = tracer.start(backend=RETRIEVAL_BACKEND, filtered=where is not None)
+
+    # 1. RETRIEVAL (R)
+    print("--- 1. RETRIEVAL (Searching Vector DB) ---")
+
+    try:
+        collection = open_collection()
+
+        context = retrieve_context(
+            collection, user_query, lexical_index=open_lexical_index(), where=where,
+            reranker=open_reranker(), trace=trace
+        )
+        print(f"✓ Retrieved {context['n_chunks']} relevant chunks.")
+        print(f"✓ Context: ~{context['tokens']} tokens (~{context['saved_tokens']} saved by de-duplicating overlap).")
+
+    except Exception as e:
+        print(f"\nERROR during Retrieval: {e}")
+        return
+
+    # 2. GENERATION (G)
+    print("\n--- 2. GENERATION (Calling Gemini) ---")
+
+    try:
+        from generation import GenerationTimer, create_client
+
+        # Initialize the Gemini client (SERENE_EASE_FAKE_LLM=1 uses the offline stub)
+        gemini_client = create_client()
+
+        # 3. Output Final Answer, streamed to stdout as it is generated
+        timer = GenerationTimer()
+        print_answer_header()
+        # Render time excludes waiting on the model for the next piece
+        with trace.span("render"):
+            for piece in trace.untimed("render", stream_answer(gemini_client, user_query, context['context_text'], timer)):
+                print(piece, end="", flush=True)
+            print()
+            print_sources(context['sources'])
+        print(f"\n(first token {timer.ttft or 0:.2f}s, total {timer.total:.2f}s)")
+        trace.record("ttft", timer.ttft)
+        trace.record("generation", timer.total)
+
+        record = tracer.finish(trace)
+        if record is not None:
+            stages = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in record['spans'].items())
+            print(f"(trace: {stages}; appended to {TRACE_PATH})")
 
     except Exception as e:
         print(f"\nERROR during Generation: Could not connect to Gemini API. Ensure GEMINI_API_KEY is set correctly. Details: {e}")
 
 
+def run_rag_query_remote(user_query: str, where=None):
+    """Same as run_rag_query, but delegates to the resident retrieval service."""
+    from retrieval_service import ServiceClient
+
+    print(f"--- Querying retrieval service at {SERVICE_ADDRESS} ---")
+    try:
+        result = ServiceClient(SERVICE_ADDRESS).rag(user_query, n_results=N_RESULTS, where=where)
+    except Exception as e:
+        print(f"\nERROR: Could not reach retrieval service. Details: {e}")
+        return
+
+    if result.get('error'):
+        print(f"\nERROR from retrieval service: {result['error']}")
+        return
+
+    print(f"✓ Retrieved {result['n_chunks']} relevant chunks.")
+    print_answer(result['answer'], result['sources'])
+
+
 if __name__ == "__main__":
-    # Example Query 
+    # Example Query
     rag_query = "What are practical, daily methods for stress management and preventing anxiety according to the data?"
-    run_rag_query(rag_query)
\ No newline at end of file
+    run_rag_query(rag_query)
@@ -0,0 +1,138 @@
+# reranker.py
+
+"""
+Optional cross-encoder reranking stage.
+
+Retrieval over-fetches candidates, the cross-encoder scores every
+(query, chunk) pair in one batched CPU call, and the best N are kept. A
+per-query latency budget skips reranking (falling back to retrieval order)
+whenever the estimated scoring time would not fit, and scores are cached per
+(normalized query, chunk id) so repeated questions only pay for new chunks.
+While skipping, every REPROBE_AFTER_SKIPS-th query is reranked anyway to
+re-measure the cost, so one slow batch cannot switch reranking off for good.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from query_cache import normalize_query
+
+# --- Configuration ---
+RERANK_MODEL = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+LATENCY_BUDGET_MS = 250   # time allowed for reranking one query
+BATCH_SIZE = 32
+REPROBE_AFTER_SKIPS = 20  # consecutive skips after which one query is reranked to refresh the estimate
+SCORE_CACHE_SIZE = 8192
+
+
+def take_top(results, n_results: int, order=None):
+    """Trims single-query Chroma results to n_results rows, optionally in a new order."""
+    if order is None:
+        order = range(min(n_results, len(results['ids'][0])))
+    order = list(order)[:n_results]
+    trimmed = dict(results)
+    for key in ('ids', 'documents', 'metadatas', 'distances'):
+        if results.get(key) is not None:
+            trimmed[key] = [[results[key][0][i] for i in order]]
+    return trimmed
+
+
+class CrossEncoderReranker:
+    """Batched cross-encoder scoring with a latency budget and a score cache."""
+
+    def __init__(self, model_name: str = RERANK_MODEL, latency_budget_ms: float = LATENCY_BUDGET_MS,
+                 batch_size: int = BATCH_SIZE, cache_size: int = SCORE_CACHE_SIZE,
+                 reprobe_after_skips: int = REPROBE_AFTER_SKIPS):
+        self.model_name = model_name
+        self.latency_budget_ms = latency_budget_ms
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.reprobe_after_skips = reprobe_after_skips
+        self._model = None
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        # Running estimate of the cost of scoring one pair, refined after each batch
+        self._ms_per_pair = None
+        self._skips_since_probe = 0
+        self._model_warm = False
+        self.reranked = 0
+        self.skipped = 0
+        self.cache_hits = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, device='cpu')
+        return self._model
+
+    def warm_up(self):
+        """Loads the model and scores one pair so the first real query is not charged for it."""
+        self.model.predict([("warm up", "warm up")])
+        self._model_warm = True
+
+    def rerank(self, query_text: str, results, n_results: int):
+        """
+        Reorders single-query Chroma results by cross-encoder score and keeps
+        n_results. The latency budget covers this stage only.
+        """
+        ids = results['ids'][0]
+        documents = results['documents'][0]
+        if len(ids) <= 1:
+            return take_top(results, n_results)
+
+        key = normalize_query(query_text)
+        scores = {}
+        with self._lock:
+            for chunk_id in ids:
+                cached = self._scores.get((key, chunk_id))
+                if cached is not None:
+                    self._scores.move_to_end((key, chunk_id))
+                    scores[chunk_id] = cached
+            self.cache_hits += len(scores)
+
+        missing = [i for i, chunk_id in enumerate(ids) if chunk_id not in scores]
+        if missing:
+            probe = False
+            with self._lock:
+                if self._ms_per_pair is not None and self._ms_per_pair * len(missing) > self.latency_budget_ms:
+                    if self._skips_since_probe < self.reprobe_after_skips:
+                        self._skips_since_probe += 1
+                        self.skipped += 1
+                        return take_top(results, n_results)
+                    # Over budget for a while: measure again instead of trusting an old slow batch
+                    probe = True
+                self._skips_since_probe = 0
+
+            start = time.perf_counter()
+            predicted = self.model.predict(
+                [(query_text, documents[i]) for i in missing], batch_size=self.batch_size
+            )
+            ms_per_pair = (time.perf_counter() - start) * 1000 / len(missing)
+            # The first batch includes model loading, so only later batches set the estimate
+            if self._model_warm:
+                if self._ms_per_pair is None or probe:
+                    self._ms_per_pair = ms_per_pair
+                else:
+                    self._ms_per_pair = 0.8 * self._ms_per_pair + 0.2 * ms_per_pair
+            self._model_warm = True
+
+            with self._lock:
+                for i, score in zip(missing, predicted):
+                    scores[ids[i]] = float(score)
+                    self._scores[(key, ids[i])] = float(score)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+
+        self.reranked += 1
+        order = sorted(range(len(ids)), key=lambda i: scores[ids[i]], reverse=True)
+        return take_top(results, n_results, order)
+
+    def stats(self) -> dict:
+        return {
+            "reranked": self.reranked,
+            "skipped": self.skipped,
+            "cache_hits": self.cache_hits,
+            "ms_per_pair": self._ms_per_pair,
+        }
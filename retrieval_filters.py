@@ -0,0 +1,120 @@
+# retrieval_filters.py
+
+"""
+Metadata pre-filtering for retrieval.
+
+Source allow/deny lists and article scopes are turned into a Chroma 'where'
+clause, so the filter is applied inside the search instead of after top-k.
+The NumPy, IVF-PQ and BM25 paths evaluate the same clause against per-value
+row lists (MetadataBitmaps) and only score the matching rows.
+"""
+
+import numpy as np
+
+# Metadata keys that get a bitmap per distinct value
+INDEXED_KEYS = ('source', 'article_id')
+
+
+def normalize_source(source: str) -> str:
+    """Same standardization clean_data.py applies to the 'source' field."""
+    source = str(source).strip().lower()
+    for prefix in ('https://', 'http://', 'www.'):
+        if source.startswith(prefix):
+            source = source[len(prefix):]
+    return source.strip('/')
+
+
+def parse_article_ids(text: str):
+    """
+    Parses a comma- or space-separated list of article ids typed into the UI.
+    Returns (ids, invalid entries).
+    """
+    ids, invalid = [], []
+    for entry in str(text or '').replace(',', ' ').split():
+        try:
+            ids.append(int(entry))
+        except ValueError:
+            invalid.append(entry)
+    return ids, invalid
+
+
+def build_where(sources_allow=None, sources_deny=None, article_ids=None):
+    """
+    Returns a Chroma 'where' clause for the given scopes, or None when no
+    filter applies.
+    """
+    clauses = []
+    if sources_allow:
+        clauses.append({'source': {'$in': sorted({normalize_source(s) for s in sources_allow})}})
+    if sources_deny:
+        clauses.append({'source': {'$nin': sorted({normalize_source(s) for s in sources_deny})}})
+    if article_ids:
+        clauses.append({'article_id': {'$in': sorted({int(a) for a in article_ids})}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {'$and': clauses}
+
+
+class MetadataBitmaps:
+    """
+    Per-value row lists over a list of metadata dicts, built lazily per key.
+    Each value keeps a sorted int32 array of the rows holding it, so a key
+    costs 4 bytes per row however many distinct values it has; the boolean
+    masks are only materialized for the values a clause names.
+    """
+
+    def __init__(self, metadatas):
+        self._metadatas = metadatas
+        self._count = len(metadatas)
+        self._positions = {}
+
+    def _positions_for(self, key: str) -> dict:
+        if key not in self._positions:
+            positions = {}
+            for i, metadata in enumerate(self._metadatas):
+                value = (metadata or {}).get(key)
+                if value is not None:
+                    positions.setdefault(value, []).append(i)
+            self._positions[key] = {value: np.asarray(rows, dtype=np.int32) for value, rows in positions.items()}
+        return self._positions[key]
+
+    def _any_of(self, key: str, values) -> np.ndarray:
+        positions = self._positions_for(key)
+        mask = np.zeros(self._count, dtype=bool)
+        for value in values:
+            if value in positions:
+                mask[positions[value]] = True
+        return mask
+
+    def mask(self, where) -> np.ndarray:
+        """Evaluates a 'where' clause ($and, $or, $eq, $ne, $in, $nin) to a row mask."""
+        if not where:
+            return np.ones(self._count, dtype=bool)
+
+        if '$and' in where:
+            mask = np.ones(self._count, dtype=bool)
+            for clause in where['$and']:
+                mask &= self.mask(clause)
+            return mask
+        if '$or' in where:
+            mask = np.zeros(self._count, dtype=bool)
+            for clause in where['$or']:
+                mask |= self.mask(clause)
+            return mask
+
+        (key, condition), = where.items()
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        (operator, operand), = condition.items()
+        if operator == '$eq':
+            return self._any_of(key, [operand])
+        if operator == '$ne':
+            return ~self._any_of(key, [operand])
+        if operator == '$in':
+            return self._any_of(key, operand)
+        if operator == '$nin':
+            return ~self._any_of(key, operand)
+        raise ValueError(f"Unsupported filter operator: {operator}")
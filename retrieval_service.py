@@ -0,0 +1,257 @@
+# retrieval_service.py
+
+"""
+Resident retrieval daemon for Serene Ease.
+
+Opening the PersistentClient, loading the collection's embedding function and
+creating the Gemini client dominate latency for short CLI questions. This
+process does that once and then answers queries over HTTP or a local Unix
+socket, so query_db.py and rag_system.py can act as thin clients.
+
+Run it from the project root:
+    python retrieval_service.py                         # http://127.0.0.1:8765
+    python retrieval_service.py --socket /tmp/serene_ease.sock
+
+and point the CLI scripts at it:
+    export SERENE_EASE_SERVICE="http://127.0.0.1:8765"
+    export SERENE_EASE_SERVICE="unix:///tmp/serene_ease.sock"
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# query_db and rag_system are imported by the server side only, where they open
+# the collection, so thin clients importing ServiceClient stay light
+from coalescing import SingleFlight, make_key
+from generation_scheduler import GenerationScheduler, QueueFullError, is_rate_limit_error
+
+# --- Configuration ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Result fields that are safe to send back as JSON
+RESULT_KEYS = ('ids', 'documents', 'metadatas', 'distances')
+
+
+class WarmComponents:
+    """Keeps the Chroma collection, its embedding function and the Gemini client loaded."""
+
+    def __init__(self):
+        import rag_system
+        from generation import create_client
+
+        # Honours SERENE_EASE_BACKEND like rag_system.py
+        self.collection = rag_system.open_collection()
+        self.lexical_index = rag_system.open_lexical_index()
+        self.reranker = rag_system.open_reranker()
+        self.single_flight = SingleFlight()
+        # Every /rag request shares one Gemini quota; excess requests queue instead of failing
+        self.scheduler = GenerationScheduler(rag_system.GEMINI_REQUESTS_PER_MINUTE, rag_system.GEMINI_TOKENS_PER_MINUTE)
+        self.gemini_client = None
+        self.gemini_error = None
+        try:
+            self.gemini_client = create_client()
+        except Exception as e:
+            # Retrieval still works without a key; /rag reports the problem.
+            self.gemini_error = str(e)
+
+    def warm_up(self):
+        """Runs one throwaway query so the embedding (and reranking) models load before the first request."""
+        self.collection.query(query_texts=["warm up"], n_results=1)
+        if self.reranker is not None:
+            self.reranker.warm_up()
+
+
+class RetrievalRequestHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP: GET /health, POST /query and POST /rag."""
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            components = self.server.components
+            self._send_json(200, {
+                "status": "ok",
+                "collection": components.collection.name,
+                "count": components.collection.count(),
+                "generation": components.gemini_client is not None,
+                "coalescing": components.single_flight.stats(),
+                "generation_queue": components.scheduler.stats(),
+            })
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        import query_db
+        import rag_system
+
+        try:
+            request = self._read_json()
+            query_text = request["query"]
+            n_results = int(request.get("n_results") or rag_system.N_RESULTS)
+            where = request.get("where")
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+            return
+
+        components = self.server.components
+        try:
+            if self.path == "/query":
+                results = query_db.search_collection(components.collection, query_text, n_results, where)
+                self._send_json(200, {key: results.get(key) for key in RESULT_KEYS})
+            elif self.path == "/rag":
+                if components.gemini_client is None:
+                    self._send_json(503, {"error": f"Gemini client unavailable: {components.gemini_error}"})
+                    return
+                def answer_query():
+                    context = rag_system.retrieve_context(
+                        components.collection, query_text, n_results, components.lexical_index, where,
+                        components.reranker
+                    )
+                    answer = rag_system.generate_answer(
+                        components.gemini_client, query_text, context['context_text'], components.scheduler
+                    )
+                    return {
+                        "answer": answer,
+                        "sources": context['sources'],
+                        "n_chunks": context['n_chunks'],
+                        "tokens": context['tokens'],
+                        "saved_tokens": context['saved_tokens'],
+                    }
+
+                # Identical questions in flight at the same time share one answer
+                key = make_key(query_text, n_results=n_results, where=where)
+                self._send_json(200, components.single_flight.run(key, answer_query))
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+        except Exception as e:
+            # Overload is reported as 503/429 so clients can back off
+            if isinstance(e, QueueFullError):
+                self._send_json(503, {"error": str(e)})
+            elif is_rate_limit_error(e):
+                self._send_json(429, {"error": str(e)})
+            else:
+                self._send_json(500, {"error": str(e)})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server bound to a Unix domain socket."""
+    daemon_threads = True
+
+
+def serve(components: WarmComponents, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str = None):
+    """Serves requests until interrupted."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, RetrievalRequestHandler)
+        address = f"unix://{socket_path}"
+    else:
+        server = ThreadingHTTPServer((host, port), RetrievalRequestHandler)
+        address = f"http://{host}:{port}"
+
+    server.components = components
+    print(f"✓ Retrieval service listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down retrieval service.")
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# --- Thin client used by query_db.py and rag_system.py ---
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that talks to a Unix domain socket instead of TCP."""
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._socket_path)
+
+
+class ServiceClient:
+    """Minimal client for the retrieval service. Accepts http://host:port or unix:///path."""
+
+    def __init__(self, address: str, timeout: float = 120.0):
+        self.address = address
+        self.timeout = timeout
+        self._parsed = urlparse(address)
+
+    def _connect(self):
+        if self._parsed.scheme == "unix":
+            return _UnixHTTPConnection(self._parsed.path, self.timeout)
+        return http.client.HTTPConnection(self._parsed.hostname, self._parsed.port or DEFAULT_PORT, timeout=self.timeout)
+
+    def _request(self, method: str, path: str, payload: dict = None) -> dict:
+        conn = self._connect()
+        try:
+            body = json.dumps(payload).encode("utf-8") if payload is not None else None
+            headers = {"Content-Type": "application/json"} if body else {}
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            return json.loads(response.read() or b"{}")
+        finally:
+            conn.close()
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+    def query(self, query_text: str, n_results: int = 3, where=None) -> dict:
+        return self._request("POST", "/query", {"query": query_text, "n_results": n_results, "where": where})
+
+    def rag(self, user_query: str, n_results: int = None, where=None) -> dict:
+        """n_results defaults to the service's rag_system.N_RESULTS."""
+        return self._request("POST", "/rag", {"query": user_query, "n_results": n_results, "where": where})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serene Ease resident retrieval service")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", dest="socket_path", help="Serve on a Unix domain socket instead of TCP")
+    args = parser.parse_args()
+
+    import rag_system
+
+    start = time.perf_counter()
+    print(f"Loading collection '{rag_system.COLLECTION_NAME}' ({rag_system.RETRIEVAL_BACKEND} backend)...")
+    components = WarmComponents()
+    components.warm_up()
+    print(f"✓ Components warm in {time.perf_counter() - start:.2f}s ({components.collection.count()} chunks).")
+    if components.gemini_error:
+        print(f"WARNING: Gemini client unavailable, /rag disabled: {components.gemini_error}")
+
+    serve(components, args.host, args.port, args.socket_path)
+
+
+if __name__ == "__main__":
+    main()
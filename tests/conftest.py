@@ -0,0 +1,8 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# The modules under test live in the project root and data_processing/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'data_processing')]
@@ -0,0 +1,106 @@
+# tests/test_answer_cache.py
+
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(answer_cache.time, 'time', clock)
+    return clock
+
+
+def _vector(*components, dimension=8):
+    vector = np.zeros(dimension, dtype=np.float32)
+    vector[:len(components)] = components
+    return vector
+
+
+def _cache(tmp_path, **kwargs):
+    return SemanticAnswerCache(str(tmp_path / 'answers.sqlite3'), **kwargs)
+
+
+def test_hit_returns_answer_and_sources(tmp_path, clock):
+    cache = _cache(tmp_path, collection_version="v1")
+    cache.put("how to sleep", _vector(1), "Keep a routine.", ["[nhs.uk]: https://nhs.uk/sleep"])
+
+    assert cache.get(_vector(1, 0.05)) == ("Keep a routine.", ["[nhs.uk]: https://nhs.uk/sleep"])
+    assert cache.get(_vector(0, 1)) is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_expired_nearest_falls_back_to_next_live_entry(tmp_path, clock):
+    cache = _cache(tmp_path, max_distance=0.1, ttl_seconds=60)
+    cache.put("old", _vector(1), "old answer", [])
+    clock.now += 50
+    cache.put("newer", _vector(1, 0.3), "newer answer", [])
+    clock.now += 20 # the first entry is now past the TTL, the second is not
+
+    assert cache.get(_vector(1)) == ("newer answer", [])
+    assert cache.stats()["entries"] == 1
+
+
+def test_expired_entries_miss_and_are_purged_on_reload(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.put("q", _vector(1), "a", [])
+    clock.now += 61
+
+    assert cache.get(_vector(1)) is None
+    assert _cache(tmp_path, ttl_seconds=60).stats()["entries"] == 0
+
+
+def test_least_recently_used_is_evicted(tmp_path, clock):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.put("a", _vector(1), "A", [])
+    clock.now += 1
+    cache.put("b", _vector(0, 1), "B", [])
+    clock.now += 1
+    assert cache.get(_vector(1)) == ("A", []) # 'a' is now the most recently used
+    clock.now += 1
+    cache.put("c", _vector(0, 0, 1), "C", [])
+
+    assert cache.get(_vector(0, 1)) is None
+    assert cache.get(_vector(1)) == ("A", [])
+    assert cache.get(_vector(0, 0, 1)) == ("C", [])
+
+
+def test_collection_version_change_clears_cache(tmp_path, clock):
+    cache = _cache(tmp_path, collection_version="built-1")
+    cache.put("q", _vector(1), "a", [])
+
+    assert _cache(tmp_path, collection_version="built-1").get(_vector(1)) == ("a", [])
+    assert _cache(tmp_path, collection_version="built-2").get(_vector(1)) is None
+    assert _cache(tmp_path, collection_version="built-2").stats()["entries"] == 0
+
+
+def test_rebuild_while_running_clears_cache(tmp_path, clock):
+    built = {"at": "built-1"}
+    cache = _cache(tmp_path, collection_version="built-1", version_source=lambda: built["at"], version_check_s=0)
+    cache.put("q", _vector(1), "a", [])
+    assert cache.get(_vector(1)) == ("a", [])
+
+    built["at"] = "built-2"
+    assert cache.get(_vector(1)) is None
+    cache.put("q", _vector(1), "b", [])
+    assert _cache(tmp_path, collection_version="built-2").get(_vector(1)) == ("b", [])
+
+
+def test_unreadable_version_keeps_cache(tmp_path, clock):
+    def unreadable():
+        raise OSError("collection is being rebuilt")
+
+    cache = _cache(tmp_path, collection_version="built-1", version_source=unreadable, version_check_s=0)
+    cache.put("q", _vector(1), "a", [])
+    assert cache.get(_vector(1)) == ("a", [])
@@ -0,0 +1,84 @@
+# tests/test_coalescing.py
+
+import threading
+
+import pytest
+
+from coalescing import SingleFlight, make_key
+
+
+def test_make_key_separates_parameters():
+    assert make_key("What is  anxiety?", n_results=5) == make_key("what is anxiety?", n_results=5)
+    assert make_key("what is anxiety", n_results=5) != make_key("what is anxiety", n_results=5, where={'source': 'a.org'})
+
+
+def test_run_shares_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.run("k", fn))) for _ in range(4)]
+    threads[0].start()
+    while not flight._calls:
+        pass
+    for thread in threads[1:]:
+        thread.start()
+    while flight.requests < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["answer"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"requests": 4, "executions": 1, "coalesced": 3}
+
+
+def test_run_propagates_errors_and_clears_the_flight():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.run("k", fail)
+    assert flight.run("k", lambda: 1) == 1
+    assert flight.executions == 2
+
+
+def test_stream_replays_pieces_to_late_joiners():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def pieces():
+        yield "a"
+        release.wait(5)
+        yield "b"
+
+    leader = flight.stream("k", pieces)
+    assert next(leader) == "a"
+    follower = flight.stream("k", lambda: iter(["never"]))
+    release.set()
+
+    assert list(leader) == ["b"]
+    assert list(follower) == ["a", "b"]
+    assert flight.executions == 1
+
+
+def test_stream_raises_the_generator_error():
+    flight = SingleFlight()
+
+    def pieces():
+        yield "a"
+        raise RuntimeError("boom")
+
+    stream = flight.stream("k", pieces)
+    assert next(stream) == "a"
+    with pytest.raises(RuntimeError):
+        next(stream)
@@ -0,0 +1,85 @@
+# tests/test_context_packer.py
+
+from context_packer import CHUNK_TOKENS, TOKEN_BUDGET, estimate_tokens, pack_context
+
+
+def _words(prefix, n):
+    return [f"{prefix}{i}" for i in range(n)]
+
+
+def _results(chunks):
+    """Single-query Chroma-shaped results from (id, words, metadata), best first."""
+    return {
+        'ids': [[chunk_id for chunk_id, _, _ in chunks]],
+        'documents': [[" ".join(words) for _, words, _ in chunks]],
+        'metadatas': [[metadata for _, _, metadata in chunks]],
+    }
+
+
+def _article_chunks(article, n_chunks, size=500, overlap=50):
+    """Consecutive chunks of one article overlapping like clean_data.create_chunks."""
+    words = _words(f"a{article}w", size + (n_chunks - 1) * (size - overlap))
+    meta = {'article_id': article, 'source': f"site{article}.org", 'url': f"https://site{article}.org/{article}"}
+    step = size - overlap
+    return [(f"{article}_{i}", words[i * step:i * step + size], meta) for i in range(n_chunks)]
+
+
+def test_merges_overlapping_neighbours():
+    chunks = _article_chunks(1, 2, size=40, overlap=10)
+    packed = pack_context(_results(chunks), token_budget=10_000)
+
+    assert len(packed['snippets']) == 1
+    assert packed['snippets'][0]['text'].split() == _words("a1w", 70)
+    assert packed['chunks_used'] == 2
+    assert packed['saved_tokens'] > 0
+
+
+def test_oversized_merged_passage_is_trimmed_not_dropped():
+    # Three overlapping neighbours merge into one passage well over the budget
+    chunks = _article_chunks(1, 3, size=200, overlap=50)
+    # Rank the middle chunk first
+    chunks = [chunks[1], chunks[0], chunks[2]]
+    budget = estimate_tokens(" ".join(chunks[0][1])) + 20
+    packed = pack_context(_results(chunks), token_budget=budget)
+
+    assert packed['snippets'], "context must not be empty when there are candidates"
+    assert packed['tokens'] <= budget
+    text = packed['snippets'][0]['text']
+    assert " ".join(chunks[0][1]) in text # the top-ranked chunk survives whole
+    assert chunks[0][0] in packed['snippets'][0]['chunk_ids']
+
+
+def test_never_empty_with_tiny_budget():
+    chunks = _article_chunks(1, 2) + _article_chunks(2, 1)
+    packed = pack_context(_results(chunks), token_budget=5)
+
+    assert len(packed['snippets']) == 1
+    assert 0 < packed['tokens'] <= 5
+    assert packed['snippets'][0]['chunk_ids'] == ["1_0"]
+
+
+def test_default_budget_fits_three_full_chunks():
+    chunks = [chunk for article in range(3) for chunk in _article_chunks(article, 1)]
+    assert all(estimate_tokens(" ".join(words)) <= CHUNK_TOKENS for _, words, _ in chunks)
+
+    packed = pack_context(_results(chunks))
+
+    assert packed['tokens'] <= TOKEN_BUDGET
+    assert [s['chunk_ids'] for s in packed['snippets']] == [["0_0"], ["1_0"], ["2_0"]]
+
+
+def test_contained_duplicate_is_dropped():
+    outer = _words("x", 30)
+    meta = {'source': 'a.org', 'url': 'https://a.org/1'}
+    chunks = [("inner", outer[5:15], dict(meta, url='https://b.org/2')), ("outer", outer, meta)]
+    packed = pack_context(_results(chunks), token_budget=10_000)
+
+    assert [s['text'] for s in packed['snippets']] == [" ".join(outer)]
+    assert set(packed['snippets'][0]['chunk_ids']) == {"inner", "outer"}
+
+
+def test_no_candidates():
+    packed = pack_context(_results([]))
+
+    assert packed['snippets'] == []
+    assert packed['tokens'] == 0
@@ -0,0 +1,66 @@
+# tests/test_embed_data.py
+
+import json
+
+from embed_data import chunk_id, chunk_metadata, diff_chunks, iter_unique_chunks, metadata_digest
+
+
+def _record(i, text=None, **metadata):
+    record = {'url': f"https://site.org/{i % 3}", 'source': 'site.org', 'title': 't', 'article_id': i,
+              'chunk_text': text or f"chunk {i}"}
+    record.update(metadata)
+    return record
+
+
+def _stored(records) -> dict:
+    """What stored_chunks() returns for a collection holding records."""
+    return {chunk_id(record): metadata_digest(chunk_metadata(record)) for record in records}
+
+
+def _pairs(records):
+    return [(chunk_id(record), record) for record in records]
+
+
+def test_chunk_id_depends_on_url_and_text_only():
+    record = _record(1)
+
+    assert chunk_id(record) == chunk_id(dict(record, article_id=99, title='other'))
+    assert chunk_id(record) != chunk_id(dict(record, chunk_text="chunk 1 edited"))
+    assert chunk_id(record) != chunk_id(dict(record, url="https://other.org/1"))
+
+
+def test_diff_finds_new_changed_metadata_and_stale_chunks():
+    before = [_record(i) for i in range(6)]
+    after = [
+        _record(0),                          # unchanged
+        _record(1, article_id=101),          # same text, new article_id
+        _record(2, source='other.org'),      # same text, new source
+        _record(3, text="chunk 3 edited"),   # new text: new id
+        _record(4),
+        _record(7),                          # new chunk
+    ]                                        # chunk 5 is gone
+
+    new_ids, changed_ids, stale_ids = diff_chunks(_pairs(after), _stored(before))
+
+    assert new_ids == {chunk_id(after[3]), chunk_id(after[5])}
+    assert changed_ids == {chunk_id(after[1]), chunk_id(after[2])}
+    assert stale_ids == {chunk_id(before[3]), chunk_id(before[5])}
+
+
+def test_diff_against_empty_collection_embeds_everything():
+    records = [_record(i) for i in range(4)]
+
+    assert diff_chunks(_pairs(records), {}) == ({chunk_id(r) for r in records}, set(), set())
+
+
+def test_metadata_digest_ignores_key_order():
+    assert metadata_digest({'a': 1, 'b': 'x'}) == metadata_digest({'b': 'x', 'a': 1})
+    assert metadata_digest(None) == metadata_digest({})
+
+
+def test_repeated_chunks_are_yielded_once(tmp_path):
+    path = tmp_path / 'chunks.jsonl'
+    records = [_record(0), _record(1), _record(0, article_id=5)]
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+    assert [record['article_id'] for _, record in iter_unique_chunks(str(path))] == [0, 1]
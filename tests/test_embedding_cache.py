@@ -0,0 +1,62 @@
+# tests/test_embedding_cache.py
+
+import os
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+def _vectors(texts, dimension=4):
+    return np.asarray([[len(text), i, 1.0, 2.0][:dimension] for i, text in enumerate(texts)], dtype=np.float32)
+
+
+def _texts(prefix, n):
+    return [f"{prefix} {i}" for i in range(n)]
+
+
+def test_round_trip_and_hit_rate(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'model')
+    texts = _texts("a", 5)
+    cache.put_many(texts, _vectors(texts))
+
+    found = cache.get_many(["A  0", "a 4", "unseen"])
+    assert np.array_equal(found[0], _vectors(texts)[0])
+    assert np.array_equal(found[1], _vectors(texts)[4])
+    assert found[2] is None
+    assert cache.stats()['hits'] == 2
+
+
+def test_eviction_keeps_entries_written_by_another_process(tmp_path):
+    # Two instances on one directory stand in for two processes sharing the cache
+    options = dict(shard_rows=4, max_bytes=3 * 4 * 16)
+    first = EmbeddingCache(str(tmp_path), 'model', **options)
+    second = EmbeddingCache(str(tmp_path), 'model', **options)
+    first.get_many(["warm"])
+    second.get_many(["warm"])
+
+    a = _texts("a", 4)
+    first.put_many(a, _vectors(a))           # shard 0
+    b = _texts("b", 8)
+    second.put_many(b, _vectors(b))          # shards 1-2
+    c = _texts("c", 4)
+    first.put_many(c, _vectors(c))           # shard 3, evicts shard 0
+
+    reopened = EmbeddingCache(str(tmp_path), 'model', **options)
+    assert all(vector is None for vector in reopened.get_many(a))
+    assert all(vector is not None for vector in reopened.get_many(b + c))
+    assert len(reopened) == 12
+
+
+def test_partial_trailing_row_is_dropped_before_appending(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'model')
+    a = _texts("a", 3)
+    cache.put_many(a, _vectors(a))
+    # A crash mid-append leaves half a row behind
+    with open(os.path.join(cache.path, 'shard_00000.bin'), 'ab') as f:
+        f.write(b'\x00' * 6)
+
+    b = _texts("b", 3)
+    cache.put_many(b, _vectors(b))
+    reopened = EmbeddingCache(str(tmp_path), 'model')
+    assert np.array_equal(np.vstack(reopened.get_many(a + b)), np.vstack([_vectors(a), _vectors(b)]))
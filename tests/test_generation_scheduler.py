@@ -0,0 +1,124 @@
+# tests/test_generation_scheduler.py
+
+import threading
+
+import pytest
+
+import generation_scheduler
+from generation_scheduler import GenerationScheduler, QueueFullError, QueueStatus
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(generation_scheduler.time, 'monotonic', clock)
+    return clock
+
+
+def _first_status(scheduler, estimated_tokens=1):
+    """The first QueueStatus of a wait, or None when the call was dispatched at once."""
+    turn = scheduler.wait_turn(estimated_tokens)
+    status = next(turn, None)
+    turn.close()
+    return status
+
+
+def test_burst_then_paced_at_full_rate(clock):
+    scheduler = GenerationScheduler(requests_per_minute=60, burst_requests=3)
+
+    assert [_first_status(scheduler) for _ in range(3)] == [None, None, None]
+    status = _first_status(scheduler)
+    assert isinstance(status, QueueStatus)
+    assert status.position == 1
+    assert status.wait_s == pytest.approx(1.0)
+
+    clock.now += 1.0
+    assert _first_status(scheduler) is None
+    assert scheduler.stats()['dispatched'] == 4
+
+
+def test_one_request_per_minute(clock):
+    scheduler = GenerationScheduler(requests_per_minute=1)
+
+    assert _first_status(scheduler) is None
+    assert _first_status(scheduler).wait_s == pytest.approx(60.0)
+    clock.now += 60.0
+    assert _first_status(scheduler) is None
+
+
+def test_small_quota_refills_at_requests_per_minute(clock):
+    scheduler = GenerationScheduler(requests_per_minute=2, burst_requests=3)
+
+    assert [_first_status(scheduler) for _ in range(2)] == [None, None]
+    assert _first_status(scheduler).wait_s == pytest.approx(30.0)
+
+
+@pytest.mark.parametrize("requests_per_minute", [0, 0.5, -1])
+def test_rejects_quota_below_one_request(requests_per_minute):
+    with pytest.raises(ValueError):
+        GenerationScheduler(requests_per_minute=requests_per_minute)
+
+
+def test_token_quota_paces_large_prompts(clock):
+    scheduler = GenerationScheduler(requests_per_minute=600, tokens_per_minute=1000)
+
+    assert _first_status(scheduler, 600) is None
+    assert _first_status(scheduler, 600).wait_s == pytest.approx(12.0)
+
+
+def test_full_queue_rejects(clock):
+    scheduler = GenerationScheduler(requests_per_minute=1, max_queue=1)
+    assert _first_status(scheduler) is None
+
+    waiting = scheduler.wait_turn(1)
+    assert isinstance(next(waiting), QueueStatus)
+    with pytest.raises(QueueFullError):
+        next(scheduler.wait_turn(1))
+    waiting.close()
+
+    assert scheduler.stats()['rejected'] == 1
+    assert scheduler.queue_length() == 0
+
+
+def test_call_retries_rate_limits_only(clock):
+    scheduler = GenerationScheduler(requests_per_minute=600, base_delay_s=0, max_retries=3, burst_requests=10)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        return "answer"
+
+    assert scheduler.call(flaky, 10) == "answer"
+    assert scheduler.stats()['retries'] == 2
+
+    def broken():
+        raise RuntimeError("500 internal")
+
+    with pytest.raises(RuntimeError, match="500"):
+        scheduler.call(broken, 10)
+    assert scheduler.stats()['retries'] == 2
+
+
+def test_record_retry_counts_across_threads():
+    scheduler = GenerationScheduler()
+
+    def retry_many():
+        for _ in range(1000):
+            scheduler.record_retry()
+
+    threads = [threading.Thread(target=retry_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert scheduler.stats()['retries'] == 8000
@@ -0,0 +1,43 @@
+# tests/test_hnsw_params.py
+
+from hnsw_params import search_ef_warning, set_search_ef, stored_search_ef
+
+
+class FakeCollection:
+    """Records modify() calls like a chromadb >= 1.0 collection."""
+
+    def __init__(self, search_ef):
+        self.configuration = {"hnsw": {"ef_search": search_ef}}
+        self.metadata = {}
+        self.modified = []
+
+    def modify(self, configuration):
+        self.modified.append(configuration)
+        self.configuration = configuration
+
+
+def test_warning_never_writes_to_the_collection():
+    collection = FakeCollection(10)
+
+    assert "search_ef=10" in search_ef_warning(collection, 64)
+    assert search_ef_warning(collection, 10) is None
+    assert search_ef_warning(collection, None) is None
+    assert collection.modified == []
+
+
+def test_set_search_ef_leaves_matching_collection_untouched():
+    collection = FakeCollection(10)
+
+    assert set_search_ef(collection, 10)
+    assert collection.modified == []
+    assert set_search_ef(collection, 50)
+    assert stored_search_ef(collection) == 50
+    assert len(collection.modified) == 1
+
+
+def test_stored_search_ef_falls_back_to_metadata():
+    class OldCollection:
+        metadata = {"hnsw:search_ef": 7}
+
+    assert stored_search_ef(OldCollection()) == 7
+    assert not set_search_ef(OldCollection(), 20)
@@ -0,0 +1,125 @@
+# tests/test_ivf_pq.py
+
+import numpy as np
+import pytest
+
+from ivf_pq import (IVFPQCollection, create_ivfpq_index, export_ivfpq_index, sample_embeddings, train_ivfpq,
+                    update_ivfpq_index)
+
+
+def _build(path, n=3000, batch=400, dimension=32):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, dimension)).astype(np.float32)
+    centroids, codebooks = train_ivfpq(vectors[:1000], n_lists=20, m=8, iterations=5)
+    create_ivfpq_index(str(path), centroids, codebooks)
+    index = IVFPQCollection(str(path))
+    ids = [f"id{i}" for i in range(n)]
+    metadatas = [{'source': f"site{i % 3}.org", 'article_id': i % 40} for i in range(n)]
+    for start in range(0, n, batch):
+        index.add(ids[start:start + batch], vectors[start:start + batch],
+                  [f"doc {i}" for i in range(start, min(start + batch, n))], metadatas[start:start + batch])
+    return index, vectors
+
+
+def test_incremental_adds_keep_lists_sorted(tmp_path):
+    index, _ = _build(tmp_path)
+
+    reopened = IVFPQCollection(str(tmp_path))
+    assert np.array_equal(index._order, np.argsort(np.asarray(index._lists), kind='stable'))
+    assert np.array_equal(index._order, reopened._order)
+    assert np.array_equal(index._bounds, reopened._bounds)
+
+
+def test_query_and_get_read_records_by_offset(tmp_path):
+    index, vectors = _build(tmp_path)
+
+    results = index.query(query_embeddings=vectors[:1], n_results=3, where={'source': 'site0.org'})
+    assert results['ids'][0][0] == "id0"
+    assert results['documents'][0][0] == "doc 0"
+    assert all(metadata['source'] == 'site0.org' for metadata in results['metadatas'][0])
+
+    fetched = index.get(ids=["id7", "id2", "missing"])
+    assert fetched['ids'] == ["id2", "id7"]
+    assert fetched['documents'] == ["doc 2", "doc 7"]
+    assert index.count() == len(vectors)
+
+
+def test_interrupted_record_is_ignored(tmp_path):
+    index, _ = _build(tmp_path, n=500)
+    with open(tmp_path / 'records.jsonl', 'ab') as f:
+        f.write(b'{"id": "partial", "docu')
+
+    reopened = IVFPQCollection(str(tmp_path))
+    assert reopened.count() == 500
+    reopened.add(["late"], np.ones((1, 32), dtype=np.float32), ["late doc"])
+    assert reopened.get(ids=["late"])['documents'] == ["late doc"]
+    assert IVFPQCollection(str(tmp_path)).count() == 501
+
+
+def test_deleted_and_replaced_rows_are_not_returned(tmp_path):
+    index, vectors = _build(tmp_path, n=500)
+    index.delete(["id0", "missing"])
+    index.add(["id1"], vectors[1:2], ["doc 1 v2"], [{'source': 'new.org'}])
+
+    for collection in (index, IVFPQCollection(str(tmp_path))):
+        assert collection.count() == 499
+        assert collection.deleted_fraction() == pytest.approx(2 / 501)
+        results = collection.query(query_embeddings=vectors[:2], n_results=3)
+        assert "id0" not in results['ids'][0]
+        assert results['ids'][1].count("id1") == 1
+        assert collection.get(ids=["id0", "id1"])['documents'] == ["doc 1 v2"]
+        assert collection.query(query_embeddings=vectors[1:2], n_results=5,
+                                where={'source': 'site1.org'})['ids'][0].count("id1") == 0
+        assert len(collection.get()['ids']) == 499
+
+
+class SourceCollection:
+    """Just enough of a Chroma collection to export from and update with."""
+
+    name = 'chunks'
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.ids = [f"id{i}" for i in range(len(vectors))]
+        self.metadata = {'built_at': 'first'}
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, ids=None, include=(), limit=None, offset=0):
+        if ids is None:
+            positions = list(range(offset, min(offset + (limit or len(self.ids)), len(self.ids))))
+        else:
+            positions = [self.ids.index(chunk_id) for chunk_id in ids]
+        return {
+            'ids': [self.ids[i] for i in positions],
+            'embeddings': self.vectors[positions],
+            'documents': [f"doc {i}" for i in positions],
+            'metadatas': [{'article_id': i} for i in positions],
+        }
+
+
+def test_sample_is_drawn_from_the_whole_collection():
+    vectors = np.repeat(np.arange(1000, dtype=np.float32)[:, None], 4, axis=1)
+    sample = sample_embeddings(SourceCollection(vectors), 100, batch_size=64)
+
+    rows = sample[:, 0].astype(int)
+    assert len(set(rows.tolist())) == 100
+    assert rows.max() >= 900 and rows.min() < 100
+
+
+def test_update_adds_changes_without_retraining(tmp_path):
+    rng = np.random.default_rng(1)
+    source = SourceCollection(rng.normal(size=(1200, 16)).astype(np.float32))
+    export_ivfpq_index(source, str(tmp_path), n_lists=8, train_size=400, batch_size=256)
+    centroids = np.load(tmp_path / 'centroids.npy')
+
+    source.vectors = np.vstack([source.vectors, rng.normal(size=(1, 16)).astype(np.float32)])
+    source.ids.append("new")
+    source.metadata = {'built_at': 'second'}
+    index = update_ivfpq_index(source, str(tmp_path), ["new", "id5"], ["id7"])
+
+    assert np.array_equal(np.load(tmp_path / 'centroids.npy'), centroids)
+    assert index.count() == 1200
+    assert index.get(ids=["new", "id5", "id7"])['ids'] == ["id5", "new"]
+    assert IVFPQCollection(str(tmp_path)).metadata == {'built_at': 'second'}
@@ -0,0 +1,50 @@
+# tests/test_lexical_index.py
+
+import pytest
+
+import lexical_index
+from lexical_index import BM25Index, build_inverted_index, reciprocal_rank_fusion
+from vector_engine import stored_built_at
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    # Queries are tokenized like the indexed texts, without the NLTK cleaning pipeline
+    monkeypatch.setattr(lexical_index, 'tokenize_query', lambda text: str(text).lower().split())
+    build_inverted_index(
+        ['c0', 'c1', 'c2', 'c3'],
+        ["anxiety sleep", "sleep sleep hygiene", "panic attack anxiety anxiety", "diet exercise"],
+        str(tmp_path),
+        [{'source': 'a.org'}, {'source': 'b.org'}, {'source': 'b.org'}, {'source': 'a.org'}],
+    )
+    return BM25Index.load(str(tmp_path))
+
+
+def test_load_returns_none_without_index(tmp_path):
+    assert BM25Index.load(str(tmp_path)) is None
+
+
+def test_search_ranks_by_bm25(index):
+    results = index.search("anxiety", k=5)
+
+    assert [chunk_id for chunk_id, _ in results] == ['c2', 'c0']
+    assert results[0][1] > results[1][1] > 0
+    assert index.search("unknown words") == []
+
+
+def test_search_skips_filtered_documents(index):
+    assert {chunk_id for chunk_id, _ in index.search("anxiety sleep", where={'source': 'b.org'})} == {'c1', 'c2'}
+    assert [chunk_id for chunk_id, _ in index.search("anxiety", where={'source': 'a.org'})] == ['c0']
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'c', 'd']])
+
+    assert fused[:2] == ['b', 'c']
+    assert set(fused) == {'a', 'b', 'c', 'd'}
+
+
+def test_manifest_records_the_collection_build(tmp_path):
+    build_inverted_index(['c0'], ["sleep"], str(tmp_path), collection_metadata={'built_at': 'b1', 'other': 1})
+
+    assert stored_built_at(str(tmp_path)) == 'b1'
@@ -0,0 +1,85 @@
+# tests/test_reranker.py
+
+import pytest
+
+import reranker
+from reranker import CrossEncoderReranker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCrossEncoder:
+    """Scores a pair by the number in its document and advances the clock by ms_per_pair per pair."""
+
+    def __init__(self, clock, ms_per_pair=1.0):
+        self.clock = clock
+        self.ms_per_pair = ms_per_pair
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=32):
+        self.calls += 1
+        self.clock.now += self.ms_per_pair * len(pairs) / 1000
+        return [float(document.split()[-1]) if document[-1].isdigit() else 0.0 for _, document in pairs]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(reranker.time, 'perf_counter', clock)
+    return clock
+
+
+def _reranker(clock, **options):
+    model = FakeCrossEncoder(clock)
+    ranker = CrossEncoderReranker(latency_budget_ms=50, **options)
+    ranker._model = model
+    ranker.warm_up()
+    return ranker, model
+
+
+def _results(n=10):
+    return {'ids': [[f"c{i}" for i in range(n)]], 'documents': [[f"doc {i}" for i in range(n)]],
+            'metadatas': [[{} for _ in range(n)]]}
+
+
+def test_reorders_by_score_and_caches(clock):
+    ranker, model = _reranker(clock)
+
+    assert ranker.rerank("q", _results(), 3)['ids'] == [["c9", "c8", "c7"]]
+    calls = model.calls
+    assert ranker.rerank("Q ", _results(), 3)['ids'] == [["c9", "c8", "c7"]]
+    assert model.calls == calls
+    assert ranker.stats()['cache_hits'] == 10
+
+
+def test_time_spent_before_reranking_does_not_count(clock):
+    ranker, _ = _reranker(clock)
+    ranker.rerank("warm", _results(), 3)
+
+    # Slow retrieval before the stage starts
+    clock.now += 10
+    assert ranker.rerank("q", _results(), 3)['ids'] == [["c9", "c8", "c7"]]
+    assert ranker.skipped == 0
+
+
+def test_one_slow_batch_does_not_disable_reranking(clock):
+    ranker, model = _reranker(clock, reprobe_after_skips=3)
+    ranker.rerank("warm", _results(), 3)
+
+    model.ms_per_pair = 100.0 # one stall
+    ranker.rerank("stall", _results(), 3)
+    model.ms_per_pair = 1.0
+    skipped = [ranker.rerank(f"q{i}", _results(), 3)['ids'] == [["c0", "c1", "c2"]] for i in range(3)]
+    assert skipped == [True, True, True]
+
+    # The probe re-measures and reranking resumes
+    assert ranker.rerank("probe", _results(), 3)['ids'] == [["c9", "c8", "c7"]]
+    assert ranker.rerank("after", _results(), 3)['ids'] == [["c9", "c8", "c7"]]
+    assert ranker.stats()['skipped'] == 3
+    assert ranker.stats()['ms_per_pair'] == pytest.approx(1.0)
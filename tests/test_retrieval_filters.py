@@ -0,0 +1,62 @@
+# tests/test_retrieval_filters.py
+
+import numpy as np
+import pytest
+
+from retrieval_filters import MetadataBitmaps, build_where, parse_article_ids
+
+METADATAS = [
+    {'source': 'a.org', 'article_id': 1},
+    {'source': 'b.org', 'article_id': 2},
+    {'source': 'a.org', 'article_id': 3},
+    None,
+]
+
+
+def test_build_where_normalizes_and_combines_scopes():
+    assert build_where() is None
+    assert build_where(sources_allow=['https://www.A.org/']) == {'source': {'$in': ['a.org']}}
+    assert build_where(sources_deny=['b.org'], article_ids=['3', 1]) == {'$and': [
+        {'source': {'$nin': ['b.org']}},
+        {'article_id': {'$in': [1, 3]}},
+    ]}
+
+
+def test_mask_evaluates_operators():
+    bitmaps = MetadataBitmaps(METADATAS)
+
+    assert bitmaps.mask(None).tolist() == [True] * 4
+    assert bitmaps.mask({'source': 'a.org'}).tolist() == [True, False, True, False]
+    assert bitmaps.mask({'source': {'$ne': 'a.org'}}).tolist() == [False, True, False, True]
+    assert bitmaps.mask({'article_id': {'$in': [2, 3, 9]}}).tolist() == [False, True, True, False]
+    assert bitmaps.mask({'$or': [{'article_id': 1}, {'source': 'b.org'}]}).tolist() == [True, True, False, False]
+
+
+def test_mask_matches_build_where():
+    bitmaps = MetadataBitmaps(METADATAS)
+    where = build_where(sources_allow=['a.org'], article_ids=[3])
+
+    assert np.flatnonzero(bitmaps.mask(where)).tolist() == [2]
+
+
+def test_unsupported_operator_raises():
+    with pytest.raises(ValueError):
+        MetadataBitmaps(METADATAS).mask({'article_id': {'$gt': 1}})
+
+
+def test_many_distinct_values_cost_one_row_each():
+    n = 20000
+    bitmaps = MetadataBitmaps([{'article_id': i} for i in range(n)])
+
+    mask = bitmaps.mask(build_where(article_ids=[7, 19999, n + 1]))
+    assert np.flatnonzero(mask).tolist() == [7, 19999]
+    positions = bitmaps._positions_for('article_id')
+    assert len(positions) == n
+    assert sum(rows.nbytes for rows in positions.values()) == n * 4
+    assert (~bitmaps.mask({'article_id': {'$nin': [0, 1]}})).sum() == 2
+
+
+def test_parse_article_ids_reports_invalid_entries():
+    assert parse_article_ids("12, 40 7") == ([12, 40, 7], [])
+    assert parse_article_ids("3,abc,,") == ([3], ['abc'])
+    assert parse_article_ids(None) == ([], [])
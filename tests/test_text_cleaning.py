@@ -0,0 +1,62 @@
+# tests/test_text_cleaning.py
+
+import pytest
+
+import text_cleaning
+from text_cleaning import LemmaTable, advanced_clean_text
+
+
+class SuffixLemmatizer:
+    """Stands in for WordNet: strips a plural 's' and counts its calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def lemmatize(self, word):
+        self.calls += 1
+        return word[:-1] if word.endswith('s') else word
+
+
+@pytest.fixture
+def lemmatizer(monkeypatch):
+    lemmatizer = SuffixLemmatizer()
+    monkeypatch.setattr(text_cleaning, '_nltk_resources', lambda: (lemmatizer, {'the', 'and'}))
+    return lemmatizer
+
+
+def test_each_distinct_word_is_resolved_once(lemmatizer):
+    table = LemmaTable()
+
+    assert advanced_clean_text("The cats and the <b>dogs</b> and cats", table) == "cat dog cat"
+    assert lemmatizer.calls == 2
+    assert table.entries == {'the': '', 'and': '', 'cats': 'cat', 'dogs': 'dog'}
+    assert table.drain_added() == table.entries
+    assert table.drain_added() == {}
+
+
+def test_non_recording_table_does_not_grow(lemmatizer):
+    table = LemmaTable({'cats': 'cat'}, record_new=False)
+
+    assert advanced_clean_text("cats and birds", table) == "cat bird"
+    assert advanced_clean_text("birds", table) == "bird"
+    assert table.entries == {'cats': 'cat'}
+    assert table.added == {}
+
+
+def test_saved_table_round_trip(lemmatizer, tmp_path):
+    path = str(tmp_path / 'lemma_table.json')
+    table = LemmaTable()
+    advanced_clean_text("dogs and cats", table)
+    table.save(path)
+
+    loaded = LemmaTable.load(path, record_new=False)
+    assert loaded.entries == table.entries
+    assert not loaded.record_new
+
+
+def test_table_from_other_stop_words_is_ignored(lemmatizer, monkeypatch, tmp_path):
+    path = str(tmp_path / 'lemma_table.json')
+    LemmaTable({'cats': 'cat'}).save(path)
+    monkeypatch.setattr(text_cleaning, '_nltk_resources', lambda: (lemmatizer, {'a'}))
+
+    assert LemmaTable.load(path).entries == {}
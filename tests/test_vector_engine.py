@@ -0,0 +1,107 @@
+# tests/test_vector_engine.py
+
+import numpy as np
+import pytest
+
+from vector_engine import RESCORE_FILE, BruteForceCollection, export_vector_store, rescore_dtype, store_is_current
+
+
+class SourceCollection:
+    """Just enough of a Chroma collection for export_vector_store."""
+
+    name = 'chunks'
+    metadata = {'hnsw:space': 'cosine'}
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.ids = [f"id{i}" for i in range(len(vectors))]
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, include=(), limit=None, offset=0):
+        end = len(self.ids) if limit is None else offset + limit
+        positions = range(offset, min(end, len(self.ids)))
+        return {
+            'ids': [self.ids[i] for i in positions],
+            'embeddings': self.vectors[offset:end],
+            'documents': [f"doc {i}" for i in positions],
+            'metadatas': [{'source': f"site{i % 2}.org"} for i in positions],
+        }
+
+
+def _store(path, n=200, dimension=16, **options):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, dimension)).astype(np.float32)
+    export_vector_store(SourceCollection(vectors), str(path), batch_size=64, **options)
+    return BruteForceCollection(str(path)), vectors
+
+
+def test_float32_query_is_exact(tmp_path):
+    collection, vectors = _store(tmp_path)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ normalized[5]), kind='stable')[:5]
+
+    results = collection.query(query_embeddings=vectors[5:6], n_results=5)
+    assert results['ids'][0] == [f"id{i}" for i in expected]
+    assert results['distances'][0][0] == pytest.approx(0.0, abs=1e-5)
+    assert collection.name == 'chunks' and collection.count() == 200
+
+
+@pytest.mark.parametrize('dtype,rescore', [('float16', False), ('int8', False), ('int8', True), ('int8', 'float16')])
+def test_compressed_store_finds_the_query_row(tmp_path, dtype, rescore):
+    collection, vectors = _store(tmp_path, dtype=dtype, rescore=rescore)
+
+    results = collection.query(query_embeddings=vectors[:3], n_results=4)
+    assert [row[0] for row in results['ids']] == ["id0", "id1", "id2"]
+
+
+def test_get_by_id_and_position(tmp_path):
+    collection, _ = _store(tmp_path)
+
+    assert collection.get(ids=["id3", "id1", "missing"])['ids'] == ["id1", "id3"]
+    page = collection.get(limit=2, offset=10)
+    assert page['ids'] == ["id10", "id11"]
+    assert page['documents'] == ["doc 10", "doc 11"]
+
+
+def test_where_restricts_query_and_get(tmp_path):
+    collection, vectors = _store(tmp_path)
+
+    results = collection.query(query_embeddings=vectors[:1], n_results=10, where={'source': 'site1.org'})
+    assert all(metadata['source'] == 'site1.org' for metadata in results['metadatas'][0])
+    assert len(results['ids'][0]) == 10
+
+    fetched = collection.get(ids=["id1", "id2", "id3"], where={'source': 'site1.org'})
+    assert fetched['ids'] == ["id1", "id3"]
+    assert collection.query(query_embeddings=vectors[:1], where={'source': 'none.org'})['ids'] == [[]]
+
+
+def test_store_is_current_checks_build_and_settings(tmp_path):
+    source = SourceCollection(np.ones((4, 8), dtype=np.float32))
+    source.metadata = {'built_at': 'b1'}
+    export_vector_store(source, str(tmp_path), dtype='int8', rescore=True)
+
+    assert store_is_current(str(tmp_path), 'b1', 'int8', True)
+    assert not store_is_current(str(tmp_path), 'b2', 'int8', True)
+    assert not store_is_current(str(tmp_path), 'b1', 'float16', True)
+    assert not store_is_current(str(tmp_path / 'missing'), 'b1', 'int8', True)
+
+
+def test_float16_rescore_copy_keeps_the_store_smaller_than_float32(tmp_path):
+    _store(tmp_path / 'exact')
+    _store(tmp_path / 'int8', dtype='int8', rescore='float16')
+
+    assert np.load(tmp_path / 'int8' / RESCORE_FILE, mmap_mode='r').dtype == np.float16
+    sizes = {name: sum(f.stat().st_size for f in (tmp_path / name).glob('*.npy')) for name in ('exact', 'int8')}
+    assert sizes['int8'] < sizes['exact']
+
+
+def test_rescore_dtype_only_keeps_a_more_precise_copy():
+    assert rescore_dtype('int8', True) == 'float32'
+    assert rescore_dtype('int8', 'float16') == 'float16'
+    assert rescore_dtype('float16', 'float16') is None
+    assert rescore_dtype('float32', True) is None
+    assert rescore_dtype('int8', False) is None
+    with pytest.raises(ValueError):
+        rescore_dtype('int8', 'int8')
@@ -0,0 +1,163 @@
+# text_cleaning.py
+
+"""
+Text normalization shared by the cleaning pipeline and the query path.
+
+data_processing/clean_data.py cleans article bodies with advanced_clean_text;
+the lexical (BM25) index is built from that output, so queries must go through
+the same steps to match its vocabulary.
+
+Lemmatization goes through a LemmaTable: one dict lookup per token gives its
+lemma, or '' for a stop word, so WordNet is only consulted once per distinct
+word instead of once per occurrence. The table is persisted to
+LEMMA_TABLE_PATH and reused across runs; clean_data.py starts each worker
+process from a copy of it and merges back the words the workers added.
+
+The query path (tokenize_query) uses the saved table without recording new
+words: unseen query words are lemmatized per call and then forgotten, so a
+long-running app or retrieval service does not grow the table.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+from collections import ChainMap
+
+# --- Configuration ---
+LEMMA_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lemma_table.json')
+
+_TAG_RE = re.compile(r'<.*?>')
+_NON_ASCII_RE = re.compile(r'[^\x00-\x7F]+')
+_WORD_RE = re.compile(r'\b\w+\b')
+
+_lemmatizer = None
+_stop_words = None
+_table = None
+
+
+def _nltk_resources():
+    """Loads the WordNet lemmatizer and English stop words once per process."""
+    global _lemmatizer, _stop_words
+    if _lemmatizer is None:
+        from nltk.corpus import stopwords
+        from nltk.stem import WordNetLemmatizer
+
+        _lemmatizer = WordNetLemmatizer()
+        _stop_words = set(stopwords.words('english'))
+    return _lemmatizer, _stop_words
+
+
+def _stop_words_fingerprint(stop_words) -> str:
+    return hashlib.blake2b("\n".join(sorted(stop_words)).encode('utf-8'), digest_size=8).hexdigest()
+
+
+class LemmaTable:
+    """
+    word -> lemma, with '' marking stop words; words missing from it are
+    resolved on demand. With record_new=False they are not added, so the
+    table stays the size it was loaded at.
+    """
+
+    def __init__(self, entries: dict = None, record_new: bool = True):
+        self.entries = dict(entries or {})
+        self.record_new = record_new
+        self.added = {}
+
+    @classmethod
+    def load(cls, path: str = LEMMA_TABLE_PATH, record_new: bool = True):
+        """The saved table, or an empty one if there is none or it was built with other stop words."""
+        _, stop_words = _nltk_resources()
+        try:
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls(record_new=record_new)
+        if saved.get('stop_words') != _stop_words_fingerprint(stop_words):
+            return cls(record_new=record_new)
+        return cls(saved.get('entries'), record_new)
+
+    def save(self, path: str = LEMMA_TABLE_PATH):
+        _, stop_words = _nltk_resources()
+        partial = path + '.partial'
+        with open(partial, 'w', encoding='utf-8') as f:
+            json.dump({'stop_words': _stop_words_fingerprint(stop_words), 'entries': self.entries}, f)
+        os.replace(partial, path)
+        self.added = {}
+
+    def resolve(self, words) -> dict:
+        """
+        Looks up words not in the table yet (stop word check fused with
+        lemmatization) and returns them; they are added when record_new is set.
+        """
+        lemmatizer, stop_words = _nltk_resources()
+        resolved = {word: '' if word in stop_words else lemmatizer.lemmatize(word) for word in words}
+        if self.record_new:
+            self.entries.update(resolved)
+            self.added.update(resolved)
+        return resolved
+
+    def merge(self, entries: dict):
+        """Adds words resolved elsewhere (e.g. by a worker process)."""
+        self.entries.update(entries)
+        self.added.update(entries)
+
+    def drain_added(self) -> dict:
+        """Returns and forgets the words resolved since the last call."""
+        added, self.added = self.added, {}
+        return added
+
+
+def get_lemma_table() -> LemmaTable:
+    """
+    This process's table. Loaded from LEMMA_TABLE_PATH on first use without
+    recording new words; the cleaning pipeline installs a recording table
+    with set_lemma_table().
+    """
+    global _table
+    if _table is None:
+        _table = LemmaTable.load(record_new=False)
+    return _table
+
+
+def set_lemma_table(table: LemmaTable):
+    global _table
+    _table = table
+
+
+def advanced_clean_text(text, table: LemmaTable = None):
+    if text is None or (isinstance(text, float) and math.isnan(text)):
+        return ""
+    lemmas = table or get_lemma_table()
+    text = str(text).lower()
+
+    # 1. Remove HTML tags, Unicode characters, and any other artifacts
+    text = _TAG_RE.sub('', text)
+    text = _NON_ASCII_RE.sub(' ', text)
+
+    # 2. Tokenization: Split text into words
+    words = _WORD_RE.findall(text)
+
+    # 3. Lemmatization and Stop Word Removal: each distinct new word is resolved once
+    lookup = lemmas.entries
+    missing = set(words).difference(lookup)
+    if missing:
+        resolved = lemmas.resolve(missing)
+        if not lemmas.record_new:
+            lookup = ChainMap(resolved, lookup)
+
+    # Rejoin cleaned words (stop words map to '') into a single string
+    return " ".join(filter(None, map(lookup.__getitem__, words)))
+
+
+def tokenize_query(text: str) -> list:
+    """
+    Cleans a user question into index tokens. Falls back to plain lowercase
+    tokens when the NLTK corpora are not installed (e.g. on Streamlit Cloud);
+    stop words then simply find no postings.
+    """
+    try:
+        return advanced_clean_text(text).split()
+    except (ImportError, LookupError):
+        return _WORD_RE.findall(str(text).lower())
@@ -0,0 +1,164 @@
+# tracing.py
+
+"""
+Per-stage latency tracing for the RAG request path.
+
+A Tracer hands out one RequestTrace per question. Stages are timed with
+trace.span("embed"), trace.span("search"), ... or recorded directly with
+trace.record(); finishing the trace appends one JSONL record per request and
+feeds rolling p50/p95 windows for the sidebar.
+
+With tracing off, Tracer.start() returns NULL_TRACE, whose methods do nothing
+and whose span() hands back one shared no-op context manager, so the
+instrumented code pays only a method call per stage.
+
+    tracer = Tracer("traces.jsonl")
+    trace = tracer.start(backend="chroma")
+    with trace.span("search"):
+        results = collection.query(...)
+    tracer.finish(trace)
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# --- Configuration ---
+WINDOW_SIZE = 500 # requests kept for the rolling percentiles
+
+# Pipeline order, used to lay out summaries; unknown spans are listed after these
+STAGES = ("embed", "search", "rerank", "pack", "queue", "ttft", "generation", "render")
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTrace:
+    """Stand-in for RequestTrace when tracing is off."""
+
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, name: str):
+        return self._span
+
+    def record(self, name: str, seconds):
+        pass
+
+    def annotate(self, **meta):
+        pass
+
+    def untimed(self, name: str, iterable):
+        return iterable
+
+
+NULL_TRACE = _NullTrace()
+
+
+class RequestTrace:
+    """Stage durations (seconds) and metadata for one request."""
+
+    enabled = True
+
+    def __init__(self, **meta):
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.spans = {}
+        self.meta = dict(meta)
+        self._excluded = defaultdict(float)
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.record(name, time.perf_counter() - start - self._excluded.pop(name, 0.0))
+
+    def record(self, name: str, seconds):
+        """Adds seconds to the named stage; None (stage did not happen) is ignored."""
+        if seconds is not None:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def annotate(self, **meta):
+        self.meta.update(meta)
+
+    def untimed(self, name: str, iterable):
+        """
+        Wraps an iterable consumed inside span(name) so the time spent waiting
+        on it is not charged to that span (e.g. rendering a streamed answer
+        without counting the wait for the model).
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._excluded[name] += time.perf_counter() - start
+                return
+            self._excluded[name] += time.perf_counter() - start
+            yield item
+
+    def as_record(self) -> dict:
+        return {
+            "ts": self.started_at,
+            "total_s": time.perf_counter() - self._started,
+            "spans": self.spans,
+            **self.meta,
+        }
+
+
+def percentile(sorted_values, q: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Tracer:
+    """Creates request traces, appends them to a JSONL file and keeps rolling percentiles."""
+
+    def __init__(self, path: str = None, enabled: bool = True, window: int = WINDOW_SIZE):
+        self.path = path
+        self.enabled = enabled
+        self._windows = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def start(self, **meta):
+        return RequestTrace(**meta) if self.enabled else NULL_TRACE
+
+    def finish(self, trace) -> dict:
+        """Closes a trace; returns its record (None when tracing is off)."""
+        if not trace.enabled:
+            return None
+        record = trace.as_record()
+        line = json.dumps(record, default=str)
+        with self._lock:
+            for name, seconds in record["spans"].items():
+                self._windows[name].append(seconds)
+            self._windows["total"].append(record["total_s"])
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        return record
+
+    def summary(self) -> dict:
+        """{stage: {"p50": s, "p95": s, "n": count}} over the rolling window, in pipeline order."""
+        with self._lock:
+            windows = {name: sorted(values) for name, values in self._windows.items()}
+        order = [s for s in STAGES if s in windows] + sorted(set(windows) - set(STAGES) - {"total"})
+        if "total" in windows:
+            order.append("total")
+        return {
+            name: {"p50": percentile(windows[name], 50), "p95": percentile(windows[name], 95), "n": len(windows[name])}
+            for name in order
+        }
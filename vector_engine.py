@@ -0,0 +1,370 @@
+# vector_engine.py
+
+"""
+Exact brute-force vector search with NumPy.
+
+For corpora up to the tens of thousands of chunks, one matrix-vector product
+over a contiguous matrix of normalized embeddings is faster to open and to
+query than Chroma's HNSW index plus SQLite. BruteForceCollection exposes the
+subset of the Chroma Collection API the app uses (query, get, count, name,
+metadata), so it can be swapped in behind the same call sites.
+
+Distances are computed in float32 exactly as the "cosine" space configured by
+embed_and_store: distance = 1 - dot(a / |a|, b / |b|).
+
+The matrix can be stored compressed: float16 halves it, int8 (symmetric
+scalar quantization with one float32 scale per row) quarters it. With a
+rescore file, the compressed matrix only shortlists RESCORE_FACTOR * k
+candidates and their rows in the rescore copy, read from a memory map,
+decide the final order and distances, which recovers almost all of the
+recall lost to quantization while only the compressed matrix is scanned (and
+kept hot). The rescore copy is on disk too: a float32 copy makes an int8
+store larger than a plain float32 one (1.25x), a float16 copy keeps it at
+0.75x with nearly the same recall, so float16 is the one to ship.
+
+The rows are packed into one matrix in collection order, with parallel
+arrays in records.json, so removing a chunk means rewriting both; the store
+is re-exported whole, and embed_and_store only does so when the collection
+changed (see store_is_current).
+
+On-disk layout (written by export_vector_store / write_vector_store):
+    <path>/embeddings.npy   float32, float16 or int8 matrix, one normalized row per chunk
+    <path>/scales.npy       int8 only: float32 scale of each row (row ~= int8 row * scale)
+    <path>/rescore.npy      optional float16 or float32 copy used to rescore the shortlist
+    <path>/records.json     parallel arrays of ids, documents and metadatas
+    <path>/manifest.json    dimension, count, dtype and the source collection's metadata
+"""
+
+import json
+import os
+
+import numpy as np
+
+from retrieval_filters import MetadataBitmaps
+
+# --- Configuration ---
+EMBEDDINGS_FILE = 'embeddings.npy'
+SCALES_FILE = 'scales.npy'
+RESCORE_FILE = 'rescore.npy'
+RECORDS_FILE = 'records.json'
+MANIFEST_FILE = 'manifest.json'
+BLOCK_ROWS = 16384 # float16 / int8 matrices are upcast to float32 in blocks of this many rows
+RESCORE_FACTOR = 4 # shortlist size, as a multiple of n_results, rescored from the rescore copy
+DTYPES = ('float32', 'float16', 'int8')
+RESCORE_DTYPES = ('float32', 'float16')
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Returns float32 copies of the vectors scaled to unit length."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def rescore_dtype(dtype: str, rescore):
+    """
+    dtype of the rescore copy a store of dtype gets: rescore is False / None
+    (no copy), True (float32) or one of RESCORE_DTYPES. None when there is no
+    copy or it would be no more precise than the matrix itself.
+    """
+    if not rescore:
+        return None
+    rescore = 'float32' if rescore is True else rescore
+    if rescore not in RESCORE_DTYPES:
+        raise ValueError(f"Unsupported rescore dtype '{rescore}', expected one of {RESCORE_DTYPES}")
+    return rescore if np.dtype(rescore).itemsize > np.dtype(dtype).itemsize else None
+
+
+def quantize_rows(rows: np.ndarray, dtype: str):
+    """
+    Converts normalized float32 rows to the storage dtype. Returns (stored rows,
+    per-row float32 scales), scales being None except for int8.
+    """
+    if dtype == 'int8':
+        scales = np.abs(rows).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.rint(rows / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return rows.astype(dtype), None
+
+
+class _MatrixWriter:
+    """Writes the (possibly quantized) matrix files of a store batch by batch, then renames them into place."""
+
+    def __init__(self, path: str, total: int, dimension: int, dtype: str, rescore):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector store dtype '{dtype}', expected one of {DTYPES}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.files = {EMBEDDINGS_FILE: np.lib.format.open_memmap(
+            os.path.join(path, EMBEDDINGS_FILE + '.tmp'), mode='w+', dtype=np.dtype(dtype), shape=(total, dimension)
+        )}
+        if dtype == 'int8':
+            self.files[SCALES_FILE] = np.lib.format.open_memmap(
+                os.path.join(path, SCALES_FILE + '.tmp'), mode='w+', dtype=np.float32, shape=(total,))
+        if rescore_dtype(dtype, rescore):
+            self.files[RESCORE_FILE] = np.lib.format.open_memmap(
+                os.path.join(path, RESCORE_FILE + '.tmp'), mode='w+', dtype=np.dtype(rescore_dtype(dtype, rescore)),
+                shape=(total, dimension))
+        self.dtype = dtype
+
+    def write(self, offset: int, rows: np.ndarray):
+        stored, scales = quantize_rows(rows, self.dtype)
+        self.files[EMBEDDINGS_FILE][offset:offset + len(rows)] = stored
+        if scales is not None:
+            self.files[SCALES_FILE][offset:offset + len(rows)] = scales
+        if RESCORE_FILE in self.files:
+            self.files[RESCORE_FILE][offset:offset + len(rows)] = rows.astype(self.files[RESCORE_FILE].dtype)
+
+    def close(self):
+        for name, matrix in self.files.items():
+            matrix.flush()
+        names = list(self.files)
+        self.files.clear()
+        for name in (SCALES_FILE, RESCORE_FILE):
+            # Drop sidecars left over from an earlier build with other settings
+            if name not in names and os.path.exists(os.path.join(self.path, name)):
+                os.remove(os.path.join(self.path, name))
+        for name in names:
+            os.replace(os.path.join(self.path, name + '.tmp'), os.path.join(self.path, name))
+
+
+def _write_records(path: str, name: str, metadata: dict, dtype: str, rescore, ids, documents, metadatas):
+    with open(os.path.join(path, RECORDS_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'ids': ids, 'documents': documents, 'metadatas': metadatas}, f)
+    with open(os.path.join(path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'name': name,
+            'count': len(ids),
+            'dtype': dtype,
+            'rescore': rescore_dtype(dtype, rescore),
+            'metadata': dict(metadata or {}),
+        }, f, indent=2)
+
+
+def export_vector_store(collection, path: str, dtype: str = 'float32', batch_size: int = 5000,
+                        rescore=False):
+    """
+    Copies the embeddings, documents and metadatas of a Chroma collection into
+    a brute-force vector store at path, stored as dtype ('float32', 'float16'
+    or 'int8'). rescore keeps a copy for rescoring the shortlist (see
+    rescore_dtype).
+    """
+    total = collection.count()
+    writer = _MatrixWriter(path, total, _dimension(collection) if total else 0, dtype, rescore)
+
+    ids, documents, metadatas = [], [], []
+    for offset in range(0, total, batch_size):
+        batch = collection.get(
+            include=['embeddings', 'documents', 'metadatas'],
+            limit=batch_size,
+            offset=offset
+        )
+        writer.write(offset, normalize_rows(batch['embeddings']))
+        ids.extend(batch['ids'])
+        documents.extend(batch['documents'])
+        metadatas.extend(batch['metadatas'])
+    writer.close()
+
+    _write_records(path, collection.name, collection.metadata, dtype, rescore, ids, documents, metadatas)
+    return total
+
+
+def write_vector_store(path: str, ids, embeddings, documents=None, metadatas=None, name: str = 'vectors',
+                       metadata: dict = None, dtype: str = 'float32', rescore=False):
+    """Writes a vector store from in-memory arrays (used by the benchmarks)."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    writer = _MatrixWriter(path, len(ids), embeddings.shape[1], dtype, rescore)
+    for offset in range(0, len(ids), BLOCK_ROWS):
+        writer.write(offset, normalize_rows(embeddings[offset:offset + BLOCK_ROWS]))
+    writer.close()
+    _write_records(path, name, metadata, dtype, rescore, [str(i) for i in ids],
+                   documents if documents is not None else [""] * len(ids),
+                   metadatas if metadatas is not None else [{} for _ in ids])
+    return len(ids)
+
+
+def read_manifest(path: str):
+    """The manifest of the store or index at path, or None when there is no readable one."""
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def stored_built_at(path: str):
+    """
+    The 'built_at' stamp of the collection the store or index at path (NumPy,
+    IVF-PQ or BM25) was built from, or None when it is unknown.
+    """
+    return ((read_manifest(path) or {}).get('metadata') or {}).get('built_at')
+
+
+def store_is_current(path: str, built_at, dtype: str, rescore) -> bool:
+    """Whether the store at path was exported from this build of the collection with these settings."""
+    manifest = read_manifest(path)
+    return (manifest is not None and built_at is not None
+            and (manifest.get('metadata') or {}).get('built_at') == built_at
+            and manifest.get('dtype') == dtype
+            and manifest.get('rescore') == rescore_dtype(dtype, rescore))
+
+
+def _dimension(collection) -> int:
+    sample = collection.get(include=['embeddings'], limit=1)
+    return len(sample['embeddings'][0])
+
+
+class BruteForceCollection:
+    """Read-only, memory-mapped collection with exact cosine top-k search."""
+
+    def __init__(self, path: str, embedding_function=None):
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+        with open(os.path.join(path, RECORDS_FILE), encoding='utf-8') as f:
+            records = json.load(f)
+
+        self.path = path
+        self.name = manifest['name']
+        self.metadata = manifest.get('metadata', {})
+        self._matrix = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode='r')
+        self._scales = self._load_optional(SCALES_FILE)
+        self._rescore = self._load_optional(RESCORE_FILE)
+        self._ids = records['ids']
+        self._documents = records['documents']
+        self._metadatas = records['metadatas']
+        self._bitmaps = MetadataBitmaps(self._metadatas)
+        self._embedding_function = embedding_function
+
+    @property
+    def embedding_function(self):
+        if self._embedding_function is None:
+            # Same default encoder embed_and_store indexes with (see embedding_backends.py)
+            from embedding_backends import create_encoder
+            self._embedding_function = create_encoder()
+        return self._embedding_function
+
+    def _load_optional(self, name: str):
+        file_path = os.path.join(self.path, name)
+        return np.load(file_path, mmap_mode='r') if os.path.exists(file_path) else None
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def _rows_float32(self, positions) -> np.ndarray:
+        """Most precise float32 rows: the rescore copy when there is one, else the dequantized matrix."""
+        if self._rescore is not None:
+            return np.asarray(self._rescore[positions], dtype=np.float32)
+        block = np.asarray(self._matrix[positions], dtype=np.float32)
+        if self._scales is not None:
+            block *= self._scales[positions][:, None]
+        return block
+
+    def _scores(self, queries: np.ndarray, rows=None) -> np.ndarray:
+        """
+        Cosine similarities of each query against the stored rows (all rows, or
+        only the given row numbers), shape (n_queries, n_rows).
+        """
+        n_rows = len(self._ids) if rows is None else len(rows)
+        if self._matrix.dtype == np.float32 and rows is None:
+            return queries @ self._matrix.T
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        for start in range(0, n_rows, BLOCK_ROWS):
+            if rows is None:
+                block = self._matrix[start:start + BLOCK_ROWS]
+            else:
+                block = self._matrix[rows[start:start + BLOCK_ROWS]]
+            block = np.asarray(block, dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if self._scales is not None:
+            # int8 rows are stored divided by their scale
+            scores *= self._scales if rows is None else self._scales[rows]
+        return scores
+
+    def _rescore_shortlist(self, queries: np.ndarray, shortlist: np.ndarray, k: int):
+        """Scores of each query's shortlisted rows from the rescore copy; returns (top k row numbers, their scores)."""
+        top = np.empty((len(queries), k), dtype=np.int64)
+        top_scores = np.empty((len(queries), k), dtype=np.float32)
+        for i, (query, candidates) in enumerate(zip(queries, shortlist)):
+            candidates = np.sort(candidates) # ascending reads from the memory map
+            exact = self._rows_float32(candidates) @ query
+            order = np.argsort(-exact, kind='stable')[:k]
+            top[i] = candidates[order]
+            top_scores[i] = exact[order]
+        return top, top_scores
+
+    def _top_k(self, scores: np.ndarray, k: int):
+        """Indices of the k highest scores per row, best first, via argpartition."""
+        if k >= scores.shape[1]:
+            return np.argsort(-scores, axis=1, kind='stable')
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(part, order, axis=1)
+
+    def query(self, query_texts=None, query_embeddings=None, n_results: int = 10,
+              include=('metadatas', 'documents', 'distances'), where=None):
+        """
+        Exact top-k search, returning results in Chroma's query() format. A
+        'where' clause restricts scoring to the rows selected by the metadata
+        bitmaps.
+        """
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts))
+        queries = normalize_rows(query_embeddings)
+
+        rows = None
+        if where:
+            rows = np.flatnonzero(self._bitmaps.mask(where))
+
+        k = min(n_results, self.count() if rows is None else len(rows))
+        results = {'ids': [], 'documents': None, 'metadatas': None, 'distances': None,
+                   'embeddings': None, 'included': list(include)}
+        if k == 0:
+            results['ids'] = [[] for _ in queries]
+            for key in ('documents', 'metadatas', 'distances'):
+                if key in include:
+                    results[key] = [[] for _ in queries]
+            return results
+
+        scores = self._scores(queries, rows)
+        if self._rescore is not None:
+            # The compressed matrix shortlists; the rescore copy decides the order
+            shortlist = self._top_k(scores, min(k * RESCORE_FACTOR, scores.shape[1]))
+            if rows is not None:
+                shortlist = rows[shortlist]
+            top, top_scores = self._rescore_shortlist(queries, shortlist, k)
+            distances = 1.0 - top_scores
+        else:
+            top = self._top_k(scores, k)
+            distances = 1.0 - np.take_along_axis(scores, top, axis=1)
+            if rows is not None:
+                top = rows[top]
+
+        results['ids'] = [[self._ids[i] for i in row] for row in top]
+        if 'documents' in include:
+            results['documents'] = [[self._documents[i] for i in row] for row in top]
+        if 'metadatas' in include:
+            results['metadatas'] = [[self._metadatas[i] for i in row] for row in top]
+        if 'distances' in include:
+            results['distances'] = distances.tolist()
+        return results
+
+    def get(self, ids=None, include=('metadatas', 'documents'), limit=None, offset=0, where=None):
+        """Fetches stored records by id or by position, in Chroma's get() format."""
+        if ids is not None:
+            wanted = set(ids)
+            positions = [i for i, chunk_id in enumerate(self._ids) if chunk_id in wanted]
+        else:
+            end = None if limit is None else offset + limit
+            positions = list(range(len(self._ids)))[offset:end]
+        if where:
+            mask = self._bitmaps.mask(where)
+            positions = [i for i in positions if mask[i]]
+
+        return {
+            'ids': [self._ids[i] for i in positions],
+            'documents': [self._documents[i] for i in positions] if 'documents' in include else None,
+            'metadatas': [self._metadatas[i] for i in positions] if 'metadatas' in include else None,
+            'embeddings': self._rows_float32(positions) if 'embeddings' in include else None,
+            'included': list(include),
+        }
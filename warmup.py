@@ -0,0 +1,79 @@
+# warmup.py
+
+"""
+Cold-start helpers for the Streamlit app.
+
+The app paints its page before loading anything heavy, then a
+BackgroundWarmup thread loads the rest (the Gemini SDK, the embedding model,
+the HNSW index) while the user is still reading or typing, so the first
+question does not pay for it.
+
+prefault() pulls index files into the OS page cache with sequential reads,
+so when Chroma loads the HNSW graph (data_level0.bin / link_lists.bin) it
+reads from memory instead of a cold disk.
+
+Phase timings are recorded in a tracing.RequestTrace, so the start-up
+breakdown can be shown next to the per-request traces.
+"""
+
+import glob
+import os
+import threading
+
+# --- Configuration ---
+HNSW_FILES = ('data_level0.bin', 'link_lists.bin', 'header.bin', 'length.bin')
+READ_CHUNK_BYTES = 1 << 20
+
+
+def hnsw_index_files(chroma_path: str) -> list:
+    """HNSW segment files of every collection under a Chroma persist directory."""
+    return sorted(
+        path for name in HNSW_FILES for path in glob.glob(os.path.join(chroma_path, '*', name))
+    )
+
+
+def prefault(paths) -> int:
+    """Reads files once so their pages are resident in the page cache; returns bytes read."""
+    total = 0
+    buffer = bytearray(READ_CHUNK_BYTES)
+    for path in paths:
+        try:
+            with open(path, 'rb', buffering=0) as f:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                while True:
+                    n = f.readinto(buffer)
+                    if not n:
+                        break
+                    total += n
+        except OSError:
+            # A missing or unreadable file only means that part stays cold
+            continue
+    return total
+
+
+class BackgroundWarmup:
+    """Runs named warm-up steps on a daemon thread, timing each into a trace."""
+
+    def __init__(self, trace, steps):
+        self.trace = trace
+        self.steps = list(steps)
+        self.errors = {}
+        self.done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for name, step in self.steps:
+                try:
+                    with self.trace.span(name):
+                        step()
+                except Exception as e:
+                    # Warm-up is best effort; the first query loads whatever is still cold
+                    self.errors[name] = str(e)
+        finally:
+            self.done.set()